@@ -0,0 +1,126 @@
+# bench_db_latency.py
+# Latencia de los handlers del bot mientras el scheduler escribe en la BD.
+#
+# Compara dos modos sobre la misma BD SQLite temporal:
+#   sync  -> llamadas directas a la BD desde el event loop (como antes)
+#   async -> las mismas llamadas a través de db.run (hilo de BD)
+#
+# La carga de "scraping" encola items en el outbox, consulta seen_items y
+# guarda el plan sin parar. En paralelo se mide:
+#   - handler: de la llegada programada de la petición (cada 50 ms) a la
+#     respuesta de /mis_busquedas + toggle, incluida la espera por el loop
+#   - lag: retraso del event loop sobre un tick de 10 ms (bloqueo de polling)
+#
+#   python bench/bench_db_latency.py [--users 200] [--searches 5] [--seconds 10] [--batch 200]
+import os, sys, time, json, random, asyncio, argparse, tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+_tmp = tempfile.mkdtemp(prefix="bench_db_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'bench.db')}"
+
+import db
+
+
+def _seed(users: int, per_user: int) -> None:
+    db.init_db()
+    for uid in range(1, users + 1):
+        db.set_user_active(uid, f"user{uid}", True)
+        for j in range(per_user):
+            db.save_search(uid, f"user{uid}", f"busqueda {j}", {"max": 100.0 + j, "strict": True})
+
+
+def _pct(samples, q):
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(len(s) * q))] * 1000 if s else 0.0
+
+
+async def _call(mode: str, fn, *args):
+    if mode == "async":
+        return await db.run(fn, *args)
+    return fn(*args)
+
+
+async def _scrape_load(mode: str, users: int, batch: int, stop: asyncio.Event, counter: dict) -> None:
+    rnd = random.Random(1)
+    n = 0
+    while not stop.is_set():
+        rows = []
+        for _ in range(batch):
+            n += 1
+            uid = rnd.randint(1, users)
+            rows.append({"chat_id": uid, "search_id": uid, "item_id": f"{mode}-item-{n}",
+                         "payload": json.dumps({"query": "x", "title": f"item {n}", "price": 1.0,
+                                                "url": "https://es.wallapop.com/item/x", "shipping": False})})
+        await _call(mode, db.seen_known, rows[0]["search_id"], [r["item_id"] for r in rows])
+        await _call(mode, db.outbox_enqueue, rows)
+        await _call(mode, db.save_poll_state, [(uid, 30.0, time.time() + 30) for uid in range(1, 50)])
+        counter["writes"] += 1
+        await asyncio.sleep(0)
+
+
+async def _handlers(mode: str, users: int, stop: asyncio.Event, samples: list) -> None:
+    rnd = random.Random(2)
+    arrival = time.perf_counter()
+    while not stop.is_set():
+        arrival += 0.05
+        await asyncio.sleep(max(0.0, arrival - time.perf_counter()))
+        uid = rnd.randint(1, users)
+        searches = await _call(mode, db.list_searches, uid)
+        if searches:
+            await _call(mode, db.toggle_search, searches[0].id, uid)
+        samples.append(time.perf_counter() - arrival)
+
+
+async def _ticker(stop: asyncio.Event, lags: list) -> None:
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(0.01)
+        lags.append(max(0.0, time.perf_counter() - t0 - 0.01))
+
+
+async def _run(mode: str, args) -> dict:
+    stop = asyncio.Event()
+    samples, lags, counter = [], [], {"writes": 0}
+    tasks = [
+        asyncio.create_task(_scrape_load(mode, args.users, args.batch, stop, counter)),
+        asyncio.create_task(_handlers(mode, args.users, stop, samples)),
+        asyncio.create_task(_ticker(stop, lags)),
+    ]
+    await asyncio.sleep(args.seconds)
+    stop.set()
+    await asyncio.gather(*tasks)
+    return {
+        "mode": mode,
+        "handler_calls": len(samples),
+        "handler_ms_p50": round(_pct(samples, 0.5), 1),
+        "handler_ms_p95": round(_pct(samples, 0.95), 1),
+        "handler_ms_p99": round(_pct(samples, 0.99), 1),
+        "loop_lag_ms_p50": round(_pct(lags, 0.5), 1),
+        "loop_lag_ms_p99": round(_pct(lags, 0.99), 1),
+        "loop_lag_ms_max": round(max(lags, default=0.0) * 1000, 1),
+        "scrape_batches": counter["writes"],
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=200)
+    ap.add_argument("--searches", type=int, default=5, help="búsquedas por usuario")
+    ap.add_argument("--seconds", type=float, default=10)
+    ap.add_argument("--batch", type=int, default=200, help="items por escritura de outbox")
+    args = ap.parse_args()
+
+    print(f"BD temporal: {db.DATABASE_URL}")
+    _seed(args.users, args.searches)
+    results = [asyncio.run(_run(mode, args)) for mode in ("sync", "async")]
+
+    for r in results:
+        print(f"{r['mode']:<6} handler p50 {r['handler_ms_p50']:7.1f} ms · p95 {r['handler_ms_p95']:7.1f} ms · "
+              f"p99 {r['handler_ms_p99']:7.1f} ms ({r['handler_calls']} llamadas) | "
+              f"lag loop p50 {r['loop_lag_ms_p50']:6.1f} ms · p99 {r['loop_lag_ms_p99']:6.1f} ms · "
+              f"máx {r['loop_lag_ms_max']:6.1f} ms | {r['scrape_batches']} lotes de scraping")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# bench_extract.py
+# Microbenchmark: extracción de tarjetas con un único page.evaluate frente a
+# la ruta antigua (varias consultas CDP por tarjeta) sobre un HTML guardado.
+#
+#   python bench/bench_extract.py [--runs 20] [--fixture bench/fixtures/search_page.html]
+import os, sys, time, asyncio, argparse, statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from playwright.async_api import async_playwright
+from wallapop import _extract_cards, _extract_cards_dom
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "search_page.html")
+
+
+async def _time_path(page, fn, runs: int):
+    samples = []
+    result = None
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        result = await fn(page)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples, result
+
+
+def _fmt(name: str, samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return f"{name:<10} media {statistics.mean(samples):8.2f} ms · p50 {statistics.median(samples):8.2f} ms · p95 {p95:8.2f} ms"
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=20)
+    ap.add_argument("--fixture", default=FIXTURE)
+    args = ap.parse_args()
+
+    with open(args.fixture, encoding="utf-8") as f:
+        html = f.read()
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        page = await browser.new_page()
+        await page.set_content(html)
+
+        old_samples, old_items = await _time_path(page, _extract_cards_dom, args.runs)
+        new_samples, new_items = await _time_path(page, _extract_cards, args.runs)
+        await browser.close()
+
+    print(f"Fixture: {args.fixture} · {len(new_items)} tarjetas · {args.runs} repeticiones")
+    print(_fmt("dom", old_samples))
+    print(_fmt("evaluate", new_samples))
+    print(f"Speedup p50: x{statistics.median(old_samples) / max(statistics.median(new_samples), 1e-6):.1f}")
+    if old_items != new_items:
+        print("⚠️ Los resultados de ambas rutas NO coinciden")
+        sys.exit(1)
+    print("✅ Ambas rutas devuelven los mismos items")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+# bench_filters.py
+# Benchmark del filtrado local: funciones sueltas (_title_matches_query,
+# _contains_omit, _score_title, cada una normalizando de nuevo) frente a
+# CompiledSearchFilter con el título normalizado una sola vez.
+#
+#   python bench/bench_filters.py [--titles 5000] [--searches 20] [--runs 5]
+import os, sys, time, random, argparse, statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from wallapop import (
+    CompiledSearchFilter, filter_items, MAX_ITEMS,
+    _title_matches_query, _contains_omit, _score_title,
+)
+
+WORDS = ["iPhone", "13", "Pro", "Max", "PS5", "Slim", "mando", "DualSense", "Nintendo", "Switch",
+         "OLED", "bicicleta", "montaña", "portátil", "Lenovo", "ThinkPad", "monitor", "Samsung",
+         "cafetera", "Nespresso", "LEGO", "Star", "Wars", "silla", "gaming", "roto", "piezas",
+         "funda", "cargador", "nuevo", "precintado", "caja", "128GB", "256GB", "azul", "negro"]
+
+
+def _synthetic_items(n: int, rnd: random.Random):
+    items = []
+    for i in range(n):
+        title = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(3, 9)))
+        if rnd.random() < 0.2:
+            title += rnd.choice([" ¡¡OFERTA!!", " (como nuevo)", " - envío gratis", " · urge"])
+        items.append({
+            "id": f"item-{i}",
+            "title": title,
+            "price": round(rnd.uniform(1, 1500), 2),
+            "url": f"https://es.wallapop.com/item/item-{i}",
+            "seller_id": "",
+            "shipping": rnd.random() < 0.6,
+            "reserved": rnd.random() < 0.05,
+            "sold": False,
+        })
+    return items
+
+
+def _synthetic_searches(n: int, rnd: random.Random):
+    searches = []
+    for _ in range(n):
+        q = " ".join(rnd.sample(WORDS, rnd.randint(1, 2)))
+        f = {"strict": rnd.random() < 0.7}
+        if rnd.random() < 0.5:
+            f["min"] = float(rnd.randint(5, 100))
+        if rnd.random() < 0.5:
+            f["max"] = float(rnd.randint(200, 1500))
+        if rnd.random() < 0.3:
+            f["shipping"] = True
+        if rnd.random() < 0.6:
+            f["omit"] = rnd.sample(["roto", "piezas", "funda", "caja", "mando", "cargador"], rnd.randint(1, 4))
+        searches.append((q, f))
+    return searches
+
+
+def _legacy_filter(raw_items, query, filters):
+    # Réplica del filtrado anterior, paso a paso
+    strict = filters.get("strict", True)
+    out = [it for it in raw_items if _title_matches_query(it["title"], query, strict=strict)]
+    out = [it for it in out if not it.get("reserved")]
+    if "min" in filters:
+        out = [it for it in out if it["price"] >= float(filters["min"])]
+    if "max" in filters:
+        out = [it for it in out if it["price"] <= float(filters["max"])]
+    if filters.get("shipping"):
+        out = [it for it in out if it["shipping"]]
+    if filters.get("omit"):
+        out = [it for it in out if not _contains_omit(it["title"], filters["omit"])]
+    out.sort(key=lambda it: _score_title(it["title"], query), reverse=True)
+    return [it["id"] for it in out[:MAX_ITEMS]]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--titles", type=int, default=5000)
+    ap.add_argument("--searches", type=int, default=20)
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    rnd = random.Random(args.seed)
+    items = _synthetic_items(args.titles, rnd)
+    searches = _synthetic_searches(args.searches, rnd)
+    compiled = [CompiledSearchFilter(q, f) for q, f in searches]
+
+    legacy_t, compiled_t = [], []
+    for _ in range(args.runs):
+        t0 = time.perf_counter()
+        legacy = [_legacy_filter(items, q, f) for q, f in searches]
+        legacy_t.append(time.perf_counter() - t0)
+
+        fresh = [dict(it) for it in items]   # sin título normalizado cacheado
+        t0 = time.perf_counter()
+        new = [[w.id for w in filter_items(fresh, q, compiled=cf)] for (q, _), cf in zip(searches, compiled)]
+        compiled_t.append(time.perf_counter() - t0)
+
+        if legacy != new:
+            print("⚠️ Resultados distintos entre filtro antiguo y compilado")
+            sys.exit(1)
+
+    checks = args.titles * args.searches
+    for name, samples in (("antiguo", legacy_t), ("compilado", compiled_t)):
+        med = statistics.median(samples)
+        print(f"{name:<10} p50 {med * 1000:8.1f} ms · {checks / med / 1000:8.1f} k items·búsqueda/s")
+    print(f"Speedup p50: x{statistics.median(legacy_t) / statistics.median(compiled_t):.1f} "
+          f"({args.titles} títulos x {args.searches} búsquedas) ✅ mismos resultados")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,434 @@
+# bench_suite.py
+# Benchmark offline de extremo a extremo: scheduler + motor + filtros + outbox
+# + dispatcher, sin tocar es.wallapop.com ni Telegram.
+#
+# - Un servidor HTTP local sirve las páginas y payloads grabados de fixtures/.
+#   El motor HTTP apunta a él (WALLA_API_BASE) y el navegador le llega por un
+#   route handler del pool (route.fetch -> servidor local).
+# - Un bot falso registra los envíos con latencia simulada y RetryAfter.
+# - Cada escenario (1/100/1000 búsquedas) corre en un subproceso limpio con su
+#   propia BD temporal y hace varios ciclos: el primero con todo nuevo y los
+#   siguientes con una parte de items nuevos.
+#
+#   python bench/bench_suite.py [--scenarios 1,100,1000] [--engine http|browser] [--cycles 2]
+#                               [--tg-latency-ms 40] [--retry-after-rate 0.01] [--out results.json]
+#                               [--compare results_anteriores.json]
+#
+# Los resultados se guardan en bench/results/<fecha>_<commit>_<motor>.json.
+import os, sys, json, time, random, asyncio, argparse, tempfile, threading, subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, "..", "src")
+FIXTURES = os.path.join(BENCH_DIR, "fixtures")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+QUERIES = ["iphone 13", "iphone 13 max", "iphone 13 128gb", "funda iphone", "iphone azul",
+           "funda", "cargador iphone", "iphone 13 libre"]
+
+
+# ===========================
+# Servidor de grabaciones
+# ===========================
+class RecordingServer:
+    """Sirve la búsqueda HTML y la API grabadas.
+
+    Los ids (web_slug) se sazonan con la query, para que búsquedas distintas
+    no compartan items, y con `epoch` en los primeros `new_per_epoch` items,
+    para simular anuncios nuevos entre ciclos. Con `pages` > 1 la API pagina
+    con `meta.next_page` como la real.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, new_per_epoch: int = 3, pages: int = 1):
+        with open(os.path.join(FIXTURES, "api_search.json"), encoding="utf-8") as f:
+            self.payload = json.load(f)
+        with open(os.path.join(FIXTURES, "search_page.html"), "rb") as f:
+            self.search_html = f.read()
+        self.latency_ms = latency_ms
+        self.new_per_epoch = new_per_epoch
+        self.pages = max(1, pages)
+        self.epoch = 0
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server.requests += 1
+                if server.latency_ms:
+                    time.sleep(server.latency_ms / 1000.0)
+                u = urlsplit(self.path)
+                if u.path.startswith("/api/v3/search"):
+                    qs = parse_qs(u.query)
+                    kw, page = qs.get("keywords", [""])[0], 0
+                    if "next_page" in qs:
+                        kw, page = qs["next_page"][0].rsplit("|", 1)
+                    body, ctype = server._api_body(kw, int(page)), "application/json"
+                elif u.path.startswith("/search"):
+                    body, ctype = server._shell_html(u.query), "text/html; charset=utf-8"
+                else:
+                    body, ctype = b"", "text/plain"
+                self.send_response(200 if body else 404)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Access-Control-Allow-Origin", "*")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def _api_body(self, keywords: str, page: int = 0) -> bytes:
+        salt = abs(hash(keywords)) % 100000
+        items = []
+        for i, it in enumerate(self.payload["data"]["section"]["payload"]["items"]):
+            it = dict(it)
+            new = page == 0 and i < self.new_per_epoch
+            suffix = f"-q{salt}" + (f"-p{page}" if page else "") + (f"-e{self.epoch}" if new else "")
+            it["id"] = f"{it['id']}{suffix}"
+            it["web_slug"] = f"{it['web_slug']}{suffix}"
+            items.append(it)
+        body = {"data": {"section": {"payload": {"items": items}}}}
+        if page + 1 < self.pages:
+            body["meta"] = {"next_page": f"{keywords}|{page + 1}"}
+        return json.dumps(body).encode()
+
+    def _shell_html(self, query: str) -> bytes:
+        # Como la web real: la página pide la búsqueda a la API por fetch
+        api = f"https://api.wallapop.com/api/v3/search?{query}"
+        return (f'<!DOCTYPE html><html><body><div id="grid"></div>'
+                f'<script>fetch("{api}").then(r => r.json()).catch(() => null);</script>'
+                f'</body></html>').encode() if "keywords=" in query else self.search_html
+
+    def start(self) -> None:
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+
+
+# ===========================
+# Bot de Telegram falso
+# ===========================
+class FakeBot:
+    def __init__(self, latency_ms: float, retry_after_rate: float, retry_after_sec: float, seed: int = 1):
+        self.latency_ms = latency_ms
+        self.retry_after_rate = retry_after_rate
+        self.retry_after_sec = retry_after_sec
+        self.rnd = random.Random(seed)
+        self.sent = 0
+        self.chars = 0
+        self.retry_afters = 0
+        self.per_chat = {}
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(self.latency_ms / 1000.0 * self.rnd.uniform(0.5, 1.5))
+        if self.rnd.random() < self.retry_after_rate:
+            from telegram.error import RetryAfter
+            self.retry_afters += 1
+            raise RetryAfter(self.retry_after_sec)
+        self.sent += 1
+        self.chars += len(text)
+        self.per_chat[chat_id] = self.per_chat.get(chat_id, 0) + 1
+
+
+# ===========================
+# Muestreo de memoria / procesos
+# ===========================
+def _proc_tree() -> tuple:
+    """(RSS total MB de este proceso y descendientes, nº de procesos Chromium descendientes)."""
+    if not os.path.isdir("/proc"):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 0
+    parents, rss, cmd = {}, {}, {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        pid = int(name)
+        try:
+            with open(f"/proc/{pid}/stat", "rb") as f:
+                fields = f.read().rsplit(b")", 1)[1].split()
+            parents[pid] = int(fields[1])
+            rss[pid] = int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                cmd[pid] = f.read(512)
+        except (OSError, IndexError, ValueError):
+            continue
+    tree, frontier = {os.getpid()}, [os.getpid()]
+    children = {}
+    for pid, ppid in parents.items():
+        children.setdefault(ppid, []).append(pid)
+    while frontier:
+        for child in children.get(frontier.pop(), []):
+            if child not in tree:
+                tree.add(child)
+                frontier.append(child)
+    total = sum(rss.get(p, 0) for p in tree) / (1024 * 1024)
+    chromium = sum(1 for p in tree if b"chrom" in cmd.get(p, b"").lower())
+    return total, chromium
+
+
+async def _sampler(stop: asyncio.Event, peak: dict) -> None:
+    while not stop.is_set():
+        mb, procs = await asyncio.to_thread(_proc_tree)
+        peak["rss_mb"] = max(peak["rss_mb"], mb)
+        peak["chromium_procs"] = max(peak["chromium_procs"], procs)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=0.25)
+        except asyncio.TimeoutError:
+            pass
+
+
+# ===========================
+# Escenario (subproceso)
+# ===========================
+def _pct(samples, q):
+    s = sorted(samples)
+    return round(s[min(len(s) - 1, int(len(s) * q))] * 1000, 1) if s else 0.0
+
+
+def _seed_searches(db, n: int, distinct_ratio: float, seed: int) -> None:
+    rnd = random.Random(seed)
+    db.init_db()
+    users = max(1, n // 5)
+    for uid in range(1, users + 1):
+        db.set_user_active(uid, f"bench{uid}", True)
+    for i in range(n):
+        filters = {"strict": rnd.random() < 0.7}
+        if rnd.random() < 0.4:
+            filters["max"] = float(rnd.randint(100, 900))
+        if rnd.random() < 0.3:
+            filters["shipping"] = True
+        if rnd.random() < 0.3:
+            filters["omit"] = rnd.sample(["funda", "caja", "cargador"], 1)
+        if rnd.random() < distinct_ratio:
+            filters["km"] = rnd.randint(1, 500)   # radio propio => descarga propia
+        db.save_search(rnd.randint(1, users), "bench", rnd.choice(QUERIES), filters)
+
+
+async def _scenario(args) -> dict:
+    server = RecordingServer(latency_ms=args.server_latency_ms, new_per_epoch=args.new_per_cycle,
+                             pages=args.api_pages)
+    server.start()
+
+    # Config leída al importar los módulos del proyecto
+    tmp = tempfile.mkdtemp(prefix="bench_suite_")
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+        "WALLA_MODE": "real",
+        "WALLA_ENGINE": args.engine,
+        "WALLA_ENGINE_ESCALATE": "0",
+        "WALLA_EXTRACT": "api",
+        "WALLA_API_BASE": server.base,
+        "WALLA_HOST_MIN_GAP_MS": "0",
+        "WALLA_CACHE_TTL_SEC": "0",   # los ciclos van seguidos: con caché el segundo no descargaría
+        "WALLA_HOST_MAX_INFLIGHT": str(args.concurrency),
+        "SCHED_CONCURRENCY": str(args.concurrency),
+        "TG_GLOBAL_RATE": str(args.tg_global_rate),
+        "TG_CHAT_RATE": str(args.tg_chat_rate),
+        "METRICS_PORT": "0",
+    })
+    sys.path.insert(0, SRC_DIR)
+    import db, scheduler, wallapop
+    from dispatcher import Dispatcher
+    from match_index import match_index
+    from metrics import WALLA_ITEMS
+
+    _seed_searches(db, args.searches, args.distinct_ratio, args.seed)
+
+    if args.engine == "browser":
+        from browser_pool import BrowserPool
+
+        async def route_to_server(route, request):
+            u = urlsplit(request.url)
+            if u.netloc in ("es.wallapop.com", "api.wallapop.com"):
+                resp = await route.fetch(url=f"{server.base}{u.path}?{u.query}")
+                await route.fulfill(response=resp)
+            else:
+                await route.abort()
+
+        # Sin storage_state: cada ejecución arranca en frío y es comparable con las anteriores
+        wallapop._pool = BrowserPool(route_handler=route_to_server, storage_state_path="")
+        await wallapop.start_browser_pool()
+
+    # Latencia por búsqueda: cada grupo cuenta para todas sus búsquedas
+    latencies = []
+    check_group = scheduler._check_group
+
+    async def timed_check_group(app, group):
+        t0 = time.perf_counter()
+        try:
+            return await check_group(app, group)
+        finally:
+            latencies.extend([time.perf_counter() - t0] * len(group))
+    scheduler._check_group = timed_check_group
+
+    bot = FakeBot(args.tg_latency_ms, args.retry_after_rate, args.retry_after_sec, args.seed)
+    app = type("App", (), {"bot": bot})()
+    scheduler._dispatcher = Dispatcher(bot)
+    await scheduler._dispatcher.start()
+    sender = asyncio.create_task(scheduler._outbox_sender())
+
+    stop_sampler = asyncio.Event()
+    peak = {"rss_mb": 0.0, "chromium_procs": 0}
+    sampler = asyncio.create_task(_sampler(stop_sampler, peak))
+
+    cycles = []
+    try:
+        for c in range(args.cycles):
+            server.epoch = c
+            latencies.clear()
+            raw_before = WALLA_ITEMS.get(kind="raw")
+            sent_before = bot.sent
+
+            specs, _ = await scheduler._load_specs()
+            match_index.sync(specs)
+            t0 = time.perf_counter()
+            await scheduler._run_cycle(app, specs)
+            cycle_sec = time.perf_counter() - t0
+            queued = await scheduler._flush_outbox_batch()
+
+            # Hasta que el outbox quede vacío (o se agote el tiempo)
+            t1 = time.perf_counter()
+            while time.perf_counter() - t1 < args.drain_timeout:
+                counts = await db.run(db.outbox_counts)
+                if not counts.get("pending") and not counts.get("sending"):
+                    break
+                await asyncio.sleep(0.05)
+            drain_sec = time.perf_counter() - t1
+
+            raw = WALLA_ITEMS.get(kind="raw") - raw_before
+            cycles.append({
+                "cycle": c,
+                "cycle_sec": round(cycle_sec, 3),
+                "fetches": scheduler.cycle_stats()["last_fetches"],
+                "search_ms_p50": _pct(latencies, 0.5),
+                "search_ms_p95": _pct(latencies, 0.95),
+                "search_ms_p99": _pct(latencies, 0.99),
+                "raw_items": int(raw),
+                "items_per_sec": round(raw / cycle_sec, 1) if cycle_sec else 0.0,
+                "notified_items": queued,
+                "messages_sent": bot.sent - sent_before,
+                "drain_sec": round(drain_sec, 3),
+            })
+    finally:
+        stop_sampler.set()
+        await sampler
+        sender.cancel()
+        await asyncio.gather(sender, return_exceptions=True)
+        await scheduler._dispatcher.stop()
+        await wallapop.stop_browser_pool()
+        server.stop()
+
+    return {
+        "searches": args.searches,
+        "engine": args.engine,
+        "cycles": cycles,
+        "peak_rss_mb": round(peak["rss_mb"], 1),
+        "peak_chromium_procs": peak["chromium_procs"],
+        "server_requests": server.requests,
+        "telegram": {"sent": bot.sent, "retry_after": bot.retry_afters, "chars": bot.chars,
+                     "chats": len(bot.per_chat)},
+        "dispatcher": scheduler.dispatcher_stats(),
+    }
+
+
+# ===========================
+# Orquestación
+# ===========================
+def _git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or "unknown"
+    except Exception:
+        return "unknown"
+
+
+def _print_table(results: list, previous: dict = None) -> None:
+    prev = {(r["searches"], r["engine"]): r for r in (previous or {}).get("scenarios", [])}
+    for r in results:
+        first = r["cycles"][0]
+        last = r["cycles"][-1]
+        line = (f"{r['searches']:>5} búsquedas [{r['engine']}] · ciclo {first['cycle_sec']:.2f}s "
+                f"(siguiente {last['cycle_sec']:.2f}s) · p50 {first['search_ms_p50']:.0f} ms · "
+                f"p95 {first['search_ms_p95']:.0f} ms · {first['items_per_sec']:.0f} items/s · "
+                f"envío {first['drain_sec']:.2f}s ({first['messages_sent']} msgs) · "
+                f"RSS máx {r['peak_rss_mb']:.0f} MB · chromium {r['peak_chromium_procs']}")
+        old = prev.get((r["searches"], r["engine"]))
+        if old:
+            o = old["cycles"][0]
+            line += (f"\n      vs {previous.get('commit', '?')}: ciclo x{first['cycle_sec'] / max(o['cycle_sec'], 1e-9):.2f}"
+                     f" · p95 x{first['search_ms_p95'] / max(o['search_ms_p95'], 1e-9):.2f}"
+                     f" · RSS x{r['peak_rss_mb'] / max(old['peak_rss_mb'], 1e-9):.2f}")
+        print(line)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scenarios", default="1,100,1000", help="nº de búsquedas por escenario")
+    ap.add_argument("--engine", default="http", choices=["http", "browser"])
+    ap.add_argument("--cycles", type=int, default=2)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--distinct-ratio", type=float, default=0.7, help="parte de búsquedas con descarga propia")
+    ap.add_argument("--new-per-cycle", type=int, default=3, help="items nuevos por búsqueda en cada ciclo")
+    ap.add_argument("--server-latency-ms", type=float, default=50)
+    ap.add_argument("--api-pages", type=int, default=1, help="páginas de la API (next_page) por búsqueda")
+    ap.add_argument("--tg-latency-ms", type=float, default=40)
+    ap.add_argument("--tg-global-rate", type=float, default=25)
+    ap.add_argument("--tg-chat-rate", type=float, default=1)
+    ap.add_argument("--retry-after-rate", type=float, default=0.01)
+    ap.add_argument("--retry-after-sec", type=float, default=1)
+    ap.add_argument("--drain-timeout", type=float, default=300)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", help="fichero JSON de resultados")
+    ap.add_argument("--compare", help="JSON de una ejecución anterior para comparar")
+    ap.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    ap.add_argument("--searches", type=int, default=1, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        print("@@RESULT@@" + json.dumps(asyncio.run(_scenario(args))))
+        return
+
+    results = []
+    for n in [int(x) for x in args.scenarios.split(",") if x.strip()]:
+        argv = [a for a in sys.argv[1:] if a not in ("--child",)]
+        cmd = [sys.executable, os.path.abspath(__file__), *argv, "--child", "--searches", str(n)]
+        print(f"▶ Escenario {n} búsquedas ({args.engine})...", flush=True)
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        line = next((l for l in proc.stdout.splitlines() if l.startswith("@@RESULT@@")), None)
+        if proc.returncode != 0 or line is None:
+            print(proc.stdout[-2000:], proc.stderr[-4000:])
+            sys.exit(f"Escenario {n} falló")
+        results.append(json.loads(line[len("@@RESULT@@"):]))
+
+    rev = _git_rev()
+    report = {
+        "commit": rev,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "args": {k: v for k, v in vars(args).items() if k not in ("child", "searches", "out", "compare")},
+        "scenarios": results,
+    }
+    out = args.out
+    if not out:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}_{rev}_{args.engine}.json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+    _print_table(results, previous)
+    print(f"Resultados en {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# replay_api.py
+# Prueba offline del modo de extracción por API: sirve un payload grabado de la
+# búsqueda a través de un route handler local, sin tocar la red.
+#
+#   python bench/replay_api.py                 # payload API -> WItem
+#   python bench/replay_api.py --dom-fallback  # sin payload -> fallback a _extract_cards
+import os, sys, time, json, asyncio, argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import wallapop
+from browser_pool import BrowserPool
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+API_URL = "https://api.wallapop.com/api/v3/search?keywords=iphone%2013&source=side_bar_filters"
+
+# Página mínima que, como la web real, pide la búsqueda por fetch tras cargar
+SHELL_HTML = f"""<!DOCTYPE html>
+<html><body><div id="grid"></div>
+<script>fetch("{API_URL}").then(r => r.json()).catch(() => null);</script>
+</body></html>"""
+
+
+def _make_handler(payload_body: str, page_html: str):
+    async def handler(route, request):
+        url = request.url
+        if wallapop._is_search_api_url(url):
+            await route.fulfill(
+                status=200,
+                content_type="application/json",
+                headers={"access-control-allow-origin": "*"},
+                body=payload_body,
+            )
+        elif url.startswith(wallapop.WALLA_HTML_BASE + "/search"):
+            await route.fulfill(status=200, content_type="text/html", body=page_html)
+        else:
+            await route.abort()
+    return handler
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dom-fallback", action="store_true", help="servir el HTML grabado sin payload API")
+    ap.add_argument("--query", default="iphone 13")
+    args = ap.parse_args()
+
+    with open(os.path.join(FIXTURES, "api_search.json"), encoding="utf-8") as f:
+        payload_body = json.dumps(json.load(f))
+    if args.dom_fallback:
+        with open(os.path.join(FIXTURES, "search_page.html"), encoding="utf-8") as f:
+            page_html = f.read()
+    else:
+        page_html = SHELL_HTML
+
+    wallapop._pool = BrowserPool(browsers=1, pages_per_browser=1, storage_state_path="",
+                                 route_handler=_make_handler(payload_body, page_html))
+    try:
+        t0 = time.perf_counter()
+        # Motor navegador forzado: el HTTP (por defecto) iría a la API real
+        items = await wallapop.search_items(args.query, {"engine": "browser", "strict": not args.dom_fallback})
+        elapsed = (time.perf_counter() - t0) * 1000
+    finally:
+        await wallapop.stop_browser_pool()
+
+    for it in items:
+        print(f"  {it.id:<60} {it.price:>8.2f} €  {'📦' if it.shipping else ''} {it.title}")
+    print(f"{len(items)} items en {elapsed:.0f} ms · extracción: {wallapop.extract_stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+# stub_http_engine.py
+# Servidor HTTP local que imita el endpoint JSON de búsqueda para probar el
+# motor HTTP (y su escalado) sin tocar Wallapop.
+#
+#   python bench/stub_http_engine.py --mode ok|empty|blocked|captcha [--requests 50]
+import os, sys, time, json, asyncio, argparse, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def _make_server(mode: str, payload: bytes) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"   # keep-alive
+
+        def do_GET(self):
+            if mode == "ok":
+                status, ctype, body = 200, "application/json", payload
+            elif mode == "empty":
+                status, ctype, body = 200, "application/json", b'{"data":{"section":{"payload":{"items":[]}}}}'
+            elif mode == "blocked":
+                status, ctype, body = 403, "text/html", b"<html>Access denied</html>"
+            else:
+                status, ctype, body = 200, "text/html", b"<html><div class='captcha'>Are you a robot?</div></html>"
+            self.send_response(status)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mode", default="ok", choices=["ok", "empty", "blocked", "captcha"])
+    ap.add_argument("--requests", type=int, default=50)
+    ap.add_argument("--query", default="iphone 13")
+    args = ap.parse_args()
+
+    with open(os.path.join(FIXTURES, "api_search.json"), "rb") as f:
+        payload = f.read()
+    server = _make_server(args.mode, payload)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # La config se lee al importar: apuntar el motor HTTP al stub y sin escalado
+    os.environ["WALLA_API_BASE"] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["WALLA_ENGINE"] = "http"
+    os.environ["WALLA_ENGINE_ESCALATE"] = "0"
+    os.environ.setdefault("WALLA_HOST_MIN_GAP_MS", "0")
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+    import wallapop
+
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(wallapop.search_items(args.query, {"strict": False})
+                                     for _ in range(args.requests)))
+    elapsed = time.perf_counter() - t0
+    server.shutdown()
+
+    print(f"modo={args.mode} · {args.requests} búsquedas en {elapsed:.2f}s · items/búsqueda={len(results[0])}")
+    print(json.dumps(wallapop.engine_stats(), indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
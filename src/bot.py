@@ -1,5 +1,5 @@
 # bot.py
-import os, asyncio, ast, re
+import os, asyncio, re
 from typing import Tuple, Dict, Any, List
 
 from telegram import (
@@ -9,8 +9,15 @@ from telegram.ext import (
     Application, CommandHandler, ContextTypes, CallbackQueryHandler,
     MessageHandler, ConversationHandler, filters,
 )
-from db import init_db, ensure_user, SessionLocal, SavedSearch, User
-from scheduler import loop_checks
+from db import (
+    init_db, run, parse_legacy_query, SavedSearch,
+    set_user_active, list_searches, get_search, delete_search, toggle_search, save_search,
+)
+from scheduler import loop_checks, request_refresh, stop_dispatcher, USE_FAKE
+from jobs import SCRAPER_MODE
+from metrics import start_metrics_server
+from wallapop import start_browser_pool, stop_browser_pool, CompiledSearchFilter
+from match_index import match_index, url_scope
 
 TOKEN = os.getenv("TELEGRAM_TOKEN")
 
@@ -20,19 +27,18 @@ TOKEN = os.getenv("TELEGRAM_TOKEN")
 def normalize_name(s: str) -> str:
     return re.sub(r"\s+", " ", (s or "").strip()).lower()
 
-def parse_saved_query(raw_query: str) -> Tuple[str, Dict[str, Any]]:
-    filters = {}
-    query_text = raw_query
-    if "(filtros:" in raw_query:
-        try:
-            base, filt_str = raw_query.split("(filtros:", 1)
-            query_text = base.strip()
-            filt_dict = filt_str.strip(" )")
-            filters = ast.literal_eval(filt_dict) if filt_dict else {}
-        except Exception:
-            query_text = raw_query
-            filters = {}
-    return query_text, filters
+def parse_saved_query(ss: SavedSearch) -> Tuple[str, Dict[str, Any]]:
+    if ss.name is not None:
+        return ss.name, ss.filters
+    return parse_legacy_query(ss.query)
+
+def refresh_match_index(ss: SavedSearch) -> None:
+    # Mantiene el índice de reparto al día sin esperar al siguiente ciclo
+    if ss.active:
+        match_index.upsert(ss.id, CompiledSearchFilter(ss.name or "", ss.filters), ss.version, url_scope(ss.filters))
+    else:
+        match_index.remove(ss.id)
+    request_refresh()   # nuevas/editadas: primera ejecución inmediata
 
 def format_filters_pretty(filters: dict) -> str:
     if not filters:
@@ -56,50 +62,42 @@ def format_filters_pretty(filters: dict) -> str:
 # /start /stop simples
 # ======================
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    ensure_user(update.effective_user.id, update.effective_user.username)
-    with SessionLocal() as s:
-        user = s.get(User, update.effective_user.id)
-        if user:
-            user.active = True
-            s.commit()
+    await run(set_user_active, update.effective_user.id, update.effective_user.username, True)
+    request_refresh()
     await update.message.reply_text("✅ Bot activado. Usa /buscar <texto> para crear una búsqueda.")
 
 async def stop(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    with SessionLocal() as s:
-        user = s.get(User, update.effective_user.id)
-        if user:
-            user.active = False
-            s.commit()
+    await run(set_user_active, update.effective_user.id, update.effective_user.username, False)
+    request_refresh()
     await update.message.reply_text("⛔ Bot desactivado. No recibirás más alertas.")
 
 # ======================
 # /mis_busquedas con botones toggle/borrar/editar
 # ======================
 async def mis_busquedas(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    with SessionLocal() as s:
-        searches = s.query(SavedSearch).filter_by(user_id=update.effective_user.id).all()
-        if not searches:
-            await update.message.reply_text("📭 No tienes búsquedas guardadas.")
-            return
+    searches = await run(list_searches, update.effective_user.id)
+    if not searches:
+        await update.message.reply_text("📭 No tienes búsquedas guardadas.")
+        return
 
-        await update.message.reply_text("📋 Tus búsquedas guardadas\nPulsa los botones para gestionarlas")
+    await update.message.reply_text("📋 Tus búsquedas guardadas\nPulsa los botones para gestionarlas")
 
-        for ss in searches:
-            query_text, filters = parse_saved_query(ss.query)
-            estado_text = "🟢 Activa" if ss.active else "🔴 Inactiva"
+    for ss in searches:
+        query_text, filters = parse_saved_query(ss)
+        estado_text = "🟢 Activa" if ss.active else "🔴 Inactiva"
 
-            text = f"#{ss.id}  🔎 {query_text}\nEstado: {estado_text}"
-            pretty = format_filters_pretty(filters)
-            if pretty:
-                text += f"\n{pretty}"
+        text = f"#{ss.id}  🔎 {query_text}\nEstado: {estado_text}"
+        pretty = format_filters_pretty(filters)
+        if pretty:
+            text += f"\n{pretty}"
 
-            toggle_text = "🟥 Desactivar" if ss.active else "🟩 Activar"
-            keyboard = [[
-                InlineKeyboardButton(toggle_text, callback_data=f"toggle:{ss.id}"),
-                InlineKeyboardButton("✏️ Editar", callback_data=f"edit:{ss.id}"),
-                InlineKeyboardButton("🗑️ Borrar", callback_data=f"del:{ss.id}"),
-            ]]
-            await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+        toggle_text = "🟥 Desactivar" if ss.active else "🟩 Activar"
+        keyboard = [[
+            InlineKeyboardButton(toggle_text, callback_data=f"toggle:{ss.id}"),
+            InlineKeyboardButton("✏️ Editar", callback_data=f"edit:{ss.id}"),
+            InlineKeyboardButton("🗑️ Borrar", callback_data=f"del:{ss.id}"),
+        ]]
+        await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
 
 async def manage_button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
@@ -107,36 +105,36 @@ async def manage_button_handler(update: Update, context: ContextTypes.DEFAULT_TY
     data = q.data.split(":")
     action, search_id = data[0], int(data[1])
 
-    with SessionLocal() as s:
-        ss = s.get(SavedSearch, search_id)
-        if not ss or ss.user_id != q.from_user.id:
+    if action == "del":
+        if not await run(delete_search, search_id, q.from_user.id):
             await q.edit_message_text("❌ No encontré esa búsqueda.")
             return
-
-        if action == "del":
-            s.delete(ss)
-            s.commit()
-            await q.edit_message_text(f"🗑️ Búsqueda {search_id} eliminada.")
+        match_index.remove(search_id)
+        request_refresh()   # que el planner la suelte antes de volver a ejecutarla
+        await q.edit_message_text(f"🗑️ Búsqueda {search_id} eliminada.")
+        return
+
+    if action == "toggle":
+        ss = await run(toggle_search, search_id, q.from_user.id)
+        if not ss:
+            await q.edit_message_text("❌ No encontré esa búsqueda.")
             return
+        refresh_match_index(ss)
+
+        query_text, filters = parse_saved_query(ss)
+        estado_text = "🟢 Activa" if ss.active else "🔴 Inactiva"
+        text = f"#{ss.id}  🔎 {query_text}\nEstado: {estado_text}"
+        pretty = format_filters_pretty(filters)
+        if pretty:
+            text += f"\n{pretty}"
 
-        if action == "toggle":
-            ss.active = not ss.active
-            s.commit()
-
-            query_text, filters = parse_saved_query(ss.query)
-            estado_text = "🟢 Activa" if ss.active else "🔴 Inactiva"
-            text = f"#{ss.id}  🔎 {query_text}\nEstado: {estado_text}"
-            pretty = format_filters_pretty(filters)
-            if pretty:
-                text += f"\n{pretty}"
-
-            toggle_text = "🟥 Desactivar" if ss.active else "🟩 Activar"
-            kb = [[
-                InlineKeyboardButton(toggle_text, callback_data=f"toggle:{ss.id}"),
-                InlineKeyboardButton("✏️ Editar", callback_data=f"edit:{ss.id}"),
-                InlineKeyboardButton("🗑️ Borrar", callback_data=f"del:{ss.id}"),
-            ]]
-            await q.edit_message_text(text, reply_markup=InlineKeyboardMarkup(kb))
+        toggle_text = "🟥 Desactivar" if ss.active else "🟩 Activar"
+        kb = [[
+            InlineKeyboardButton(toggle_text, callback_data=f"toggle:{ss.id}"),
+            InlineKeyboardButton("✏️ Editar", callback_data=f"edit:{ss.id}"),
+            InlineKeyboardButton("🗑️ Borrar", callback_data=f"del:{ss.id}"),
+        ]]
+        await q.edit_message_text(text, reply_markup=InlineKeyboardMarkup(kb))
 
 # ======================
 # Conversación /buscar y edición
@@ -211,13 +209,12 @@ async def edit_entry(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
     sid = int(q.data.split(":")[1])
-    with SessionLocal() as s:
-        ss = s.get(SavedSearch, sid)
-        if not ss or ss.user_id != q.from_user.id:
-            await q.edit_message_text("❌ No encontré esa búsqueda.")
-            return ConversationHandler.END
-        qtext, filters = parse_saved_query(ss.query)
-        context.user_data["new_search"] = {"name": qtext, "filters": filters or {"strict": True}, "edit_id": sid}
+    ss = await run(get_search, sid, q.from_user.id)
+    if not ss:
+        await q.edit_message_text("❌ No encontré esa búsqueda.")
+        return ConversationHandler.END
+    qtext, filters = parse_saved_query(ss)
+    context.user_data["new_search"] = {"name": qtext, "filters": filters or {"strict": True}, "edit_id": sid}
     state = context.user_data["new_search"]
     await q.edit_message_text(_render_menu_text(state), reply_markup=_render_menu_kb(state))
     return FILTER_MENU
@@ -249,17 +246,9 @@ async def buscar_menu_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return FILTER_MENU
 
         name, filters, sid = state["name"], state["filters"], state.get("edit_id")
-        with SessionLocal() as s:
-            ensure_user(q.from_user.id, q.from_user.username)
-            query_display = f"{name} (filtros: {filters})" if filters else name
-            if sid:
-                ss = s.get(SavedSearch, sid)
-                if ss:
-                    ss.query = query_display
-                    s.commit()
-            else:
-                s.add(SavedSearch(user_id=q.from_user.id, query=query_display))
-                s.commit()
+        ss = await run(save_search, q.from_user.id, q.from_user.username, name, filters, sid)
+        if ss:
+            refresh_match_index(ss)
 
         confirm = f"🔎 Guardada búsqueda: {name}"
         pretty = format_filters_pretty(filters)
@@ -313,9 +302,16 @@ async def buscar_cancel_fallback(update: Update, context: ContextTypes.DEFAULT_T
 # Arranque y comandos
 # ======================
 async def on_startup(app):
+    start_metrics_server()
     await asyncio.sleep(1)
+    if not USE_FAKE and SCRAPER_MODE != "split":   # en split los navegadores viven en los workers
+        await start_browser_pool()
     app.create_task(loop_checks(app))
 
+async def on_shutdown(app):
+    await stop_dispatcher()
+    await stop_browser_pool()
+
 def main():
     init_db()
     app = Application.builder().token(TOKEN).build()
@@ -352,6 +348,7 @@ def main():
         await on_startup(app_)
 
     app.post_init = post_init
+    app.post_shutdown = on_shutdown
     print("🤖 Bot arrancando con edición funcionando...")
     app.run_polling()
 
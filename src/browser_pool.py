@@ -0,0 +1,380 @@
+# browser_pool.py
+import os
+import json
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from playwright.async_api import async_playwright, Browser, BrowserContext, Page, Playwright
+
+# ===== Config =====
+POOL_BROWSERS      = int(os.getenv("WALLA_POOL_BROWSERS", "2"))      # procesos Chromium calientes
+POOL_PAGES         = int(os.getenv("WALLA_POOL_PAGES", "3"))         # páginas reutilizables por navegador
+POOL_MAX_NAVS      = int(os.getenv("WALLA_POOL_MAX_NAVS", "200"))    # reciclar tras N navegaciones
+POOL_MAX_RSS_MB    = int(os.getenv("WALLA_POOL_MAX_RSS_MB", "0"))    # 0 = sin límite de memoria
+POOL_RSS_CHECK_EVERY = int(os.getenv("WALLA_POOL_RSS_CHECK_EVERY", "20"))
+
+PLAYWRIGHT_HEADLESS = os.getenv("PLAYWRIGHT_HEADLESS", "1") != "0"
+
+# Estado del navegador entre arranques: cookies (consentimiento) + localStorage
+POOL_STORAGE_STATE     = os.getenv("WALLA_STORAGE_STATE", "browser_state.json")   # vacío = no guardar
+POOL_STORAGE_MAX_AGE   = float(os.getenv("WALLA_STORAGE_MAX_AGE_H", "12")) * 3600  # más viejo => se renueva
+# Perfil persistente (cookies + caché HTTP en disco), un subdirectorio por navegador. Vacío = desactivado.
+# Ojo: Playwright desactiva la caché HTTP en contextos con route(), p. ej. con WALLA_BLOCK_RESOURCES=1.
+POOL_USER_DATA_DIR     = os.getenv("WALLA_USER_DATA_DIR", "")
+
+RouteHandler = Callable[..., Awaitable[Any]]
+
+
+# ===== RSS (best effort, solo Linux con /proc) =====
+def _proc_tree_rss_mb(marker: str) -> Optional[float]:
+    """RSS total (MB) del proceso Chromium marcado con `marker` y sus hijos."""
+    if not os.path.isdir("/proc"):
+        return None
+    parents: Dict[int, int] = {}
+    roots: List[int] = []
+    needle = marker.encode()
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        pid = int(name)
+        try:
+            with open(f"/proc/{pid}/stat", "rb") as f:
+                stat = f.read()
+            # el nombre va entre paréntesis y puede contener espacios
+            parents[pid] = int(stat.rsplit(b")", 1)[1].split()[1])
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                if needle in f.read():
+                    roots.append(pid)
+        except (OSError, ValueError, IndexError):
+            continue
+    if not roots:
+        return None
+
+    children: Dict[int, List[int]] = {}
+    for pid, ppid in parents.items():
+        children.setdefault(ppid, []).append(pid)
+
+    page_kb = os.sysconf("SC_PAGE_SIZE") / 1024
+    total_kb = 0.0
+    pending = list(roots)
+    seen = set()
+    while pending:
+        pid = pending.pop()
+        if pid in seen:
+            continue
+        seen.add(pid)
+        pending.extend(children.get(pid, []))
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total_kb += int(f.read().split()[1]) * page_kb
+        except (OSError, ValueError, IndexError):
+            continue
+    return total_kb / 1024
+
+
+# ===== Slot: un navegador + su contexto + páginas =====
+class _Slot:
+    def __init__(self, idx: int):
+        self.idx = idx
+        self.gen = 0
+        self.browser: Optional[Browser] = None
+        self.context: Optional[BrowserContext] = None
+        self.free: List[Page] = []
+        self.pages = 0          # páginas vivas (libres + prestadas)
+        self.leased = 0
+        self.navs = 0
+        self.retiring = False
+        self.last_rss_mb: Optional[float] = None
+        self.closed = False        # el contexto emitió "close" (perfil persistente caído)
+        self.state_fresh = False   # arrancó con un storage_state vigente o ya lo guardó
+
+    @property
+    def marker(self) -> str:
+        return f"--walla-pool-slot={os.getpid()}-{self.idx}-{self.gen}"
+
+    def alive(self) -> bool:
+        if self.context is None or self.closed:
+            return False
+        # Con perfil persistente no hay objeto Browser: basta con el contexto
+        return self.browser is None or self.browser.is_connected()
+
+
+class BrowserPool:
+    """Pool de navegadores Chromium calientes con páginas reutilizables.
+
+    Las búsquedas piden una página con `async with pool.page() as page:`.
+    Cada navegador se recicla tras `max_navs` navegaciones o si su RSS
+    supera `max_rss_mb`.
+
+    Los contextos arrancan con el `storage_state` guardado (cookies de
+    consentimiento, localStorage) si no ha caducado, y lo guardan tras la
+    primera búsqueda buena cuando arrancaron en frío: el arranque en frío
+    ocurre una vez por navegador, no por búsqueda. Con `user_data_dir` cada
+    navegador usa un perfil persistente propio en su lugar.
+    """
+
+    def __init__(
+        self,
+        browsers: int = POOL_BROWSERS,
+        pages_per_browser: int = POOL_PAGES,
+        max_navs: int = POOL_MAX_NAVS,
+        max_rss_mb: int = POOL_MAX_RSS_MB,
+        context_options: Optional[Dict[str, Any]] = None,
+        route_handler: Optional[RouteHandler] = None,
+        headless: bool = PLAYWRIGHT_HEADLESS,
+        storage_state_path: str = POOL_STORAGE_STATE,
+        storage_max_age: float = POOL_STORAGE_MAX_AGE,
+        user_data_dir: str = POOL_USER_DATA_DIR,
+    ):
+        self.browsers = max(1, browsers)
+        self.pages_per_browser = max(1, pages_per_browser)
+        self.max_navs = max_navs
+        self.max_rss_mb = max_rss_mb
+        self.context_options = context_options or {}
+        self.route_handler = route_handler
+        self.headless = headless
+        self.storage_state_path = storage_state_path
+        self.storage_max_age = storage_max_age
+        self.user_data_dir = user_data_dir
+        self._save_blocked_until = 0.0
+
+        self._pw: Optional[Playwright] = None
+        self._slots = [_Slot(i) for i in range(self.browsers)]
+        self._sem = asyncio.Semaphore(self.browsers * self.pages_per_browser)
+        self._cond = asyncio.Condition()
+        self._start_lock = asyncio.Lock()
+
+        self._stats = {
+            "launches": 0,
+            "recycles_navs": 0,
+            "recycles_rss": 0,
+            "recycles_crash": 0,
+            "leases": 0,
+            "lease_waits": 0,
+            "page_errors": 0,
+            "warm_starts": 0,
+            "state_saves": 0,
+            "dedicated_pages": 0,
+        }
+
+    # ---- ciclo de vida ----
+    async def start(self) -> None:
+        async with self._start_lock:
+            if self._pw is not None:
+                return
+            self._pw = await async_playwright().start()
+            async with self._cond:
+                for slot in self._slots:
+                    await self._launch(slot)
+            print(f"[POOL] Arrancado: {self.browsers} navegadores x {self.pages_per_browser} páginas")
+
+    async def close(self) -> None:
+        async with self._start_lock:
+            if self._pw is None:
+                return
+            async with self._cond:
+                for slot in self._slots:
+                    await self._shutdown(slot)
+            await self._pw.stop()
+            self._pw = None
+
+    # ---- storage_state ----
+    def _fresh_state(self) -> Optional[str]:
+        """Ruta del storage_state guardado si existe y no ha caducado."""
+        path = self.storage_state_path
+        try:
+            if path and time.time() - os.path.getmtime(path) < self.storage_max_age:
+                return path
+        except OSError:
+            pass
+        return None
+
+    async def _save_state(self, slot: _Slot) -> None:
+        if slot.context is None:
+            return
+        try:
+            state = await slot.context.storage_state()
+            tmp = f"{self.storage_state_path}.{os.getpid()}-{slot.idx}.tmp"
+
+            def write():
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(state, f)
+                os.replace(tmp, self.storage_state_path)
+            await asyncio.to_thread(write)
+        except Exception as e:
+            print(f"[POOL] No se pudo guardar el estado del navegador: {e}")
+            self._save_blocked_until = time.time() + 600   # no reintentar en cada búsqueda
+            return
+        slot.state_fresh = True
+        self._stats["state_saves"] += 1
+
+    def _needs_save(self, slot: _Slot) -> bool:
+        if not self.storage_state_path or self.user_data_dir or not slot.alive():
+            return False
+        if time.time() < self._save_blocked_until:
+            return False
+        # Arranque en frío, o el fichero caducó mientras el navegador seguía vivo
+        return not slot.state_fresh or self._fresh_state() is None
+
+    # ---- navegadores ----
+    async def _launch(self, slot: _Slot) -> None:
+        slot.gen += 1
+        slot.closed = False
+        if self.user_data_dir:
+            profile = os.path.join(self.user_data_dir, f"slot-{slot.idx}")
+            os.makedirs(profile, exist_ok=True)
+            slot.browser = None
+            slot.context = await self._pw.chromium.launch_persistent_context(
+                profile, headless=self.headless, args=[slot.marker], **self.context_options)
+            slot.state_fresh = True
+        else:
+            state = self._fresh_state()
+            slot.browser = await self._pw.chromium.launch(headless=self.headless, args=[slot.marker])
+            options = dict(self.context_options)
+            if state:
+                options["storage_state"] = state
+            try:
+                slot.context = await slot.browser.new_context(**options)
+            except Exception as e:   # fichero corrupto o de otra versión: arranque en frío
+                print(f"[POOL] storage_state ignorado ({e})")
+                state = None
+                slot.context = await slot.browser.new_context(**self.context_options)
+            slot.state_fresh = state is not None
+        if slot.state_fresh:
+            self._stats["warm_starts"] += 1
+        slot.context.on("close", lambda *_: setattr(slot, "closed", True))
+        if self.route_handler:
+            await slot.context.route("**/*", self.route_handler)
+        slot.free, slot.pages, slot.navs = [], 0, 0
+        slot.retiring = False
+        slot.last_rss_mb = None
+        self._stats["launches"] += 1
+
+    async def _shutdown(self, slot: _Slot) -> None:
+        browser, context = slot.browser, slot.context
+        slot.browser, slot.context = None, None
+        slot.free, slot.pages = [], 0
+        try:
+            if browser is not None:
+                await browser.close()
+            elif context is not None:
+                await context.close()   # perfil persistente
+        except Exception:
+            pass
+
+    async def _recycle(self, slot: _Slot, reason: str) -> None:
+        self._stats[f"recycles_{reason}"] += 1
+        print(f"[POOL] Reciclando navegador #{slot.idx} ({reason}, navs={slot.navs}, rss={slot.last_rss_mb})")
+        await self._shutdown(slot)
+        await self._launch(slot)
+
+    # ---- préstamo de páginas ----
+    @asynccontextmanager
+    async def page(self):
+        if self._pw is None:
+            await self.start()
+        if self._sem.locked():
+            self._stats["lease_waits"] += 1
+        async with self._sem:
+            slot, page = await self._acquire()
+            ok = False
+            try:
+                yield page
+                ok = True
+            finally:
+                await self._release(slot, page, ok)
+            if ok and self._needs_save(slot):
+                await self._save_state(slot)
+
+    async def open_page(self) -> Page:
+        """Página fuera del préstamo (pestañas dedicadas); la cierra quien la pide.
+
+        No cuenta para `pages_per_browser` y muere con su navegador cuando
+        este se recicla: el dueño debe comprobar `page.is_closed()`.
+        """
+        if self._pw is None:
+            await self.start()
+        async with self._cond:
+            slot = min((s for s in self._slots if s.alive() and not s.retiring),
+                       key=lambda s: s.leased, default=None)
+            if slot is None:
+                raise RuntimeError("ningún navegador disponible")
+            page = await slot.context.new_page()
+            self._stats["dedicated_pages"] += 1
+            return page
+
+    async def _acquire(self):
+        async with self._cond:
+            while True:
+                for slot in sorted(self._slots, key=lambda s: (not s.free, s.leased)):
+                    if slot.retiring:
+                        continue
+                    if not slot.alive():
+                        if slot.leased:
+                            continue  # se relanza cuando vuelvan sus páginas
+                        self._stats["recycles_crash"] += 1
+                        await self._shutdown(slot)
+                        await self._launch(slot)
+                    if slot.free:
+                        page = slot.free.pop()
+                    elif slot.pages < self.pages_per_browser:
+                        page = await slot.context.new_page()
+                        slot.pages += 1
+                    else:
+                        continue
+                    slot.leased += 1
+                    self._stats["leases"] += 1
+                    return slot, page
+                await self._cond.wait()
+
+    async def _release(self, slot: _Slot, page: Page, ok: bool) -> None:
+        async with self._cond:
+            slot.leased -= 1
+            slot.navs += 1
+            if ok and not page.is_closed() and slot.alive():
+                slot.free.append(page)
+            else:
+                if not ok:
+                    self._stats["page_errors"] += 1
+                slot.pages -= 1
+                try:
+                    await page.close()
+                except Exception:
+                    pass
+
+            if not slot.retiring:
+                if not slot.alive():
+                    slot.retiring = True
+                elif self.max_navs and slot.navs >= self.max_navs:
+                    slot.retiring = True
+                elif self.max_rss_mb and POOL_RSS_CHECK_EVERY and slot.navs % POOL_RSS_CHECK_EVERY == 0:
+                    slot.last_rss_mb = _proc_tree_rss_mb(slot.marker)
+                    if slot.last_rss_mb and slot.last_rss_mb > self.max_rss_mb:
+                        slot.retiring = True
+
+            if slot.retiring and slot.leased == 0:
+                if not slot.alive():
+                    reason = "crash"
+                elif slot.last_rss_mb and self.max_rss_mb and slot.last_rss_mb > self.max_rss_mb:
+                    reason = "rss"
+                else:
+                    reason = "navs"
+                await self._recycle(slot, reason)
+            self._cond.notify_all()
+
+    # ---- métricas ----
+    def stats(self) -> Dict[str, Any]:
+        capacity = self.browsers * self.pages_per_browser
+        in_use = sum(s.leased for s in self._slots)
+        return {
+            **self._stats,
+            "capacity": capacity,
+            "in_use": in_use,
+            "occupancy": round(in_use / capacity, 3) if capacity else 0.0,
+            "pages_open": sum(s.pages for s in self._slots),
+            "browsers_alive": sum(1 for s in self._slots if s.alive()),
+            "warm_slots": sum(1 for s in self._slots if s.alive() and s.state_fresh),
+            "navs_per_browser": [s.navs for s in self._slots],
+        }
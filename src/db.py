@@ -1,13 +1,43 @@
-import os, time
-from sqlalchemy import create_engine, Column, Integer, Text, Boolean, ForeignKey
+import os, ast, json, time, asyncio, functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import (
+    create_engine, event, Column, Integer, Float, Text, Boolean, ForeignKey, Index, UniqueConstraint,
+    select, delete, update, inspect, text, func,
+)
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///bot.db")
+DB_THREADS = int(os.getenv("DB_THREADS", "1"))    # 1 = todas las escrituras de SQLite en serie
+SQLITE_PRAGMAS = [
+    "journal_mode=WAL",        # lectores no bloquean al escritor
+    "synchronous=NORMAL",      # seguro con WAL y mucho más rápido que FULL
+    "busy_timeout=5000",
+    "temp_store=MEMORY",
+    "cache_size=-16000",       # ~16 MB
+]
 
 engine = create_engine(DATABASE_URL, echo=False, future=True)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 Base = declarative_base()
 
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cur.execute(f"PRAGMA {pragma}")
+        cur.close()
+
+# ===== Acceso desde código async =====
+_executor = ThreadPoolExecutor(max_workers=max(1, DB_THREADS), thread_name_prefix="db")
+
+
+async def run(fn: Callable, *args, **kwargs):
+    """Ejecuta una función síncrona de BD en el hilo de BD sin bloquear el event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
 
 class User(Base):
     __tablename__ = "users"
@@ -21,15 +51,148 @@ class User(Base):
 class SavedSearch(Base):
     __tablename__ = "saved_searches"
     id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    query = Column(Text, nullable=False)
-    active = Column(Boolean, default=True)   # 👈 sirve para toggle ON/OFF
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    query = Column(Text, nullable=False)     # texto para mostrar: "nombre (filtros: {...})"
+    active = Column(Boolean, default=True, index=True)   # 👈 sirve para toggle ON/OFF
     created_at = Column(Integer, default=lambda: int(time.time()))
+    name = Column(Text)                      # texto de búsqueda
+    filters_json = Column(Text)              # min/max/km/shipping/strict/omit en JSON
+    version = Column(Integer, default=1, nullable=False)   # sube con cada edición de nombre/filtros
+    poll_interval = Column(Float)            # intervalo adaptativo actual (s)
+    next_due_at = Column(Float)              # próxima ejecución (epoch)
     user = relationship("User", back_populates="searches")
 
+    @property
+    def filters(self) -> Dict[str, Any]:
+        try:
+            return json.loads(self.filters_json) if self.filters_json else {}
+        except ValueError:
+            return {}
+
+    def set_spec(self, name: str, filters: Dict[str, Any]) -> None:
+        self.name = name
+        self.filters_json = json.dumps(filters or {}, ensure_ascii=False, sort_keys=True)
+        self.query = f"{name} (filtros: {filters})" if filters else name
+        self.version = (self.version or 0) + 1
+        self.reset_poll()
+
+    def reset_poll(self) -> None:
+        """Olvida el plan guardado: el planificador la ejecuta ya, con el intervalo base."""
+        self.poll_interval = None
+        self.next_due_at = None
+
+
+class SeenItem(Base):
+    """Items ya notificados por búsqueda (sobrevive a reinicios)."""
+    __tablename__ = "seen_items"
+    search_id = Column(Integer, primary_key=True)          # PK compuesta = índice (search_id, item_id)
+    item_id = Column(Text, primary_key=True)
+    first_seen = Column(Integer, nullable=False, index=True, default=lambda: int(time.time()))
+    last_seen = Column(Integer, index=True, default=lambda: int(time.time()))   # última vez en resultados
+
+
+class OutboxItem(Base):
+    """Notificaciones pendientes de entregar (un item por fila, entrega al menos una vez)."""
+    __tablename__ = "outbox"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    chat_id = Column(Integer, nullable=False)
+    search_id = Column(Integer, nullable=False)
+    item_id = Column(Text, nullable=False)
+    payload = Column(Text, nullable=False)                 # JSON: consulta + título/precio/url/envío
+    status = Column(Text, nullable=False, default="pending")   # pending | sending | sent | failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(Float, nullable=False, default=time.time)
+    claimed_at = Column(Float)
+    created_at = Column(Float, nullable=False, default=time.time)
+    sent_at = Column(Float)
+    __table_args__ = (
+        UniqueConstraint("search_id", "item_id", name="uq_outbox_search_item"),
+        Index("ix_outbox_status_due", "status", "next_attempt_at"),
+        Index("ix_outbox_chat_status", "chat_id", "status"),
+    )
+
+
+class ScrapeJob(Base):
+    """Descargas pendientes para los workers de scraping (modo split)."""
+    __tablename__ = "scrape_jobs"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    query = Column(Text, nullable=False)
+    filters_json = Column(Text, nullable=False)            # filtros de URL del grupo
+    search_ids = Column(Text, nullable=False)              # JSON: búsquedas que esperan el resultado
+    status = Column(Text, nullable=False, default="pending")   # pending | running | done | failed
+    attempts = Column(Integer, nullable=False, default=0)
+    worker_id = Column(Text)
+    claimed_at = Column(Float)
+    heartbeat_at = Column(Float)
+    created_at = Column(Float, nullable=False, default=time.time)
+    finished_at = Column(Float)
+    result_json = Column(Text)                             # items en bruto
+    error = Column(Text)
+    __table_args__ = (Index("ix_scrape_jobs_status", "status", "id"),)
+
+
+def parse_legacy_query(raw_query: str) -> Tuple[str, Dict[str, Any]]:
+    """Formato antiguo: "nombre (filtros: {...})" con el dict como repr de Python."""
+    filters = {}
+    query_text = raw_query
+    if "(filtros:" in raw_query:
+        try:
+            base, filt_str = raw_query.split("(filtros:", 1)
+            query_text = base.strip()
+            filt_dict = filt_str.strip(" )")
+            filters = ast.literal_eval(filt_dict) if filt_dict else {}
+        except Exception:
+            query_text = raw_query
+            filters = {}
+    return query_text, filters
+
+
+# Columnas añadidas después de la primera versión: (tabla, columna, DDL)
+_NEW_COLUMNS = [
+    ("saved_searches", "name", "TEXT"),
+    ("saved_searches", "filters_json", "TEXT"),
+    ("saved_searches", "version", "INTEGER NOT NULL DEFAULT 1"),
+    ("saved_searches", "poll_interval", "FLOAT"),
+    ("saved_searches", "next_due_at", "FLOAT"),
+    ("seen_items", "last_seen", "INTEGER"),
+]
+
+# Índices añadidos a tablas que ya existían
+_NEW_INDEXES = [
+    "ix_outbox_chat_status",
+    "ix_saved_searches_active",
+    "ix_saved_searches_user_id",
+    "ix_seen_items_last_seen",
+]
+
+
+def _migrate():
+    """Añade columnas nuevas a tablas existentes y rellena los filtros estructurados."""
+    insp = inspect(engine)
+    existing = {t: {c["name"] for c in insp.get_columns(t)} for t in {t for t, _, _ in _NEW_COLUMNS}}
+    with engine.begin() as conn:
+        for table, col, ddl in _NEW_COLUMNS:
+            if col not in existing[table]:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {col} {ddl}"))
+        if "last_seen" not in existing["seen_items"]:
+            conn.execute(text("UPDATE seen_items SET last_seen = first_seen WHERE last_seen IS NULL"))
+    indexes = {ix.name: ix for t in Base.metadata.sorted_tables for ix in t.indexes}
+    for name in _NEW_INDEXES:
+        indexes[name].create(bind=engine, checkfirst=True)
+
+    with SessionLocal() as s:
+        legacy = s.query(SavedSearch).filter(SavedSearch.name.is_(None)).all()
+        for ss in legacy:
+            name, filters = parse_legacy_query(ss.query)
+            ss.set_spec(name, filters)
+        if legacy:
+            s.commit()
+            print(f"[DB] Migradas {len(legacy)} búsquedas a filtros estructurados")
+
 
 def init_db():
     Base.metadata.create_all(engine)
+    _migrate()
 
 
 def ensure_user(user_id: int, username: str):
@@ -40,3 +203,398 @@ def ensure_user(user_id: int, username: str):
             s.add(u)
             s.commit()
         return u
+
+
+def set_user_active(user_id: int, username: str, active: bool) -> None:
+    with SessionLocal() as s:
+        u = s.get(User, user_id)
+        if not u:
+            s.add(User(id=user_id, username=username, active=active))
+        else:
+            if active and not u.active:
+                # Reactivado: sus búsquedas no esperan al plan que tenían al pararlas
+                s.query(SavedSearch).filter(SavedSearch.user_id == user_id).update(
+                    {SavedSearch.poll_interval: None, SavedSearch.next_due_at: None})
+            u.active = active
+        s.commit()
+
+
+# ======================
+# Búsquedas guardadas (handlers del bot)
+# ======================
+# Las filas se devuelven desligadas de la sesión, con sus columnas ya cargadas
+def list_searches(user_id: int) -> List[SavedSearch]:
+    with SessionLocal() as s:
+        return s.query(SavedSearch).filter_by(user_id=user_id).order_by(SavedSearch.id).all()
+
+
+def get_search(search_id: int, user_id: int) -> Optional[SavedSearch]:
+    with SessionLocal() as s:
+        ss = s.get(SavedSearch, search_id)
+        return ss if ss and ss.user_id == user_id else None
+
+
+def delete_search(search_id: int, user_id: int) -> bool:
+    with SessionLocal() as s:
+        ss = s.get(SavedSearch, search_id)
+        if not ss or ss.user_id != user_id:
+            return False
+        s.delete(ss)
+        s.commit()
+        return True
+
+
+def toggle_search(search_id: int, user_id: int) -> Optional[SavedSearch]:
+    with SessionLocal(expire_on_commit=False) as s:
+        ss = s.get(SavedSearch, search_id)
+        if not ss or ss.user_id != user_id:
+            return None
+        ss.active = not ss.active
+        if ss.active:
+            ss.reset_poll()   # reactivada: toca ya, no cuando la dejó el backoff
+        s.commit()
+        return ss
+
+
+def save_search(user_id: int, username: str, name: str, filters: Dict[str, Any],
+                search_id: Optional[int] = None) -> Optional[SavedSearch]:
+    """Crea una búsqueda o edita la existente `search_id`. None si no existe."""
+    with SessionLocal(expire_on_commit=False) as s:
+        if not s.get(User, user_id):
+            s.add(User(id=user_id, username=username, active=True))
+        if search_id:
+            ss = s.get(SavedSearch, search_id)
+            if not ss or ss.user_id != user_id:
+                return None
+        else:
+            ss = SavedSearch(user_id=user_id, version=0)
+            s.add(ss)
+        ss.set_spec(name, filters)
+        s.commit()
+        return ss
+
+
+def active_search_rows() -> List[Tuple]:
+    """(id, user_id, version, name, filters_json, poll_interval, next_due_at) de búsquedas activas de usuarios activos."""
+    with SessionLocal() as s:
+        return (
+            s.query(SavedSearch.id, SavedSearch.user_id, SavedSearch.version,
+                    SavedSearch.name, SavedSearch.filters_json,
+                    SavedSearch.poll_interval, SavedSearch.next_due_at)
+            .join(User, User.id == SavedSearch.user_id)
+            .filter(SavedSearch.active.is_(True), User.active.is_(True))
+            .all()
+        )
+
+
+def save_poll_state(rows: List[Tuple[int, float, float]]) -> None:
+    """Persiste (id, intervalo, próxima ejecución) del planificador en bloque."""
+    if not rows:
+        return
+    with SessionLocal() as s:
+        s.execute(update(SavedSearch), [
+            {"id": sid, "poll_interval": interval, "next_due_at": next_due} for sid, interval, next_due in rows
+        ])
+        s.commit()
+
+
+def _insert_ignore(s, model, values: List[Dict[str, Any]]) -> None:
+    """INSERT ignorando duplicados de clave (SQLite/Postgres); merge fila a fila en el resto."""
+    dialect = s.bind.dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        dialect_insert = None
+
+    if dialect_insert is not None:
+        s.execute(dialect_insert(model).on_conflict_do_nothing(), values)
+    else:
+        for v in values:
+            s.merge(model(**v))
+
+
+# ======================
+# Items vistos
+# ======================
+def seen_known(search_id: int, item_ids: Iterable[str]) -> Set[str]:
+    """Devuelve el subconjunto de item_ids ya vistos para la búsqueda."""
+    item_ids = list(item_ids)
+    known: Set[str] = set()
+    with SessionLocal() as s:
+        for i in range(0, len(item_ids), 500):   # límite de variables de SQLite
+            chunk = item_ids[i:i + 500]
+            rows = s.execute(
+                select(SeenItem.item_id).where(SeenItem.search_id == search_id, SeenItem.item_id.in_(chunk))
+            )
+            known.update(r[0] for r in rows)
+    return known
+
+
+def seen_touch(rows: List[Tuple[int, str]], ts: int) -> None:
+    """Pone last_seen = `ts` a los (search_id, item_id) que siguen apareciendo, en una transacción."""
+    if not rows:
+        return
+    by_search: Dict[int, List[str]] = {}
+    for sid, iid in rows:
+        by_search.setdefault(sid, []).append(iid)
+    with SessionLocal() as s:
+        for sid, iids in by_search.items():
+            for i in range(0, len(iids), 500):   # límite de variables de SQLite
+                s.execute(update(SeenItem)
+                          .where(SeenItem.search_id == sid, SeenItem.item_id.in_(iids[i:i + 500]))
+                          .values(last_seen=ts))
+        s.commit()
+
+
+def seen_prune(older_than: int) -> int:
+    """Borra entradas que no aparecen desde antes de `older_than` (epoch). Devuelve cuántas.
+
+    Se mira last_seen, no first_seen: un anuncio que sigue publicado no caduca
+    (si caducara, se volvería a notificar a todas sus búsquedas).
+    """
+    with SessionLocal() as s:
+        res = s.execute(delete(SeenItem).where(SeenItem.last_seen < older_than))
+        s.commit()
+        return res.rowcount or 0
+
+
+# ======================
+# Outbox de notificaciones
+# ======================
+def outbox_enqueue(rows: List[Dict[str, Any]], delay: float = 0.0) -> int:
+    """Encola notificaciones y las marca como vistas en la misma transacción.
+
+    `rows` = [{chat_id, search_id, item_id, payload}]. Si algo falla no se
+    escribe nada y los items se vuelven a detectar en la siguiente pasada.
+    `delay` retrasa el primer envío (ventana de resumen).
+    """
+    if not rows:
+        return 0
+    now = time.time()
+    with SessionLocal() as s:
+        _insert_ignore(s, OutboxItem, [
+            {**r, "status": "pending", "attempts": 0, "next_attempt_at": now + delay, "created_at": now}
+            for r in rows
+        ])
+        _insert_ignore(s, SeenItem, [
+            {"search_id": r["search_id"], "item_id": r["item_id"], "first_seen": int(now), "last_seen": int(now)}
+            for r in rows
+        ])
+        s.commit()
+    return len(rows)
+
+
+def outbox_claim(limit: int, now: float = None, whole_chats: bool = False) -> List[Any]:
+    """Reserva hasta `limit` filas pendientes y vencidas (status -> sending), en orden de llegada.
+
+    Con `whole_chats`, en cuanto vence una fila de un chat se reservan también
+    las nuevas aún en ventana de ese chat, para mandarlas juntas.
+    Devuelve filas (id, chat_id, search_id, item_id, payload, attempts).
+    """
+    now = time.time() if now is None else now
+    cols = (OutboxItem.id, OutboxItem.chat_id, OutboxItem.search_id, OutboxItem.item_id,
+            OutboxItem.payload, OutboxItem.attempts)
+    due = (OutboxItem.status == "pending") & (OutboxItem.next_attempt_at <= now)
+    with SessionLocal() as s:
+        if whole_chats:
+            chats = select(OutboxItem.chat_id).where(due).distinct().limit(limit).scalar_subquery()
+            query = select(*cols).where(
+                OutboxItem.status == "pending",
+                OutboxItem.chat_id.in_(chats),
+                (OutboxItem.attempts == 0) | (OutboxItem.next_attempt_at <= now),
+            )
+        else:
+            query = select(*cols).where(due)
+        rows = s.execute(query.order_by(OutboxItem.id).limit(limit)).all()
+        if rows:
+            s.execute(
+                update(OutboxItem)
+                .where(OutboxItem.id.in_([r.id for r in rows]), OutboxItem.status == "pending")
+                .values(status="sending", claimed_at=now)
+            )
+            s.commit()
+        return rows
+
+
+def outbox_mark_sent(ids: List[int]) -> None:
+    if not ids:
+        return
+    with SessionLocal() as s:
+        s.execute(update(OutboxItem).where(OutboxItem.id.in_(ids)).values(status="sent", sent_at=time.time()))
+        s.commit()
+
+
+def outbox_retry(rows: List[Tuple[int, int, float]], give_up: List[Tuple[int, int]] = ()) -> None:
+    """Devuelve filas a pending (id, intentos, próximo intento epoch) o las da por fallidas (id, intentos)."""
+    if not rows and not give_up:
+        return
+    with SessionLocal() as s:
+        values = [
+            {"id": oid, "status": "pending", "attempts": attempts, "next_attempt_at": at, "claimed_at": None}
+            for oid, attempts, at in rows
+        ]
+        values += [
+            {"id": oid, "status": "failed", "attempts": attempts, "next_attempt_at": 0.0, "claimed_at": None}
+            for oid, attempts in give_up
+        ]
+        s.execute(update(OutboxItem), values)
+        s.commit()
+
+
+def outbox_reclaim(claimed_before: float) -> int:
+    """Devuelve a pending las reservas anteriores a `claimed_before` (p. ej. tras una caída)."""
+    with SessionLocal() as s:
+        res = s.execute(
+            update(OutboxItem)
+            .where(OutboxItem.status == "sending", OutboxItem.claimed_at < claimed_before)
+            .values(status="pending", claimed_at=None)
+        )
+        s.commit()
+        return res.rowcount or 0
+
+
+def outbox_prune(sent_before: float) -> int:
+    """Borra filas ya entregadas antes de `sent_before` (epoch)."""
+    with SessionLocal() as s:
+        res = s.execute(delete(OutboxItem).where(OutboxItem.status == "sent", OutboxItem.sent_at < sent_before))
+        s.commit()
+        return res.rowcount or 0
+
+
+def outbox_counts() -> Dict[str, int]:
+    with SessionLocal() as s:
+        rows = s.execute(select(OutboxItem.status, func.count()).group_by(OutboxItem.status))
+        return {status: n for status, n in rows}
+
+
+# ======================
+# Cola de descargas (modo split)
+# ======================
+def job_submit(query: str, filters: Dict[str, Any], search_ids: List[int]) -> int:
+    with SessionLocal() as s:
+        job = ScrapeJob(query=query, filters_json=json.dumps(filters or {}, ensure_ascii=False, sort_keys=True),
+                        search_ids=json.dumps(list(search_ids)), status="pending", created_at=time.time())
+        s.add(job)
+        s.commit()
+        return job.id
+
+
+def job_claim(worker_id: str) -> Optional[Tuple[int, str, Dict[str, Any]]]:
+    """Reserva el trabajo pendiente más antiguo para `worker_id`: (id, query, filtros) o None.
+
+    Un solo UPDATE condicionado a status='pending': si dos workers van a por
+    la misma fila, solo uno la consigue.
+    """
+    now = time.time()
+    with SessionLocal() as s:
+        oldest = (
+            select(ScrapeJob.id).where(ScrapeJob.status == "pending")
+            .order_by(ScrapeJob.id).limit(1).scalar_subquery()
+        )
+        res = s.execute(
+            update(ScrapeJob)
+            .where(ScrapeJob.id == oldest, ScrapeJob.status == "pending")
+            .values(status="running", worker_id=worker_id, claimed_at=now, heartbeat_at=now,
+                    attempts=ScrapeJob.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+        s.commit()
+        if not res.rowcount:
+            return None
+        row = s.execute(
+            select(ScrapeJob.id, ScrapeJob.query, ScrapeJob.filters_json)
+            .where(ScrapeJob.status == "running", ScrapeJob.worker_id == worker_id, ScrapeJob.claimed_at == now)
+            .order_by(ScrapeJob.id.desc()).limit(1)
+        ).first()
+        if row is None:
+            return None
+        return row.id, row.query, json.loads(row.filters_json or "{}")
+
+
+def job_heartbeat(job_id: int, worker_id: str) -> bool:
+    """Renueva la reserva. False si el trabajo ya no es de este worker (se reclamó)."""
+    with SessionLocal() as s:
+        res = s.execute(
+            update(ScrapeJob)
+            .where(ScrapeJob.id == job_id, ScrapeJob.worker_id == worker_id, ScrapeJob.status == "running")
+            .values(heartbeat_at=time.time())
+        )
+        s.commit()
+        return bool(res.rowcount)
+
+
+def job_finish(job_id: int, worker_id: str, result: Optional[List[Dict[str, Any]]] = None,
+               error: Optional[str] = None) -> bool:
+    """Guarda el resultado (o el error) si el trabajo sigue siendo de este worker."""
+    with SessionLocal() as s:
+        res = s.execute(
+            update(ScrapeJob)
+            .where(ScrapeJob.id == job_id, ScrapeJob.worker_id == worker_id, ScrapeJob.status == "running")
+            .values(status="failed" if error else "done", finished_at=time.time(), error=error,
+                    result_json=None if error else json.dumps(result or [], ensure_ascii=False))
+        )
+        s.commit()
+        return bool(res.rowcount)
+
+
+def job_release(job_id: int, worker_id: str) -> None:
+    """Devuelve a la cola un trabajo que el worker no va a terminar (parada ordenada)."""
+    with SessionLocal() as s:
+        s.execute(
+            update(ScrapeJob)
+            .where(ScrapeJob.id == job_id, ScrapeJob.worker_id == worker_id, ScrapeJob.status == "running")
+            .values(status="pending", worker_id=None, claimed_at=None, heartbeat_at=None,
+                    attempts=ScrapeJob.attempts - 1)
+        )
+        s.commit()
+
+
+def job_collect(ids: List[int]) -> Dict[int, Tuple[str, Optional[str], Optional[str]]]:
+    """Recoge y borra los trabajos terminados de `ids`: {id: (status, result_json, error)}."""
+    if not ids:
+        return {}
+    with SessionLocal() as s:
+        rows = s.execute(
+            select(ScrapeJob.id, ScrapeJob.status, ScrapeJob.result_json, ScrapeJob.error)
+            .where(ScrapeJob.id.in_(ids), ScrapeJob.status.in_(("done", "failed")))
+        ).all()
+        if rows:
+            s.execute(delete(ScrapeJob).where(ScrapeJob.id.in_([r.id for r in rows])))
+            s.commit()
+        return {r.id: (r.status, r.result_json, r.error) for r in rows}
+
+
+def job_cancel(ids: List[int]) -> None:
+    """Borra trabajos que ya nadie espera (pendientes o terminados)."""
+    if not ids:
+        return
+    with SessionLocal() as s:
+        s.execute(delete(ScrapeJob).where(ScrapeJob.id.in_(ids), ScrapeJob.status != "running"))
+        s.commit()
+
+
+def job_reclaim(stale_before: float, max_attempts: int) -> Tuple[int, int]:
+    """Reencola trabajos sin latido desde `stale_before` o los da por fallidos. Devuelve (reencolados, fallidos)."""
+    with SessionLocal() as s:
+        stale = (ScrapeJob.status == "running") & (ScrapeJob.heartbeat_at < stale_before)
+        failed = s.execute(
+            update(ScrapeJob).where(stale, ScrapeJob.attempts >= max_attempts)
+            .values(status="failed", finished_at=time.time(), error="worker sin latido")
+        ).rowcount or 0
+        requeued = s.execute(
+            update(ScrapeJob).where(stale)
+            .values(status="pending", worker_id=None, claimed_at=None, heartbeat_at=None)
+        ).rowcount or 0
+        # Terminados que nadie recogió (el scheduler dejó de esperarlos)
+        s.execute(delete(ScrapeJob).where(ScrapeJob.status.in_(("done", "failed")),
+                                          ScrapeJob.finished_at < stale_before - 3600))
+        s.commit()
+        return requeued, failed
+
+
+def job_counts() -> Dict[str, int]:
+    with SessionLocal() as s:
+        rows = s.execute(select(ScrapeJob.status, func.count()).group_by(ScrapeJob.status))
+        return {status: n for status, n in rows}
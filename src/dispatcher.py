@@ -0,0 +1,208 @@
+# dispatcher.py
+import os
+import time
+import asyncio
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Optional
+
+from telegram.error import BadRequest, Forbidden
+
+from metrics import TG_SEND_SECONDS, TG_MESSAGES
+
+# ===== Config (límites de Telegram) =====
+TG_GLOBAL_RATE   = float(os.getenv("TG_GLOBAL_RATE", "25"))    # msg/s para todo el bot (límite ~30)
+TG_CHAT_RATE     = float(os.getenv("TG_CHAT_RATE", "1"))       # msg/s por chat
+TG_CHAT_BURST    = float(os.getenv("TG_CHAT_BURST", "3"))      # ráfaga permitida por chat
+TG_SEND_WORKERS  = int(os.getenv("TG_SEND_WORKERS", "8"))
+TG_MAX_RETRIES   = int(os.getenv("TG_MAX_RETRIES", "5"))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = max(rate, 0.001)
+        self.burst = max(burst, 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0       # RetryAfter de Telegram
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: Optional[float] = None) -> float:
+        """Segundos hasta que haya un token disponible (0 = ya)."""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def take(self) -> None:
+        self._refill(time.monotonic())
+        self.tokens -= 1
+
+    def block(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+@dataclass
+class _Msg:
+    chat_id: int
+    kwargs: Dict[str, Any]
+    future: asyncio.Future
+    submitted: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+
+
+def _retry_after_seconds(exc: Exception) -> Optional[float]:
+    ra = getattr(exc, "retry_after", None)
+    if ra is None:
+        return None
+    return ra.total_seconds() if hasattr(ra, "total_seconds") else float(ra)
+
+
+class Dispatcher:
+    """Envío de mensajes de Telegram desacoplado del scraping.
+
+    Una cola por chat (se respeta el orden dentro de cada chat), varios
+    workers concurrentes y token buckets global y por chat. Los RetryAfter
+    pausan solo el chat afectado y el mensaje se reintenta.
+    """
+
+    def __init__(self, bot, workers: int = TG_SEND_WORKERS, global_rate: float = TG_GLOBAL_RATE,
+                 chat_rate: float = TG_CHAT_RATE, chat_burst: float = TG_CHAT_BURST,
+                 max_retries: int = TG_MAX_RETRIES):
+        self.bot = bot
+        self.workers = max(1, workers)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate)
+        self._global_lock = asyncio.Lock()
+        self._chats: Dict[int, Deque[_Msg]] = {}
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._scheduled: set = set()     # chats en la cola de listos o esperando turno
+        self._active: set = set()        # chats que un worker está enviando ahora
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._tasks = []
+        self._latencies: Deque[float] = deque(maxlen=1000)
+        self._stats = {"submitted": 0, "sent": 0, "failed": 0, "retries": 0, "retry_after": 0}
+
+    # ---- ciclo de vida ----
+    async def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # ---- API ----
+    def submit(self, chat_id: int, text: str, **kwargs) -> asyncio.Future:
+        """Encola un mensaje. El future se resuelve al enviarse o falla con la excepción final."""
+        fut = asyncio.get_running_loop().create_future()
+        self._chats.setdefault(chat_id, deque()).append(_Msg(chat_id, {"text": text, **kwargs}, fut))
+        self._stats["submitted"] += 1
+        self._schedule(chat_id)
+        return fut
+
+    def _schedule(self, chat_id: int, delay: float = 0.0) -> None:
+        if chat_id in self._scheduled or chat_id in self._active:
+            return
+        self._scheduled.add(chat_id)
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._ready.put_nowait, chat_id)
+        else:
+            self._ready.put_nowait(chat_id)
+
+    # ---- workers ----
+    async def _acquire_global(self) -> None:
+        async with self._global_lock:
+            while True:
+                wait = self._global.delay()
+                if wait <= 0:
+                    self._global.take()
+                    return
+                await asyncio.sleep(wait)
+
+    async def _worker(self) -> None:
+        while True:
+            chat_id = await self._ready.get()
+            self._scheduled.discard(chat_id)
+            queue = self._chats.get(chat_id)
+            if not queue:
+                self._chats.pop(chat_id, None)
+                continue
+
+            bucket = self._buckets.get(chat_id)
+            if bucket is None:
+                bucket = self._buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            wait = bucket.delay()
+            if wait > 0:
+                self._schedule(chat_id, wait)
+                continue
+
+            msg = queue.popleft()
+            bucket.take()
+            self._active.add(chat_id)
+            try:
+                await self._acquire_global()
+                with TG_SEND_SECONDS.time():
+                    await self.bot.send_message(chat_id=chat_id, **msg.kwargs)
+            except asyncio.CancelledError:
+                queue.appendleft(msg)
+                raise
+            except Exception as e:
+                self._on_error(msg, queue, bucket, e)
+            else:
+                self._stats["sent"] += 1
+                TG_MESSAGES.inc(result="sent")
+                self._latencies.append(time.monotonic() - msg.submitted)
+                if not msg.future.done():
+                    msg.future.set_result(True)
+            finally:
+                self._active.discard(chat_id)
+
+            if queue:
+                self._schedule(chat_id)
+            else:
+                self._chats.pop(chat_id, None)
+
+    def _on_error(self, msg: _Msg, queue: Deque[_Msg], bucket: TokenBucket, exc: Exception) -> None:
+        msg.attempts += 1
+        retry_after = _retry_after_seconds(exc)
+        permanent = isinstance(exc, (Forbidden, BadRequest)) and retry_after is None
+        if permanent or msg.attempts > self.max_retries:
+            self._stats["failed"] += 1
+            TG_MESSAGES.inc(result="failed")
+            print(f"[SEND] Fallo definitivo a {msg.chat_id} tras {msg.attempts} intentos: {exc}")
+            if not msg.future.done():
+                msg.future.set_exception(exc)
+            return
+
+        self._stats["retries"] += 1
+        TG_MESSAGES.inc(result="retry")
+        if retry_after is not None:
+            self._stats["retry_after"] += 1
+            TG_MESSAGES.inc(result="retry_after")
+            bucket.block(retry_after)
+        else:
+            bucket.block(min(60.0, 2 ** msg.attempts))   # backoff exponencial
+        queue.appendleft(msg)
+
+    # ---- métricas ----
+    def queue_depth(self) -> int:
+        return sum(len(q) for q in self._chats.values())
+
+    def stats(self) -> Dict[str, Any]:
+        lat = sorted(self._latencies)
+        p = lambda q: round(lat[min(len(lat) - 1, int(len(lat) * q))] * 1000, 1) if lat else 0.0
+        return {
+            **self._stats,
+            "queue_depth": self.queue_depth(),
+            "chats_pending": len(self._chats),
+            "latency_ms_p50": p(0.5),
+            "latency_ms_p95": p(0.95),
+        }
@@ -0,0 +1,155 @@
+# hot_tabs.py
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+from playwright.async_api import Page
+
+# ===== Config =====
+HOT_TABS     = int(os.getenv("WALLA_HOT_TABS", "0"))          # pestañas dedicadas máx.; 0 = modo desactivado
+HOT_IDLE_SEC = float(os.getenv("WALLA_HOT_IDLE_SEC", "300"))  # sin usar este tiempo => se cierra
+HOT_MIN_HITS = int(os.getenv("WALLA_HOT_MIN_HITS", "2"))      # usos dentro de HOT_IDLE_SEC para abrirle pestaña
+
+T = TypeVar("T")
+
+
+class _Tab:
+    __slots__ = ("page", "tag", "lock", "last_used", "checks")
+
+    def __init__(self, page: Page, tag: Hashable = None):
+        self.page = page
+        self.tag = tag
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+        self.checks = 0
+
+
+class HotTabs:
+    """Pestañas dedicadas por búsqueda que se refrescan en sitio.
+
+    Una clave (URL de búsqueda) pasa a tener pestaña propia cuando se usa
+    `min_hits` veces en `idle_sec`. Las pestañas sin uso en `idle_sec` se
+    cierran y, si se supera el presupuesto `max_tabs`, se cierra la usada
+    hace más tiempo. Las páginas salen de `open_page` y no cuentan en el
+    préstamo del pool; si su navegador se recicla, se reabren.
+    """
+
+    def __init__(self, open_page: Callable[[], Awaitable[Page]], max_tabs: int = HOT_TABS,
+                 idle_sec: float = HOT_IDLE_SEC, min_hits: int = HOT_MIN_HITS):
+        self.open_page = open_page
+        self.max_tabs = max_tabs
+        self.idle_sec = idle_sec
+        self.min_hits = max(1, min_hits)
+        self._tabs: "OrderedDict[str, _Tab]" = OrderedDict()
+        self._hits: Dict[str, list] = {}
+        self._stats = {"opens": 0, "checks": 0, "reopens": 0, "retagged": 0, "evicted_idle": 0,
+                       "evicted_budget": 0, "failures": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_tabs > 0
+
+    def _is_hot(self, key: str, now: float) -> bool:
+        hits = [t for t in self._hits.get(key, []) if now - t < self.idle_sec] + [now]
+        self._hits[key] = hits[-self.min_hits:]
+        return len(hits) >= self.min_hits
+
+    async def _close(self, tab: _Tab) -> None:
+        try:
+            await tab.page.close()
+        except Exception:
+            pass
+
+    async def _evict(self, now: float) -> None:
+        for key in [k for k, t in self._tabs.items() if now - t.last_used > self.idle_sec and not t.lock.locked()]:
+            self._stats["evicted_idle"] += 1
+            await self._close(self._tabs.pop(key))
+        for key in [k for k, ts in self._hits.items() if now - ts[-1] > self.idle_sec]:
+            del self._hits[key]
+        while len(self._tabs) > self.max_tabs:
+            key, tab = next(((k, t) for k, t in self._tabs.items() if not t.lock.locked()), (None, None))
+            if key is None:
+                break
+            self._stats["evicted_budget"] += 1
+            await self._close(self._tabs.pop(key))
+
+    async def run(self, key: str, check: Callable[[Page, bool], Awaitable[T]],
+                  tag: Hashable = None) -> Optional[T]:
+        """Ejecuta `check(page, nueva)` en la pestaña de `key`.
+
+        Con `nueva=True` la pestaña está en blanco y `check` hace la primera
+        navegación. Si `tag` no es el de la pestaña abierta, esta se cierra y
+        se abre otra (estado de página limpio). Devuelve None si la clave aún
+        no es "caliente" o si la pestaña falla: el llamador usa el camino normal.
+        """
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        tab = self._tabs.get(key)
+        if tab is None and not self._is_hot(key, now):
+            return None
+        await self._evict(now)
+
+        first = False
+        if tab is not None and tab.tag != tag:
+            if tab.lock.locked():
+                return None   # en uso con el tag anterior: esta vez, camino normal
+            self._stats["retagged"] += 1
+            del self._tabs[key]
+            await self._close(tab)
+            tab = None
+        if tab is None or tab.page.is_closed():
+            if tab is not None:
+                self._stats["reopens"] += 1   # navegador reciclado o caído
+            try:
+                page = await self.open_page()
+            except Exception as e:
+                print(f"[HOT] No se pudo abrir pestaña: {e}")
+                self._stats["failures"] += 1
+                return None
+            tab = self._tabs[key] = _Tab(page, tag)
+            self._stats["opens"] += 1
+            first = True
+            await self._evict(now)   # hueco para la nueva dentro del presupuesto
+            if key not in self._tabs:
+                await self._close(tab)
+                return None
+        self._tabs.move_to_end(key)
+
+        async with tab.lock:
+            tab.last_used = time.monotonic()
+            try:
+                result = await check(tab.page, first)
+            except Exception as e:
+                self._stats["failures"] += 1
+                print(f"[HOT] Pestaña de {key[:80]} descartada: {e}")
+                if self._tabs.get(key) is tab:
+                    del self._tabs[key]
+                await self._close(tab)
+                return None
+            tab.checks += 1
+            self._stats["checks"] += 1
+            return result
+
+    async def apply(self, key: str, fn: Callable[[Page], Awaitable[Any]], tag: Hashable = None) -> bool:
+        """Ejecuta `fn(page)` en la pestaña de `key` si sigue abierta con `tag`. False si no o si falla."""
+        tab = self._tabs.get(key)
+        if tab is None or tab.tag != tag or tab.page.is_closed():
+            return False
+        async with tab.lock:
+            try:
+                await fn(tab.page)
+            except Exception as e:
+                print(f"[HOT] Error en pestaña de {key[:80]}: {e}")
+                return False
+        return True
+
+    async def close(self) -> None:
+        tabs, self._tabs = list(self._tabs.values()), OrderedDict()
+        for tab in tabs:
+            await self._close(tab)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "open": len(self._tabs), "budget": self.max_tabs}
@@ -0,0 +1,57 @@
+# http_engine.py
+import os
+import time
+import asyncio
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# ===== Config =====
+HTTP_TIMEOUT   = float(os.getenv("WALLA_HTTP_TIMEOUT", "8.0"))
+HTTP_POOL_SIZE = int(os.getenv("WALLA_HTTP_POOL_SIZE", "16"))   # conexiones keep-alive por host
+
+
+@dataclass
+class HttpResult:
+    status: int
+    text: str
+    elapsed_ms: float
+    error: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return not self.error and 200 <= self.status < 300
+
+
+# ===== Sesión compartida (pool de conexiones + keep-alive) =====
+_session: Optional[requests.Session] = None
+
+def _get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        s = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+        s.mount("http://", adapter)
+        s.mount("https://", adapter)
+        _session = s
+    return _session
+
+def _get_sync(url: str, headers: Dict[str, str], timeout: float) -> HttpResult:
+    t0 = time.perf_counter()
+    try:
+        r = _get_session().get(url, headers=headers, timeout=timeout)
+        return HttpResult(r.status_code, r.text, (time.perf_counter() - t0) * 1000)
+    except requests.RequestException as e:
+        return HttpResult(0, "", (time.perf_counter() - t0) * 1000, error=str(e) or type(e).__name__)
+
+async def get(url: str, headers: Optional[Dict[str, str]] = None, timeout: float = HTTP_TIMEOUT) -> HttpResult:
+    """GET sin bloquear el event loop (requests corre en un hilo del executor)."""
+    return await asyncio.to_thread(_get_sync, url, headers or {}, timeout)
+
+def close() -> None:
+    global _session
+    if _session is not None:
+        _session.close()
+        _session = None
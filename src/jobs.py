@@ -0,0 +1,102 @@
+# jobs.py
+import os
+import json
+import time
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from db import run, job_submit, job_collect, job_cancel, job_reclaim, job_counts
+
+# ===== Config (modo split) =====
+SCRAPER_MODE       = os.getenv("SCRAPER_MODE", "inline").lower()   # inline | split
+JOB_POLL_SEC       = float(os.getenv("JOB_POLL_SEC", "0.5"))
+JOB_WAIT_SEC       = float(os.getenv("JOB_WAIT_SEC", "180"))       # espera máx. por un resultado
+JOB_STALE_SEC      = float(os.getenv("JOB_STALE_SEC", "60"))       # sin latido => se reencola
+JOB_MAX_ATTEMPTS   = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_CONCURRENCY    = int(os.getenv("JOB_CONCURRENCY", "32"))      # trabajos en vuelo a la vez (>= workers x WORKER_CONCURRENCY)
+
+
+class JobError(Exception):
+    pass
+
+
+class JobClient:
+    """Lado del scheduler: encola descargas en `scrape_jobs` y espera sus resultados.
+
+    Un único bucle consulta todos los trabajos en curso de una vez y resuelve
+    los futures; también reencola los trabajos de workers que dejaron de latir.
+    """
+
+    def __init__(self, poll_sec: float = JOB_POLL_SEC, wait_sec: float = JOB_WAIT_SEC):
+        self.poll_sec = poll_sec
+        self.wait_sec = wait_sec
+        self._waiting: Dict[int, asyncio.Future] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"submitted": 0, "done": 0, "failed": 0, "timeouts": 0, "requeued": 0}
+        self._latencies: List[float] = []
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._poll_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def fetch(self, query: str, filters: Dict[str, Any], search_ids: List[int]) -> List[dict]:
+        """Encola la descarga y devuelve los items en bruto cuando un worker la termina."""
+        self.start()
+        t0 = time.monotonic()
+        job_id = await run(job_submit, query, filters, search_ids)
+        fut = asyncio.get_running_loop().create_future()
+        self._waiting[job_id] = fut
+        self._stats["submitted"] += 1
+        try:
+            status, result_json, error = await asyncio.wait_for(fut, timeout=self.wait_sec)
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            await run(job_cancel, [job_id])
+            raise JobError(f"trabajo {job_id} sin resultado tras {self.wait_sec:.0f}s")
+        finally:
+            self._waiting.pop(job_id, None)
+        if status != "done":
+            self._stats["failed"] += 1
+            raise JobError(f"trabajo {job_id} fallido: {error}")
+        self._stats["done"] += 1
+        self._latencies = (self._latencies + [time.monotonic() - t0])[-500:]
+        return json.loads(result_json or "[]")
+
+    async def _poll_loop(self) -> None:
+        last_reclaim = 0.0
+        while True:
+            try:
+                if self._waiting:
+                    for job_id, res in (await run(job_collect, list(self._waiting))).items():
+                        fut = self._waiting.get(job_id)
+                        if fut is not None and not fut.done():
+                            fut.set_result(res)
+                if time.monotonic() - last_reclaim >= JOB_STALE_SEC / 2:
+                    last_reclaim = time.monotonic()
+                    requeued, failed = await run(job_reclaim, time.time() - JOB_STALE_SEC, JOB_MAX_ATTEMPTS)
+                    self._stats["requeued"] += requeued
+                    if requeued or failed:
+                        print(f"[JOBS] Trabajos sin latido: {requeued} reencolados, {failed} fallidos")
+            except Exception as e:
+                print("[JOBS] Error consultando trabajos:", e)
+            await asyncio.sleep(self.poll_sec)
+
+    async def stats(self) -> Dict[str, Any]:
+        lat = sorted(self._latencies)
+        counts = await run(job_counts)
+        return {
+            **self._stats,
+            "waiting": len(self._waiting),
+            "pending": counts.get("pending", 0),
+            "running": counts.get("running", 0),
+            "latency_sec_p50": round(lat[len(lat) // 2], 2) if lat else 0.0,
+        }
+
+
+job_client = JobClient()
@@ -0,0 +1,171 @@
+# match_index.py
+import bisect
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from wallapop import CompiledSearchFilter, _title_norm
+
+
+def url_scope(filters: Dict[str, Any]) -> tuple:
+    """Filtros de URL que no se pueden comprobar en local (el radio).
+
+    Un item descargado con un ámbito vale para cualquier búsqueda del mismo
+    ámbito; precio, envío y palabras se comprueban en el propio item.
+    """
+    return (filters.get("km"),)
+
+
+@dataclass
+class _Entry:
+    compiled: CompiledSearchFilter
+    version: int
+    tokens: frozenset
+    scope: tuple
+
+
+class MatchIndex:
+    """Índice inverso de búsquedas guardadas (estilo percolator).
+
+    Cada item se enruta de una vez a todas las búsquedas cuyas reglas cumple:
+    tokens (estricto/flexible), rango de precio, envío y palabras a omitir.
+
+    Solo se consideran las búsquedas del mismo ámbito de URL (`url_scope`)
+    que la descarga de la que sale el item.
+
+    Los tokens se comparan como subcadena del título normalizado, igual que
+    `CompiledSearchFilter`. Como los tokens no tienen espacios, basta con
+    buscar en el índice las subcadenas de cada palabra del título.
+    """
+
+    def __init__(self):
+        self._entries: Dict[int, _Entry] = {}
+        self._by_token: Dict[str, Set[int]] = {}
+        self._tokenless: Set[int] = set()
+        self._by_scope: Dict[tuple, Set[int]] = {}
+        self._shipping_only: Set[int] = set()
+        self._by_min: List[Tuple[float, int]] = []   # ordenado por min
+        self._by_max: List[Tuple[float, int]] = []   # ordenado por max
+        self._max_token_len = 0
+
+    # ---- mantenimiento incremental ----
+    def upsert(self, search_id: int, compiled: CompiledSearchFilter, version: int = 0,
+               scope: tuple = (None,)) -> None:
+        current = self._entries.get(search_id)
+        if current is not None:
+            if current.version == version and current.scope == scope:
+                return
+            self.remove(search_id)
+
+        entry = _Entry(compiled, version, frozenset(compiled.tokens), scope)
+        self._entries[search_id] = entry
+        self._by_scope.setdefault(scope, set()).add(search_id)
+        if entry.tokens:
+            for tok in entry.tokens:
+                self._by_token.setdefault(tok, set()).add(search_id)
+                self._max_token_len = max(self._max_token_len, len(tok))
+        else:
+            self._tokenless.add(search_id)
+        if compiled.shipping:
+            self._shipping_only.add(search_id)
+        if compiled.min is not None:
+            bisect.insort(self._by_min, (compiled.min, search_id))
+        if compiled.max is not None:
+            bisect.insort(self._by_max, (compiled.max, search_id))
+
+    def remove(self, search_id: int) -> None:
+        entry = self._entries.pop(search_id, None)
+        if entry is None:
+            return
+        for tok in entry.tokens:
+            ids = self._by_token.get(tok)
+            if ids is not None:
+                ids.discard(search_id)
+                if not ids:
+                    del self._by_token[tok]
+        self._tokenless.discard(search_id)
+        self._shipping_only.discard(search_id)
+        in_scope = self._by_scope.get(entry.scope)
+        if in_scope is not None:
+            in_scope.discard(search_id)
+            if not in_scope:
+                del self._by_scope[entry.scope]
+        cf = entry.compiled
+        if cf.min is not None:
+            self._remove_sorted(self._by_min, (cf.min, search_id))
+        if cf.max is not None:
+            self._remove_sorted(self._by_max, (cf.max, search_id))
+        if entry.tokens and max(map(len, entry.tokens)) >= self._max_token_len:
+            self._max_token_len = max(map(len, self._by_token), default=0)
+
+    @staticmethod
+    def _remove_sorted(lst: List[Tuple[float, int]], key: Tuple[float, int]) -> None:
+        i = bisect.bisect_left(lst, key)
+        if i < len(lst) and lst[i] == key:
+            del lst[i]
+
+    def sync(self, specs: Iterable) -> None:
+        """Deja el índice igual que la lista de búsquedas activas (id, version, filters, compiled)."""
+        live = set()
+        for spec in specs:
+            live.add(spec.id)
+            self.upsert(spec.id, spec.compiled, spec.version, url_scope(spec.filters))
+        for sid in [sid for sid in self._entries if sid not in live]:
+            self.remove(sid)
+
+    # ---- consulta ----
+    def _token_hits(self, t: str) -> Dict[int, int]:
+        matched: Set[str] = set()
+        maxlen = self._max_token_len
+        by_token = self._by_token
+        for word in set(t.split(" ")):
+            n = len(word)
+            for i in range(n - 1):
+                for j in range(i + 2, min(n, i + maxlen) + 1):
+                    sub = word[i:j]
+                    if sub in by_token:
+                        matched.add(sub)
+        hits: Dict[int, int] = {}
+        for tok in matched:
+            for sid in by_token[tok]:
+                hits[sid] = hits.get(sid, 0) + 1
+        return hits
+
+    def _price_excluded(self, price: float) -> Set[int]:
+        # min > precio: sufijo de _by_min · max < precio: prefijo de _by_max
+        out = {sid for _, sid in self._by_min[bisect.bisect_right(self._by_min, (price, float("inf"))):]}
+        out.update(sid for _, sid in self._by_max[:bisect.bisect_left(self._by_max, (price, -1))])
+        return out
+
+    def route(self, it: dict, scope: Optional[tuple] = None) -> Set[int]:
+        """Ids de las búsquedas (del ámbito `scope`, o de todos) que aceptan el item."""
+        if it.get("reserved"):
+            return set()
+        in_scope = self._by_scope.get(scope, set()) if scope is not None else None
+        if in_scope is not None and not in_scope:
+            return set()
+        t = _title_norm(it)
+
+        candidates = set(self._tokenless)
+        for sid, n in self._token_hits(t).items():
+            entry = self._entries[sid]
+            if n == len(entry.tokens) or (n and not entry.compiled.strict):
+                candidates.add(sid)
+        if in_scope is not None:
+            candidates &= in_scope
+        if not candidates:
+            return candidates
+
+        if not it.get("shipping"):
+            candidates -= self._shipping_only
+        candidates -= self._price_excluded(it["price"])
+        return {sid for sid in candidates if not self._entries[sid].compiled.has_omit(t)}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, search_id: int) -> bool:
+        return search_id in self._entries
+
+
+# Índice compartido por scheduler y bot (mismo proceso)
+match_index = MatchIndex()
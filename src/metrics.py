@@ -0,0 +1,194 @@
+# metrics.py
+import os
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# ===== Config =====
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))        # 0 = sin endpoint
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()      # el endpoint lee desde su propio hilo
+_registry: List["_Metric"] = []
+
+
+def _fmt_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, n: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0.0) + n
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        out = self._header()
+        for key, v in sorted(self._values.items()):
+            out.append(f"{self.name}{_fmt_labels(self.labelnames, key)} {_fmt_num(v)}")
+        return out
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, v: float, **labels) -> None:
+        with _lock:
+            self._values[self._key(labels)] = float(v)
+
+    def replace(self, values: Dict[Tuple[object, ...], float]) -> None:
+        """Sustituye todas las series a la vez (claves = valores de etiqueta en orden).
+
+        Para series por entidad (p. ej. por búsqueda): las que ya no existen desaparecen.
+        """
+        fresh = {tuple(str(x) for x in key): float(v) for key, v in values.items()}
+        with _lock:
+            self._values = fresh
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, v: float, **labels) -> None:
+        key = self._key(labels)
+        with _lock:
+            st = self._values.get(key)
+            if st is None:
+                st = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]   # cubos, suma, n
+            st[0][bisect.bisect_left(self.buckets, v)] += 1
+            st[1] += v
+            st[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """`with HIST.time(stage="goto"):` mide el bloque (también si contiene awaits)."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def render(self) -> List[str]:
+        out = self._header()
+        for key, (counts, total, n) in sorted(self._values.items()):
+            acc = 0
+            for le, c in zip(self.buckets + (float("inf"),), counts):
+                acc += c
+                le_txt = "+Inf" if le == float("inf") else _fmt_num(le)
+                extra = 'le="' + le_txt + '"'
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, extra)} {acc}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {_fmt_num(total)}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {n}")
+        return out
+
+
+def render() -> str:
+    """Todas las métricas en formato de texto de Prometheus."""
+    with _lock:
+        lines = [line for m in _registry for line in m.render()]
+    return "\n".join(lines) + "\n"
+
+
+# ===========================
+# Métricas del proyecto
+# ===========================
+# Scraping (wallapop.py)
+WALLA_STAGE_SECONDS = Histogram("walla_stage_seconds", "Duración de cada fase de una búsqueda en Wallapop",
+                                ["stage"])
+WALLA_FETCHES = Counter("walla_fetches_total", "Descargas por motor y resultado", ["engine", "outcome"])
+WALLA_ITEMS = Counter("walla_items_total", "Items crudos descargados y aceptados por los filtros", ["kind"])
+WALLA_BLOCKED_REQUESTS = Counter("walla_blocked_requests_total", "Peticiones del navegador abortadas por regla",
+                                 ["rule"])
+WALLA_BLOCKED_BYTES = Counter("walla_blocked_bytes_total", "Bytes ahorrados (estimados) por regla de bloqueo",
+                              ["rule"])
+WALLA_CACHE = Counter("walla_cache_total", "Consultas a la caché de resultados por resultado", ["result"])
+
+# Scheduler (scheduler.py)
+SCHED_STAGE_SECONDS = Histogram("sched_stage_seconds", "Duración de cada fase del ciclo del scheduler",
+                                ["stage"])
+SCHED_CYCLE_SECONDS = Histogram("sched_cycle_seconds", "Duración total de cada ciclo del scheduler")
+SCHED_SEARCHES = Counter("sched_searches_total", "Búsquedas ejecutadas")
+SCHED_ACTIVE_SEARCHES = Gauge("sched_active_searches", "Búsquedas activas cargadas")
+SCHED_SEARCH_INTERVAL = Gauge("sched_search_interval_seconds", "Intervalo adaptativo actual por búsqueda",
+                              ["search_id"])
+SCHED_SEARCH_HIT_RATE = Gauge("sched_search_hit_rate", "Fracción (suavizada) de ejecuciones con items nuevos",
+                              ["search_id"])
+
+# Notificaciones (scheduler.py / dispatcher.py)
+NOTIFY_ITEMS = Counter("notify_items_total", "Items nuevos por destino (outbox, entregados, descartados)",
+                       ["result"])
+TG_SEND_SECONDS = Histogram("tg_send_seconds", "Latencia de send_message en Telegram")
+TG_MESSAGES = Counter("tg_messages_total", "Mensajes de Telegram por resultado", ["result"])
+TG_QUEUE_DEPTH = Gauge("tg_queue_depth", "Mensajes esperando en el dispatcher")
+OUTBOX_ROWS = Gauge("outbox_rows", "Filas del outbox por estado", ["status"])
+
+ERRORS = Counter("errors_total", "Errores por punto de fallo", ["where"])
+
+
+# ===========================
+# Endpoint HTTP
+# ===========================
+_server_thread: Optional[threading.Thread] = None
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = METRICS_HOST) -> bool:
+    """Sirve GET /metrics con FastAPI+uvicorn en un hilo aparte (no toca el event loop del bot)."""
+    global _server_thread
+    if port <= 0 or _server_thread is not None:
+        return False
+    try:
+        import uvicorn
+        from fastapi import FastAPI
+        from fastapi.responses import PlainTextResponse
+    except ImportError as e:
+        print(f"[METRICS] Endpoint desactivado ({e})")
+        return False
+
+    app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    def metrics_endpoint():
+        return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
+
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning", access_log=False))
+    _server_thread = threading.Thread(target=server.run, name="metrics", daemon=True)
+    _server_thread.start()
+    print(f"📈 Métricas en http://{host}:{port}/metrics")
+    return True
@@ -0,0 +1,150 @@
+# planner.py
+import os
+import heapq
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# ===== Config =====
+_BASE = int(os.getenv("CHECK_INTERVAL_SEC", "10"))
+SEARCH_MIN_INTERVAL = float(os.getenv("SEARCH_MIN_INTERVAL_SEC", str(_BASE)))
+SEARCH_MAX_INTERVAL = float(os.getenv("SEARCH_MAX_INTERVAL_SEC", "600"))
+SEARCH_BACKOFF      = float(os.getenv("SEARCH_BACKOFF", "1.25"))   # sin novedades: intervalo x1.25
+SEARCH_SPEEDUP      = float(os.getenv("SEARCH_SPEEDUP", "0.5"))    # con novedades: intervalo x0.5
+
+
+@dataclass
+class _State:
+    version: int
+    interval: float
+    next_due: float
+    seq: int = 0              # invalida entradas viejas del heap
+    in_flight: bool = False
+    rerun: bool = False       # editada mientras se ejecutaba
+    runs: int = 0
+    hits: int = 0             # ejecuciones con al menos un item nuevo
+    new_items: int = 0
+    hit_rate: float = 0.0     # media móvil de "hubo novedades"
+    dirty: bool = False       # pendiente de persistir
+
+
+class DuePlanner:
+    """Cola de prioridad por próxima ejecución con intervalo adaptativo por búsqueda.
+
+    Cada búsqueda acelera cuando trae novedades y se frena cuando no, siempre
+    dentro de [min_interval, max_interval]. Las búsquedas nuevas o editadas
+    quedan pendientes para ya.
+    """
+
+    def __init__(self, base: float = _BASE, min_interval: float = SEARCH_MIN_INTERVAL,
+                 max_interval: float = SEARCH_MAX_INTERVAL):
+        self.min_interval = max(1.0, min_interval)
+        self.max_interval = max(self.min_interval, max_interval)
+        self.base = min(max(base, self.min_interval), self.max_interval)
+        self._heap: List[Tuple[float, int, int]] = []
+        self._state: Dict[int, _State] = {}
+
+    def _push(self, sid: int, st: _State) -> None:
+        st.seq += 1
+        heapq.heappush(self._heap, (st.next_due, sid, st.seq))
+
+    def sync(self, specs: Iterable, persisted: Optional[Dict[int, Tuple[Optional[float], Optional[float]]]] = None,
+             now: Optional[float] = None) -> None:
+        """Alinea el plan con las búsquedas activas.
+
+        `persisted` = {id: (intervalo, próxima ejecución epoch)} leído de la BD,
+        usado para búsquedas que aún no están en memoria (reinicio). Un plan
+        vacío en BD (búsqueda o usuario reactivados, ver `reset_poll`) la pone
+        para ya también si seguía en memoria.
+        """
+        now = time.time() if now is None else now
+        persisted = persisted or {}
+        live = set()
+        for spec in specs:
+            live.add(spec.id)
+            st = self._state.get(spec.id)
+            if st is None:
+                interval, next_due = persisted.get(spec.id, (None, None))
+                st = _State(spec.version, interval or self.base, next_due or now)
+                self._state[spec.id] = st
+                self._push(spec.id, st)
+            elif st.version != spec.version or (
+                    spec.id in persisted and persisted[spec.id][1] is None and not st.dirty):
+                # Editada o reactivada: vuelve al intervalo base y se ejecuta ya
+                st.version, st.interval, st.next_due = spec.version, self.base, now
+                st.dirty = True
+                if st.in_flight:
+                    st.rerun = True
+                else:
+                    self._push(spec.id, st)
+        for sid in [sid for sid in self._state if sid not in live]:
+            del self._state[sid]   # sus entradas en el heap se descartan al salir
+
+    def pop_due(self, now: Optional[float] = None) -> List[int]:
+        now = time.time() if now is None else now
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, sid, seq = heapq.heappop(self._heap)
+            st = self._state.get(sid)
+            if st is None or st.seq != seq or st.in_flight:
+                continue
+            st.in_flight = True
+            due.append(sid)
+        return due
+
+    def record(self, sid: int, new_items: int, now: Optional[float] = None) -> None:
+        st = self._state.get(sid)
+        if st is None:
+            return
+        now = time.time() if now is None else now
+        st.in_flight = False
+        st.runs += 1
+        st.new_items += new_items
+        hit = 1.0 if new_items > 0 else 0.0
+        st.hits += int(hit)
+        st.hit_rate = hit if st.runs == 1 else 0.8 * st.hit_rate + 0.2 * hit
+        if st.runs > 1:
+            # la primera ejecución trae el lote inicial: no dice nada del ritmo real
+            factor = SEARCH_SPEEDUP if new_items > 0 else SEARCH_BACKOFF
+            st.interval = min(self.max_interval, max(self.min_interval, st.interval * factor))
+        st.next_due = now if st.rerun else now + st.interval
+        st.rerun = False
+        st.dirty = True
+        self._push(sid, st)
+
+    def next_due_in(self, now: Optional[float] = None) -> Optional[float]:
+        now = time.time() if now is None else now
+        while self._heap:
+            due, sid, seq = self._heap[0]
+            st = self._state.get(sid)
+            if st is None or st.seq != seq or st.in_flight:
+                heapq.heappop(self._heap)
+                continue
+            return max(0.0, due - now)
+        return None
+
+    def take_dirty(self) -> List[Tuple[int, float, float]]:
+        """(id, intervalo, próxima ejecución) modificados desde la última llamada."""
+        out = []
+        for sid, st in self._state.items():
+            if st.dirty:
+                st.dirty = False
+                out.append((sid, st.interval, st.next_due))
+        return out
+
+    def stats(self, now: Optional[float] = None) -> Dict[int, Dict[str, float]]:
+        now = time.time() if now is None else now
+        return {
+            sid: {
+                "interval_sec": round(st.interval, 1),
+                "next_due_in_sec": round(max(0.0, st.next_due - now), 1),
+                "runs": st.runs,
+                "hits": st.hits,
+                "new_items": st.new_items,
+                "hit_rate": round(st.hit_rate, 3),
+            }
+            for sid, st in self._state.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self._state)
@@ -0,0 +1,188 @@
+# recorder.py
+# Grabación y reproducción de búsquedas (WALLA_MODE=record / replay).
+#
+# record: cada descarga guarda las respuestas de red que la componen (página,
+#         API, scripts...) en un archivo JSON por búsqueda, con nombre derivado
+#         de la URL de _build_search_url.
+# replay: la misma descarga se sirve desde ese archivo (page.route / motor HTTP)
+#         sin tocar la red; la extracción y los filtros son los de siempre.
+import os
+import json
+import time
+import base64
+import asyncio
+import hashlib
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from http_engine import HttpResult
+
+# ===== Config =====
+WALLA_MODE         = os.getenv("WALLA_MODE", "real").lower()       # real | record | replay | fake
+RECORD_DIR         = os.getenv("WALLA_RECORD_DIR", "recordings")
+RECORD_MAX_BODY_KB = int(os.getenv("WALLA_RECORD_MAX_BODY_KB", "4096"))
+REPLAY_TIMING      = float(os.getenv("WALLA_REPLAY_TIMING", "0"))  # 0 = sin esperas, 1 = tiempos grabados
+
+RECORDING = WALLA_MODE == "record"
+REPLAYING = WALLA_MODE == "replay"
+
+# Cabeceras que dejan de ser ciertas al servir el cuerpo ya descomprimido
+_DROP_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+
+def archive_path(search_url: str) -> str:
+    key = hashlib.sha1(search_url.encode("utf-8")).hexdigest()[:20]
+    return os.path.join(RECORD_DIR, f"{key}.json")
+
+
+def _path_key(method: str, url: str) -> Tuple[str, str]:
+    u = urlsplit(url)
+    return method, f"{u.netloc}{u.path}"
+
+
+class Archive:
+    """Respuestas de red de una búsqueda, en el orden en que terminaron.
+
+    En replay cada respuesta se sirve una sola vez: primero por URL exacta y,
+    si no, por host+ruta (la web añade parámetros variables a la API).
+    """
+
+    def __init__(self, search_url: str, entries: Optional[List[Dict[str, Any]]] = None,
+                 recorded_at: Optional[float] = None):
+        self.search_url = search_url
+        self.entries: List[Dict[str, Any]] = entries or []
+        self.recorded_at = recorded_at or time.time()
+        self._t0 = time.perf_counter()
+        self._started: Dict[Any, float] = {}
+        self._pending: set = set()
+        self._listeners: List[Tuple[str, Any]] = []
+        self._index()
+
+    # ---- Disco ----
+    @classmethod
+    def load(cls, search_url: str) -> Optional["Archive"]:
+        try:
+            with open(archive_path(search_url), encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return cls(search_url, data.get("entries") or [], data.get("recorded_at"))
+
+    def save(self) -> None:
+        path = archive_path(self.search_url)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"search_url": self.search_url, "recorded_at": self.recorded_at,
+                       "entries": self.entries}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    # ---- Entradas ----
+    def _index(self) -> None:
+        self._exact: Dict[Tuple[str, str], Deque[int]] = {}
+        self._by_path: Dict[Tuple[str, str], Deque[int]] = {}
+        self._used: set = set()
+        for i, e in enumerate(self.entries):
+            self._exact.setdefault((e["method"], e["url"]), deque()).append(i)
+            self._by_path.setdefault(_path_key(e["method"], e["url"]), deque()).append(i)
+
+    def add(self, method: str, url: str, status: int, headers: Dict[str, str], body: bytes,
+            elapsed_ms: float, resource_type: str = "") -> None:
+        if len(body) > RECORD_MAX_BODY_KB * 1024:
+            return
+        entry = {"method": method, "url": url, "type": resource_type, "status": status,
+                 "headers": {k: v for k, v in headers.items() if k.lower() not in _DROP_HEADERS},
+                 "start_ms": round((time.perf_counter() - self._t0) * 1000 - elapsed_ms, 1),
+                 "elapsed_ms": round(elapsed_ms, 1)}
+        try:
+            entry["body"] = body.decode("utf-8")
+        except UnicodeDecodeError:
+            entry["body_b64"] = base64.b64encode(body).decode("ascii")
+        self.entries.append(entry)
+
+    def take(self, method: str, url: str) -> Optional[Dict[str, Any]]:
+        for index, key in ((self._exact, (method, url)), (self._by_path, _path_key(method, url))):
+            q = index.get(key)
+            while q:
+                i = q.popleft()
+                if i not in self._used:
+                    self._used.add(i)
+                    return self.entries[i]
+        return None
+
+    @staticmethod
+    def body_of(entry: Dict[str, Any]) -> bytes:
+        if "body_b64" in entry:
+            return base64.b64decode(entry["body_b64"])
+        return (entry.get("body") or "").encode("utf-8")
+
+    @staticmethod
+    async def _wait(entry: Dict[str, Any]) -> None:
+        if REPLAY_TIMING > 0 and entry.get("elapsed_ms"):
+            await asyncio.sleep(entry["elapsed_ms"] / 1000.0 * REPLAY_TIMING)
+
+    # ---- Motor HTTP ----
+    def add_http(self, url: str, res: HttpResult) -> None:
+        if not res.error:
+            self.add("GET", url, res.status, {"content-type": "application/json"}, res.text.encode("utf-8"),
+                     res.elapsed_ms, "fetch")
+
+    async def replay_http(self, url: str) -> HttpResult:
+        entry = self.take("GET", url)
+        if entry is None:
+            return HttpResult(0, "", 0.0, error="sin grabación")
+        await self._wait(entry)
+        return HttpResult(entry["status"], self.body_of(entry).decode("utf-8", "replace"), entry["elapsed_ms"])
+
+    # ---- Navegador ----
+    async def attach(self, page) -> None:
+        """Graba las respuestas de la página o las sirve desde el archivo (según el modo)."""
+        if REPLAYING:
+            await page.route("**/*", self._route)
+            return
+        self._listeners = [("request", self._on_request), ("requestfinished", self._on_finished)]
+        for event, fn in self._listeners:
+            page.on(event, fn)
+
+    async def detach(self, page) -> None:
+        if REPLAYING:
+            try:
+                await page.unroute("**/*", self._route)
+            except Exception:
+                pass
+            return
+        for event, fn in self._listeners:
+            page.remove_listener(event, fn)
+        self._listeners = []
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        self._started.clear()
+
+    def _on_request(self, request) -> None:
+        self._started[request] = time.perf_counter()
+
+    def _on_finished(self, request) -> None:
+        task = asyncio.ensure_future(self._record(request))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _record(self, request) -> None:
+        t0 = self._started.pop(request, None)
+        elapsed_ms = (time.perf_counter() - t0) * 1000 if t0 is not None else 0.0
+        try:
+            resp = await request.response()
+            if resp is None:
+                return
+            body = await resp.body()
+        except Exception:
+            return   # redirecciones y respuestas sin cuerpo disponible
+        self.add(request.method, request.url, resp.status, resp.headers, body, elapsed_ms, request.resource_type)
+
+    async def _route(self, route, request) -> None:
+        entry = self.take(request.method, request.url)
+        if entry is None:
+            await route.abort()   # no grabado: en replay nunca se sale a la red
+            return
+        await self._wait(entry)
+        await route.fulfill(status=entry["status"], headers=entry["headers"], body=self.body_of(entry))
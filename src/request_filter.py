@@ -0,0 +1,150 @@
+# request_filter.py
+# Filtro de peticiones para context.route del pool de navegadores.
+# Corre en cada petición de cada página: todo va precompilado y las decisiones
+# por host se cachean.
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from metrics import WALLA_BLOCKED_REQUESTS, WALLA_BLOCKED_BYTES
+
+# ===== Config =====
+# Sin stylesheet por defecto: el banner de cookies y algunos botones dependen de ella
+BLOCK_TYPES       = os.getenv("WALLA_BLOCK_TYPES", "image,media,font,manifest,texttrack")
+ALLOW_DOMAINS     = os.getenv("WALLA_ALLOW_DOMAINS", "wallapop.com,wallapop.net")   # primera parte
+BLOCK_THIRD_PARTY = os.getenv("WALLA_BLOCK_THIRD_PARTY", "1") != "0"
+BLOCK_CONSENT     = os.getenv("WALLA_BLOCK_CONSENT", "0") == "1"   # bloquear OneTrust (sin banner ni cookie)
+BLOCK_PATTERNS    = os.getenv("WALLA_BLOCK_PATTERNS", "")   # regex extra separadas por comas
+
+# Dominios de analítica, publicidad y seguimiento (se comparan con el host)
+HOST_PATTERNS: List[Tuple[str, str]] = [
+    ("analytics", r"google-analytics\.com|googletagmanager\.com|segment\.(?:io|com)|amplitude\.com|"
+                  r"mixpanel\.com|hotjar\.com|optimizely\.com|newrelic\.com|nr-data\.net"),
+    ("ads", r"doubleclick\.net|googlesyndication\.com|adservice\.google|amazon-adsystem\.com|"
+            r"criteo\.(?:com|net)|taboola\.com|outbrain\.com"),
+    ("social", r"facebook\.net|connect\.facebook|tiktok\.com|snapchat\.com"),
+]
+
+# Rutas típicas de seguimiento: solo en hosts de terceros (en primera parte pueden ser de la API)
+THIRD_PARTY_PATH_PATTERNS: List[Tuple[str, str]] = [
+    ("analytics", r"/gtag/js|/gtm\.js"),
+    ("ads", r"/ads?/|/prebid"),
+    ("social", r"twitter\.com/i/adsct"),
+    ("pixel", r"/collect\?|/pixel|/beacon|/track(?:ing)?[/?]|/events?\?"),
+]
+
+# Banner de consentimiento: sin él no se guarda la cookie OptanonAlertBoxClosed
+CONSENT_PATTERN = r"cookielaw\.org|onetrust\.com"
+
+# Nunca se bloquea: la búsqueda de la que sale el payload API
+_PROTECTED_RE = re.compile(r"/api/v3/(?:general/)?search")
+
+# Tamaño medio aproximado por tipo, para estimar los bytes ahorrados
+_AVG_BYTES = {"image": 30_000, "media": 250_000, "font": 40_000, "stylesheet": 25_000, "script": 60_000,
+              "document": 40_000, "xhr": 3_000, "fetch": 3_000, "manifest": 1_000, "texttrack": 5_000}
+_DEFAULT_AVG_BYTES = 2_000
+
+
+class RequestFilter:
+    """Decide por petición: seguir o abortar, con contadores por regla.
+
+    Orden de reglas (la primera que coincide gana):
+      1. tipo de recurso bloqueado                  -> "type:<tipo>"
+      2. host de analítica/publicidad/consentimiento -> "pattern:<nombre>"
+      3. patrón extra de WALLA_BLOCK_PATTERNS (URL)  -> "pattern:customN"
+      4. en hosts de terceros: ruta de seguimiento   -> "pattern:<nombre>"
+                               o cualquier otra      -> "third_party"
+    El consentimiento (OneTrust) solo se bloquea con `block_consent`; si no,
+    se deja pasar aunque sea de terceros.
+    """
+
+    def __init__(self, block_types: str = BLOCK_TYPES, allow_domains: str = ALLOW_DOMAINS,
+                 block_third_party: bool = BLOCK_THIRD_PARTY, extra_patterns: str = BLOCK_PATTERNS,
+                 block_consent: bool = BLOCK_CONSENT):
+        self.block_types = frozenset(t.strip().lower() for t in block_types.split(",") if t.strip())
+        self.allow_domains = tuple(d.strip().lower().lstrip(".") for d in allow_domains.split(",") if d.strip())
+        self.block_third_party = block_third_party and bool(self.allow_domains)
+        self.block_consent = block_consent
+
+        host_patterns = list(HOST_PATTERNS) + ([("consent", CONSENT_PATTERN)] if block_consent else [])
+        custom = [(f"custom{i}", p.strip()) for i, p in enumerate(extra_patterns.split(",")) if p.strip()]
+        self._host_re, self._host_names = self._compile(host_patterns)
+        self._custom_re, self._custom_names = self._compile(custom)
+        self._path_re, self._path_names = self._compile(THIRD_PARTY_PATH_PATTERNS)
+        self._consent_re = re.compile(CONSENT_PATTERN, re.IGNORECASE)
+        self._first_party: Dict[str, bool] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self.allowed = 0
+
+    @staticmethod
+    def _compile(patterns: List[Tuple[str, str]]) -> Tuple[Optional["re.Pattern"], Dict[str, str]]:
+        # Una sola regex con un grupo por regla: m.lastgroup dice cuál coincidió
+        if not patterns:
+            return None, {}
+        names = {f"p{i}": name for i, (name, _) in enumerate(patterns)}
+        return re.compile("|".join(f"(?P<p{i}>{p})" for i, (_, p) in enumerate(patterns)), re.IGNORECASE), names
+
+    def _is_first_party(self, host: str) -> bool:
+        fp = self._first_party.get(host)
+        if fp is None:
+            fp = any(host == d or host.endswith("." + d) for d in self.allow_domains)
+            if len(self._first_party) < 5000:
+                self._first_party[host] = fp
+        return fp
+
+    def decide(self, url: str, resource_type: str) -> Optional[str]:
+        """Regla que bloquea la petición, o None si debe seguir."""
+        if not url.startswith("http") or _PROTECTED_RE.search(url):
+            return None   # data:, blob:... y la API de búsqueda
+        if resource_type in self.block_types:
+            return "type:" + resource_type
+        host = urlsplit(url).hostname or ""
+        m = self._host_re.search(host)
+        if m is not None:
+            return "pattern:" + self._host_names[m.lastgroup]
+        if self._custom_re is not None:
+            m = self._custom_re.search(url)
+            if m is not None:
+                return "pattern:" + self._custom_names[m.lastgroup]
+        if self._is_first_party(host):
+            return None
+        m = self._path_re.search(url)
+        if m is not None:
+            return "pattern:" + self._path_names[m.lastgroup]
+        if not self.block_consent and self._consent_re.search(host):
+            return None   # banner de cookies: sin él no hay cookie de consentimiento
+        return "third_party" if self.block_third_party else None
+
+    def _count(self, rule: str, resource_type: str) -> None:
+        est = _AVG_BYTES.get(resource_type, _DEFAULT_AVG_BYTES)
+        st = self.stats.get(rule)
+        if st is None:
+            st = self.stats[rule] = {"blocked": 0, "bytes_saved_est": 0}
+        st["blocked"] += 1
+        st["bytes_saved_est"] += est
+        WALLA_BLOCKED_REQUESTS.inc(rule=rule)
+        WALLA_BLOCKED_BYTES.inc(est, rule=rule)
+
+    async def handle(self, route, request) -> None:
+        """Handler para `context.route("**/*", ...)`."""
+        resource_type = request.resource_type
+        rule = self.decide(request.url, resource_type)
+        if rule is None:
+            self.allowed += 1
+            await route.continue_()
+            return
+        self._count(rule, resource_type)
+        await route.abort()
+
+    def snapshot(self) -> Dict[str, object]:
+        blocked = sum(st["blocked"] for st in self.stats.values())
+        return {
+            "allowed": self.allowed,
+            "blocked": blocked,
+            "bytes_saved_est": sum(st["bytes_saved_est"] for st in self.stats.values()),
+            "rules": {rule: dict(st) for rule, st in sorted(self.stats.items())},
+        }
+
+
+request_filter = RequestFilter()
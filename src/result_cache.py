@@ -0,0 +1,186 @@
+# result_cache.py
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+from metrics import WALLA_CACHE
+
+# ===== Config =====
+CACHE_TTL_SEC  = float(os.getenv("WALLA_CACHE_TTL_SEC", "10"))     # 0 = sin caché
+CACHE_MAX_KEYS = int(os.getenv("WALLA_CACHE_MAX_KEYS", "2000"))
+CACHE_DISK     = os.getenv("WALLA_CACHE_DISK", "")                 # ruta SQLite; vacío = solo memoria
+
+# Parámetros que no cambian los resultados de la búsqueda
+_IGNORED_PARAMS = {"source"}
+
+
+def canonical_url(url: str) -> str:
+    """URL de búsqueda con host en minúsculas, parámetros ordenados y keywords normalizadas."""
+    u = urlsplit(url)
+    params = []
+    for k, v in parse_qsl(u.query, keep_blank_values=True):
+        if k in _IGNORED_PARAMS:
+            continue
+        if k == "keywords":
+            v = " ".join(v.lower().split())
+        params.append((k, v))
+    return f"{u.scheme}://{u.netloc.lower()}{u.path}?{urlencode(sorted(params))}"
+
+
+class _DiskStore:
+    """Copia en SQLite local para arrancar en caliente tras un reinicio.
+
+    Conexión propia (no la BD del bot) usada desde hilos del executor.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS result_cache "
+                               "(key TEXT PRIMARY KEY, stored_at REAL NOT NULL, items TEXT NOT NULL)")
+
+    def get(self, key: str, min_stored_at: float) -> Optional[Tuple[float, List[dict]]]:
+        with self._lock:
+            row = self._conn.execute("SELECT stored_at, items FROM result_cache WHERE key = ? AND stored_at >= ?",
+                                     (key, min_stored_at)).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def put(self, key: str, stored_at: float, items: List[dict]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO result_cache (key, stored_at, items) VALUES (?, ?, ?)",
+                               (key, stored_at, json.dumps(items, ensure_ascii=False)))
+
+    def prune(self, older_than: float) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM result_cache WHERE stored_at < ?", (older_than,))
+
+
+class ResultCache:
+    """Caché de resultados crudos por URL de búsqueda: TTL corto + LRU acotada.
+
+    Peticiones simultáneas de la misma clave comparten una sola descarga
+    (single-flight). Los resultados vacíos, parciales y los errores no se
+    guardan, para no alargar un bloqueo o un fallo puntual durante todo el TTL.
+    """
+
+    def __init__(self, ttl_sec: float = CACHE_TTL_SEC, max_keys: int = CACHE_MAX_KEYS, disk_path: str = CACHE_DISK):
+        self.ttl = ttl_sec
+        self.max_keys = max(1, max_keys)
+        self._lru: "OrderedDict[str, Tuple[float, List[dict]]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._disk: Optional[_DiskStore] = None
+        self._last_prune = time.time()
+        if disk_path and self.ttl > 0:
+            try:
+                self._disk = _DiskStore(disk_path)
+            except sqlite3.Error as e:
+                print(f"[CACHE] Caché en disco desactivada ({e})")
+        self.stats = {"hits": 0, "disk_hits": 0, "shared": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    def _count(self, result: str, n: int = 1) -> None:
+        self.stats[result] += n
+        WALLA_CACHE.inc(n, result=result)
+
+    def _lookup(self, key: str) -> Optional[List[dict]]:
+        entry = self._lru.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry[0] > self.ttl:
+            del self._lru[key]
+            self._count("expired")
+            return None
+        self._lru.move_to_end(key)
+        return entry[1]
+
+    def _store(self, key: str, stored_at: float, items: List[dict]) -> None:
+        self._lru[key] = (stored_at, items)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_keys:
+            self._lru.popitem(last=False)
+            self._count("evictions")
+
+    async def get_or_fetch(self, url: str, fetch: Callable[[], Awaitable[List[dict]]]) -> List[dict]:
+        """Devuelve los items de `url` desde caché o llamando a `fetch()` una sola vez por clave."""
+        if self.ttl <= 0:
+            return await fetch()
+        key = canonical_url(url)
+        while True:
+            items = self._lookup(key)
+            if items is not None:
+                self._count("hits")
+                return list(items)
+
+            fut = self._inflight.get(key)
+            if fut is None:
+                break
+            self._count("shared")
+            try:
+                return list(await asyncio.shield(fut))
+            except asyncio.CancelledError:
+                if not fut.cancelled():
+                    raise
+                # se canceló quien descargaba (no nosotros): se reintenta
+
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            items = await self._fetch(key, fetch)
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            fut.exception()   # marcada como recuperada aunque nadie más espere
+            raise
+        else:
+            fut.set_result(items)
+        finally:
+            self._inflight.pop(key, None)
+        return list(items)
+
+    async def _fetch(self, key: str, fetch: Callable[[], Awaitable[List[dict]]]) -> List[dict]:
+        if self._disk is not None:
+            try:
+                hit = await asyncio.to_thread(self._disk.get, key, time.time() - self.ttl)
+            except sqlite3.Error:
+                hit = None
+            if hit is not None:
+                self._count("disk_hits")
+                self._store(key, *hit)
+                return hit[1]
+
+        self._count("misses")
+        items = await fetch()
+        if items and not getattr(items, "partial", False):   # parada temprana: solo vale para quien la pidió
+            now = time.time()
+            self._store(key, now, items)
+            if self._disk is not None:
+                try:
+                    await asyncio.to_thread(self._disk.put, key, now, items)
+                    if now - self._last_prune > 600:
+                        self._last_prune = now
+                        await asyncio.to_thread(self._disk.prune, now - self.ttl)
+                except sqlite3.Error as e:
+                    print("[CACHE] Error guardando en disco:", e)
+        return items
+
+    def snapshot(self) -> Dict[str, float]:
+        st = dict(self.stats)
+        lookups = st["hits"] + st["disk_hits"] + st["shared"] + st["misses"]
+        st["keys"] = len(self._lru)
+        st["hit_rate"] = round((lookups - st["misses"]) / lookups, 3) if lookups else 0.0
+        return st
+
+    def clear(self) -> None:
+        self._lru.clear()
+
+
+result_cache = ResultCache()
@@ -1,22 +1,90 @@
 # scheduler.py
 import os
+import time
+import json
 import asyncio
-from typing import Dict, Set, List
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
 from datetime import datetime
 
-from db import SessionLocal, SavedSearch
-from wallapop import search_items, search_items_fake
+from db import (
+    run, active_search_rows, save_poll_state,
+    outbox_enqueue, outbox_claim, outbox_mark_sent, outbox_retry, outbox_reclaim, outbox_prune, outbox_counts,
+)
+from dispatcher import Dispatcher
+from telegram.error import BadRequest, Forbidden
+from planner import DuePlanner
+from seen_store import SeenStore
+from wallapop import (
+    WItem, CompiledSearchFilter, search_items_fake, fetch_raw_items, rank_items, get_pool, engine_stats, cache_stats,
+    block_stats, hot_stats, hot_ack, trim_known, KnownHook, WALLA_INCREMENTAL, _norm, _title_norm,
+)
+from match_index import match_index, url_scope
+from jobs import JOB_CONCURRENCY, SCRAPER_MODE, job_client
+from hot_tabs import HOT_TABS
+from metrics import (
+    SCHED_STAGE_SECONDS, SCHED_CYCLE_SECONDS, SCHED_SEARCHES, SCHED_ACTIVE_SEARCHES,
+    SCHED_SEARCH_INTERVAL, SCHED_SEARCH_HIT_RATE, NOTIFY_ITEMS, TG_QUEUE_DEPTH, OUTBOX_ROWS, ERRORS,
+)
 
 # ===== Config =====
 CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL_SEC", "10"))
-USE_FAKE = os.getenv("WALLA_MODE", "real").lower() != "real"
+WALLA_MODE = os.getenv("WALLA_MODE", "real").lower()
+USE_FAKE = WALLA_MODE not in ("real", "record", "replay")   # record/replay: ver recorder.py
 
 BULK_THRESHOLD = int(os.getenv("BULK_THRESHOLD", "5"))     # >5 => listado sencillo
 BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "25"))    # tope de items en listado
-SEND_DELAY_MS  = int(os.getenv("SEND_DELAY_MS", "250"))    # delay entre envíos individuales (ms)
+SCHED_CONCURRENCY = int(os.getenv("SCHED_CONCURRENCY", "4"))  # búsquedas en vuelo a la vez
+# En modo split el bot solo espera a los workers: el tope lo pone JOB_CONCURRENCY
+_CONCURRENCY = JOB_CONCURRENCY if SCRAPER_MODE == "split" else SCHED_CONCURRENCY
 
-# ===== Estado de notificación por búsqueda =====
-_notified_for_search: Dict[int, Set[str]] = {}
+OUTBOX_BATCH          = int(os.getenv("OUTBOX_BATCH", "200"))          # filas reservadas por pasada
+OUTBOX_MAX_QUEUED     = int(os.getenv("OUTBOX_MAX_QUEUED", "500"))     # mensajes máx. en el dispatcher
+OUTBOX_POLL_SEC       = float(os.getenv("OUTBOX_POLL_SEC", "2"))
+OUTBOX_MAX_ATTEMPTS   = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_SEC    = float(os.getenv("OUTBOX_BACKOFF_SEC", "5"))    # 5s, 10s, 20s... hasta 1h
+OUTBOX_RETENTION_SEC  = int(os.getenv("OUTBOX_RETENTION_HOURS", "24")) * 3600
+
+DIGEST_WINDOW_SEC = float(os.getenv("DIGEST_WINDOW_SEC", "0"))   # >0 => un resumen por usuario y ventana
+TG_MAX_MESSAGE_LEN = 4096
+
+# ===== Estado de notificación por búsqueda (persistente) =====
+_seen = SeenStore()
+
+# ===== Plan de ejecución adaptativo =====
+_planner = DuePlanner(base=CHECK_INTERVAL)
+_refresh_event: Optional[asyncio.Event] = None
+
+def request_refresh() -> None:
+    """Pide recargar búsquedas ya (p. ej. tras crear/editar una desde el bot)."""
+    if _refresh_event is not None:
+        _refresh_event.set()
+
+def planner_stats() -> Dict[int, Dict[str, float]]:
+    return _planner.stats()
+
+# ===== Envío desacoplado (outbox persistente + cola por chat con límites de Telegram) =====
+_dispatcher: Optional[Dispatcher] = None
+_sender_task: Optional[asyncio.Task] = None
+_outbox_event: Optional[asyncio.Event] = None
+_outbox_batch: List[dict] = []     # items nuevos del ciclo, se escriben juntos al terminarlo
+_hot_acks: List[Tuple[str, dict, List[str], frozenset]] = []   # descargas del ciclo a confirmar en su pestaña caliente
+_downloads: List[Tuple[tuple, List["SearchSpec"], List[dict]]] = []   # descargas del ciclo a recordar (incremental)
+_acks: List[Tuple[List, Optional[Exception]]] = []   # (filas, error) de envíos terminados
+
+def dispatcher_stats() -> dict:
+    return _dispatcher.stats() if _dispatcher is not None else {}
+
+async def stop_dispatcher() -> None:
+    if _sender_task is not None:
+        _sender_task.cancel()
+        await asyncio.gather(_sender_task, return_exceptions=True)
+    if _dispatcher is not None:
+        await _dispatcher.stop()
+    await job_client.stop()
+    # Lo que quede reservado sin confirmar se reenvía al arrancar (al menos una vez)
+    await _apply_acks()
 
 # ===== Helpers de formato =====
 def _fmt_eur(n: float) -> str:
@@ -68,93 +136,583 @@ def _build_item_message(query_text: str, it) -> str:
     lines.append(it.url)
     return "\n".join(lines)
 
-# ===== Loop principal =====
-async def loop_checks(app):
-    print(f"🔁 Scheduler arrancado (intervalo {CHECK_INTERVAL}s, modo {'fake' if USE_FAKE else 'real'})")
+def _tg_len(s: str) -> int:
+    # Telegram cuenta el límite en unidades UTF-16 (los emojis ocupan 2)
+    return len(s.encode("utf-16-le")) // 2
+
+def _build_digest_messages(entries: List[Tuple[object, str, object]]) -> List[Tuple[str, List]]:
+    """Resumen de un usuario con todas sus búsquedas: [(texto, filas)].
+
+    `entries` = [(fila outbox, consulta, item)]. Un item que encaja en varias
+    búsquedas sale una sola vez, bajo la cabecera de todas ellas. Los mensajes
+    se cortan entre items para no pasar de TG_MAX_MESSAGE_LEN.
+    """
+    # item -> consultas y filas; se agrupa por el conjunto de consultas
+    by_item: Dict[str, dict] = {}
+    for row, query_text, it in entries:
+        e = by_item.setdefault(it.id, {"item": it, "queries": [], "rows": []})
+        if query_text not in e["queries"]:
+            e["queries"].append(query_text)
+        e["rows"].append(row)
+    groups: Dict[tuple, List[dict]] = {}
+    for e in by_item.values():
+        groups.setdefault(tuple(e["queries"]), []).append(e)
+
+    budget = TG_MAX_MESSAGE_LEN - 64   # hueco para la cabecera "Resumen (i/n)"
+    chunks: List[Tuple[List[str], List]] = []
+    lines: List[str] = []
+    rows: List = []
+    size = 0
+    n = 0
+    for queries, group in groups.items():
+        heading = ["", "🔎 " + " · ".join(f"[{q}]" for q in queries)]
+        need_heading = True
+        for e in group:
+            it = e["item"]
+            n += 1
+            price = _fmt_eur(it.price) if it.price else "—"
+            ship = f" {_ship_badge(it.shipping)}" if it.shipping else ""
+            block = [f"{n}. {_clean_title(it.title)[:200]} — {price}{ship}", f"   {it.url}"]
+            extra = heading + block if need_heading else block
+            cost = sum(_tg_len(l) + 1 for l in extra)
+            if lines and size + cost > budget:
+                chunks.append((lines, rows))
+                lines, rows, size = [], [], 0
+                extra = heading + block   # la cabecera de búsqueda se repite en el mensaje siguiente
+                cost = sum(_tg_len(l) + 1 for l in extra)
+            lines.extend(extra)
+            rows.extend(e["rows"])
+            size += cost
+            need_heading = False
+    if lines:
+        chunks.append((lines, rows))
+
+    out = []
+    for i, (body, chunk_rows) in enumerate(chunks, 1):
+        title = f"🔔 Resumen: {len(by_item)} nuevos resultados"
+        if len(chunks) > 1:
+            title += f" ({i}/{len(chunks)})"
+        out.append(("\n".join([title] + body), chunk_rows))
+    return out
+
+# ===== Estadísticas de ciclo =====
+_cycle_stats = {
+    "cycles": 0,
+    "last_cycle_sec": 0.0,
+    "max_cycle_sec": 0.0,
+    "last_searches": 0,
+    "last_fetches": 0,  # descargas reales tras agrupar búsquedas equivalentes
+    "dedup_ratio": 0.0,
+    "queue_depth": 0,
+    "max_queue_depth": 0,
+    "overruns": 0,      # ciclos más largos que CHECK_INTERVAL
+    "cross_routed": 0,  # items repartidos a búsquedas de otro grupo (llegan antes que con su descarga)
+}
+
+# (ámbito de URL, item id) ya enrutados en el ciclo en curso
+_routed_this_cycle: Set[tuple] = set()
+
+def cycle_stats() -> dict:
+    return dict(_cycle_stats)
+
+# ===== Búsquedas activas (caché por versión) =====
+@dataclass(frozen=True)
+class SearchSpec:
+    id: int
+    user_id: int
+    version: int
+    query: str
+    filters: dict = field(hash=False, compare=False)
+    compiled: CompiledSearchFilter = field(hash=False, compare=False, repr=False)
+
+_spec_cache: Dict[int, SearchSpec] = {}
+
+async def _load_specs() -> Tuple[List[SearchSpec], Dict[int, tuple]]:
+    """Carga búsquedas activas de usuarios activos y su estado de planificación.
+
+    El JSON de filtros solo se decodifica cuando cambia la versión de la fila.
+    """
+    rows = await run(active_search_rows)
+
+    specs = []
+    persisted = {}
+    for sid, user_id, version, name, filters_json, poll_interval, next_due_at in rows:
+        persisted[sid] = (poll_interval, next_due_at)
+        spec = _spec_cache.get(sid)
+        if spec is None or spec.version != version:
+            try:
+                filters = json.loads(filters_json) if filters_json else {}
+            except ValueError:
+                filters = {}
+            spec = SearchSpec(sid, user_id, version, name or "", filters,
+                              CompiledSearchFilter(name or "", filters))
+            _spec_cache[sid] = spec
+        specs.append(spec)
+
+    live = {sp.id for sp in specs}
+    for sid in [sid for sid in _spec_cache if sid not in live]:
+        del _spec_cache[sid]
+    return specs, persisted
+
+# ===== Agrupación de búsquedas equivalentes =====
+def _coalesce_key(query_text: str, filters: dict):
+    # km no se puede filtrar en local: solo se agrupan búsquedas con el mismo radio
+    return (_norm(query_text), filters.get("km"), filters.get("engine"))
+
+def _widest_filters(filter_list: List[dict]) -> dict:
+    """Filtros de URL que cubren a todas las búsquedas del grupo.
+
+    El resto (strict, omit, y los propios min/max/envío) se aplican en local.
+    """
+    merged = {}
+    if all("min" in f for f in filter_list):
+        merged["min"] = min(float(f["min"]) for f in filter_list)
+    if all("max" in f for f in filter_list):
+        merged["max"] = max(float(f["max"]) for f in filter_list)
+    if all(f.get("shipping") for f in filter_list):
+        merged["shipping"] = True
+    first = filter_list[0]
+    for key in ("km", "engine"):
+        if key in first:
+            merged[key] = first[key]
+    return merged
+
+def _group_searches(specs: List[SearchSpec]) -> List[List[SearchSpec]]:
+    groups: Dict[tuple, List[SearchSpec]] = {}
+    for spec in specs:
+        key = (spec.id,) if USE_FAKE else _coalesce_key(spec.query, spec.filters)
+        groups.setdefault(key, []).append(spec)
+    return list(groups.values())
+
+# ===== Modo incremental: ids de la última descarga de cada grupo =====
+# Con WALLA_INCREMENTAL la descarga para tras K items ya vistos seguidos. "Visto"
+# = salió en una descarga anterior de la misma URL (aunque no pasara los filtros)
+# o, sin descarga previa (arranque), ya notificado a todas las búsquedas del grupo.
+_DOWNLOAD_IDS_KEEP = 200       # ids recordados por grupo
+_DOWNLOAD_KEYS_MAX = 20000     # grupos recordados (LRU)
+_download_ids: "OrderedDict[tuple, Tuple[frozenset, OrderedDict]]" = OrderedDict()
+
+def _download_key(group: List[SearchSpec], widest: dict) -> tuple:
+    return _coalesce_key(group[0].query, group[0].filters) + (tuple(sorted(widest.items())),)
+
+def _known_hook(key: tuple, group: List[SearchSpec]) -> Optional[KnownHook]:
+    if not WALLA_INCREMENTAL:
+        return None
+    prev = _download_ids.get(key)
+    if prev is not None:
+        members, ids = prev
+        if not {ss.id for ss in group} <= members:
+            return None   # búsqueda nueva en el grupo: descarga completa para ella
+
+        async def known(item_ids: List[str]) -> set:
+            return {iid for iid in item_ids if iid in ids}
+        return known
+
+    async def known_notified(item_ids: List[str]) -> set:
+        known = set(item_ids)
+        for ss in group:
+            if not known:
+                break
+            known -= set(await _seen.fresh_ids(ss.id, list(known)))
+        return known
+    return known_notified
+
+def _remember_download(key: tuple, group: List[SearchSpec], raw_items: List[dict]) -> None:
+    prev = _download_ids.pop(key, None)
+    ids = prev[1] if prev is not None else OrderedDict()
+    for it in reversed(raw_items):   # página ordenada por recientes: los más nuevos quedan al final
+        ids[it["id"]] = None
+        ids.move_to_end(it["id"])
+    while len(ids) > _DOWNLOAD_IDS_KEEP:
+        ids.popitem(last=False)
+    _download_ids[key] = (frozenset(ss.id for ss in group), ids)
+    while len(_download_ids) > _DOWNLOAD_KEYS_MAX:
+        _download_ids.popitem(last=False)
+
+# ===== Notificación de una búsqueda =====
+async def _notify_search(app, ss: SearchSpec, items: List) -> int:
+    """Apunta los items nuevos de una búsqueda para el outbox. Devuelve cuántos eran nuevos."""
+    query_text = ss.query
+    print(f"[SCHED] Búsqueda #{ss.id} '{query_text}': {len(items)} items recibidos")
+
+    if not items:
+        return 0
+
+    # 4-5) Filtrar solo los NO notificados (caché LRU + tabla seen_items)
+    with SCHED_STAGE_SECONDS.time(stage="dedup"):
+        fresh_ids = set(await _seen.fresh_ids(ss.id, [it.id for it in items]))
+    fresh = [it for it in items if it.id in fresh_ids]
+    print(f"[SCHED]   Nuevos no notificados: {len(fresh)}")
+
+    if not fresh:
+        return 0
+
+    # 6) Al outbox (se escribe en bloque al terminar el ciclo; el envío va aparte)
+    for it in fresh:
+        _outbox_batch.append({
+            "chat_id": ss.user_id,
+            "search_id": ss.id,
+            "item_id": it.id,
+            "payload": json.dumps({"query": query_text, "title": it.title, "price": it.price,
+                                   "url": it.url, "shipping": it.shipping}, ensure_ascii=False),
+        })
+
+    # 7) Log pequeño para seguimiento
+    try:
+        if fresh:
+            last = fresh[0]
+            print(f"[{datetime.now().isoformat()}] Encolado para {ss.user_id}: {last.id} ({query_text})")
+    except Exception:
+        pass
+
+    return len(fresh)
+
+# ===== Outbox: escritura y envío =====
+async def _flush_outbox_batch() -> int:
+    """Escribe los items nuevos del ciclo (outbox + vistos) en una transacción.
+
+    Después recuerda las descargas del ciclo (modo incremental) y las confirma
+    en sus pestañas calientes; si la escritura falla no se hace ninguna de las
+    dos cosas y esos items vuelven a salir.
+    """
+    acks = list(_hot_acks)
+    _hot_acks.clear()
+    downloads = list(_downloads)
+    _downloads.clear()
+    rows = list(_outbox_batch)
+    _outbox_batch.clear()
+    if rows:
+        await run(outbox_enqueue, rows, delay=DIGEST_WINDOW_SEC)
+        for r in rows:
+            _seen.remember(r["search_id"], [r["item_id"]])
+        if _outbox_event is not None:
+            _outbox_event.set()
+    for key, group, raw_items in downloads:
+        _remember_download(key, group, raw_items)
+    for query, filters, item_ids, audience in acks:
+        await hot_ack(query, filters, item_ids, audience)
+    return len(rows)
+
+def _outbox_entry(r) -> Tuple[object, str, WItem]:
+    data = json.loads(r.payload)
+    return r, data["query"], WItem(id=r.item_id, title=data["title"], price=data["price"],
+                                   url=data["url"], shipping=data.get("shipping", False))
+
+def _render_outbox(rows: List) -> List[Tuple[int, str, List]]:
+    """Agrupa filas por chat (resumen) o por chat y búsqueda y las convierte en mensajes: [(chat, texto, filas)]."""
+    out = []
+    if DIGEST_WINDOW_SEC > 0:
+        by_chat: Dict[int, List] = {}
+        for r in rows:
+            by_chat.setdefault(r.chat_id, []).append(_outbox_entry(r))
+        for chat_id, entries in by_chat.items():
+            out.extend((chat_id, text, msg_rows) for text, msg_rows in _build_digest_messages(entries))
+        return out
+
+    groups: Dict[Tuple[int, int], List] = {}
+    for r in rows:
+        groups.setdefault((r.chat_id, r.search_id), []).append(r)
+    for (chat_id, _), group in groups.items():
+        items = [_outbox_entry(r) for r in group]
+        query_text = items[0][1]
+        if len(items) > BULK_THRESHOLD:
+            out.append((chat_id, _build_bulk_message(query_text, [it for _, _, it in items]), group))
+        else:
+            out.extend((chat_id, _build_item_message(query_text, it), [r]) for r, _, it in items)
+    return out
+
+async def _apply_acks() -> None:
+    """Persiste el resultado de los envíos terminados: entregados, reintento con backoff o fallidos."""
+    if not _acks:
+        return
+    done = list(_acks)
+    _acks.clear()
+    now = time.time()
+    sent, retry, give_up = [], [], []
+    for rows, err in done:
+        if err is None:
+            sent.extend(r.id for r in rows)
+            continue
+        permanent = isinstance(err, (Forbidden, BadRequest)) and getattr(err, "retry_after", None) is None
+        for r in rows:
+            attempts = r.attempts + 1
+            if permanent or attempts >= OUTBOX_MAX_ATTEMPTS:
+                give_up.append((r.id, attempts))
+            else:
+                retry.append((r.id, attempts, now + min(3600.0, OUTBOX_BACKOFF_SEC * 2 ** (attempts - 1))))
+    try:
+        await run(outbox_mark_sent, sent)
+        await run(outbox_retry, retry, give_up)
+    except Exception as e:
+        _acks.extend(done)   # se intenta de nuevo en la siguiente pasada
+        ERRORS.inc(where="outbox_ack")
+        print("[OUTBOX] Error guardando confirmaciones:", e)
+        return
+    NOTIFY_ITEMS.inc(len(sent), result="delivered")
+    NOTIFY_ITEMS.inc(len(retry), result="retry")
+    NOTIFY_ITEMS.inc(len(give_up), result="dropped")
+    if give_up:
+        print(f"[OUTBOX] {len(give_up)} notificaciones descartadas tras {OUTBOX_MAX_ATTEMPTS} intentos o error permanente")
+
+def _on_sent(rows: List):
+    def _done(fut: asyncio.Future) -> None:
+        if fut.cancelled():
+            return   # parada: la reserva se recupera al arrancar
+        _acks.append((rows, fut.exception()))
+        if _outbox_event is not None:
+            _outbox_event.set()
+    return _done
+
+async def _outbox_sender() -> None:
+    """Reserva filas del outbox, las envía por el dispatcher y confirma el resultado.
+
+    Solo se reserva lo que cabe en el dispatcher (OUTBOX_MAX_QUEUED), así que
+    una ráfaga se queda en la base de datos y no en memoria.
+    """
+    global _outbox_event
+    _outbox_event = asyncio.Event()
+    # Esta instancia es la única que envía: cualquier reserva previa viene de una caída
+    reclaimed = await run(outbox_reclaim, time.time())
+    if reclaimed:
+        print(f"[OUTBOX] {reclaimed} notificaciones recuperadas de una ejecución anterior")
+    last_prune = 0.0
     while True:
+        _outbox_event.clear()
+        try:
+            await _apply_acks()
+            TG_QUEUE_DEPTH.set(_dispatcher.queue_depth())
+            room = OUTBOX_MAX_QUEUED - _dispatcher.queue_depth()
+            if room > 0:
+                rows = await run(outbox_claim, min(OUTBOX_BATCH, room), whole_chats=DIGEST_WINDOW_SEC > 0)
+                for chat_id, text, msg_rows in _render_outbox(rows):
+                    _dispatcher.submit(chat_id, text).add_done_callback(_on_sent(msg_rows))
+            if time.time() - last_prune > 3600:
+                last_prune = time.time()
+                await run(outbox_prune, last_prune - OUTBOX_RETENTION_SEC)
+        except Exception as e:
+            print("[OUTBOX] Error en el envío:", e)
         try:
-            # 1) Cargar búsquedas activas
-            with SessionLocal() as s:
-                searches = s.query(SavedSearch).filter_by(active=True).all()
+            await asyncio.wait_for(_outbox_event.wait(), timeout=OUTBOX_POLL_SEC)
+        except asyncio.TimeoutError:
+            pass
 
-            for ss in searches:
-                # Parsear nombre y filtros embebidos (compat con tu bot.py)
-                query_text = ss.query
-                filters = {}
-                if "(filtros:" in ss.query:
-                    try:
-                        base, tail = ss.query.split("(filtros:", 1)
-                        query_text = base.strip()
-                        import ast
-                        filters = ast.literal_eval(tail.strip(" )")) if tail else {}
-                    except Exception:
-                        query_text = ss.query
-                        filters = {}
-
-                # 2) Buscar items
-                items = []
-                try:
-                    if USE_FAKE:
-                        items = search_items_fake(query_text)
-                    else:
-                        items = await search_items(query_text, filters)
-                except Exception as e:
-                    print("[SCHED] Error en search_items:", e)
-                    items = []
+# ===== Comprobación de un grupo (una sola descarga) =====
+async def _check_group(app, group: List[SearchSpec]) -> Dict[int, int]:
+    """Procesa un grupo y devuelve {id de búsqueda: items nuevos}."""
+    if USE_FAKE:
+        # Los items de prueba pasan por el mismo filtro que los reales (omit, precio, envío...)
+        new_counts = {}
+        for ss in group:
+            scored = []
+            for it in map(asdict, search_items_fake(ss.query)):
+                t = _title_norm(it)
+                if ss.compiled.accepts(it, t):
+                    scored.append((ss.compiled.score(t), it))
+            new_counts[ss.id] = await _notify_search(app, ss, rank_items(scored))
+        return new_counts
+
+    # 2) Buscar items una vez con los filtros más amplios del grupo (aquí o en un worker)
+    raw_items = []
+    audience = None
+    widest = _widest_filters([ss.filters for ss in group])
+    download_key = _download_key(group, widest)
+    known = _known_hook(download_key, group)
+    try:
+        with SCHED_STAGE_SECONDS.time(stage="search"):
+            if SCRAPER_MODE == "split":
+                # El worker descarga la página entera; el corte se hace aquí
+                raw_items = await job_client.fetch(group[0].query, widest, [ss.id for ss in group])
+                raw_items = await trim_known(raw_items, known)
+            else:
+                # Pestaña caliente: por grupo y versiones; si cambian, página entera otra vez
+                audience = frozenset((ss.id, ss.version) for ss in group) if HOT_TABS else None
+                raw_items = await fetch_raw_items(group[0].query, widest, known, audience)
+    except Exception as e:
+        ERRORS.inc(where="search")
+        print("[SCHED] Error en search_items:", e)
 
-                print(f"[SCHED] Búsqueda #{ss.id} '{query_text}': {len(items)} items recibidos")
+    # Reparto: el índice enruta cada item, una vez por ciclo, a todas las búsquedas
+    # activas de su ámbito de URL que lo aceptan, sean o no de este grupo
+    scope = url_scope(widest)
+    scored: Dict[int, List[tuple]] = {ss.id: [] for ss in group}
+    with SCHED_STAGE_SECONDS.time(stage="filter"):
+        for it in raw_items:
+            key = (scope, it["id"])
+            if key in _routed_this_cycle:
+                continue   # ya repartido desde otra descarga de este ciclo
+            _routed_this_cycle.add(key)
+            matched = match_index.route(it, scope=scope)
+            if matched:
+                t = _title_norm(it)
+                for sid in matched:
+                    spec = _spec_cache.get(sid)
+                    if spec is not None:
+                        scored.setdefault(sid, []).append((spec.compiled.score(t), it))
+    new_counts = {ss.id: await _notify_search(app, ss, rank_items(scored.pop(ss.id))) for ss in group}
+    for sid, items in scored.items():
+        _cycle_stats["cross_routed"] += len(items)
+        await _notify_search(app, _spec_cache[sid], rank_items(items))
+    # Se recuerda/confirma la descarga solo cuando el outbox se haya guardado
+    if WALLA_INCREMENTAL and raw_items:
+        _downloads.append((download_key, group, raw_items))
+    if audience is not None and raw_items:
+        _hot_acks.append((group[0].query, widest, [it["id"] for it in raw_items], audience))
+    return new_counts
 
-                if not items:
-                    continue
+# ===== Ciclo concurrente =====
+async def _run_cycle(app, searches: List[SearchSpec]) -> None:
+    groups = _group_searches(searches)
+    _routed_this_cycle.clear()
+    _cycle_stats["last_fetches"] = len(groups)
+    _cycle_stats["dedup_ratio"] = round(1 - len(groups) / len(searches), 3) if searches else 0.0
 
-                # 3) Aplicar filtro omit (descartar palabras prohibidas en el título)
-                omit_words = [w.lower() for w in filters.get("omit", [])]
-                if omit_words:
-                    before = len(items)
-                    items = [it for it in items if all(w not in it.title.lower() for w in omit_words)]
-                    print(f"[SCHED]   Tras omitir {omit_words}: {before} -> {len(items)}")
+    queue: asyncio.Queue = asyncio.Queue()
+    for group in groups:
+        queue.put_nowait(group)
 
-                if not items:
-                    continue
+    async def worker():
+        while True:
+            try:
+                group = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            _cycle_stats["queue_depth"] = queue.qsize()
+            new_counts: Dict[int, int] = {}
+            try:
+                new_counts = await _check_group(app, group)
+            except Exception as e:
+                print(f"[SCHED] Error en grupo {[ss.id for ss in group]}:", e)
+            # Siempre se devuelve al plan, aunque haya fallado
+            for ss in group:
+                _planner.record(ss.id, new_counts.get(ss.id, 0))
 
-                # 4) Preparar set de notificados
-                notified = _notified_for_search.setdefault(ss.id, set())
+    _cycle_stats["queue_depth"] = queue.qsize()
+    _cycle_stats["max_queue_depth"] = max(_cycle_stats["max_queue_depth"], queue.qsize())
+    workers = max(1, min(_CONCURRENCY, len(groups)))
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    _cycle_stats["queue_depth"] = 0
 
-                # 5) Filtrar solo los NO notificados
-                fresh = [it for it in items if it.id not in notified]
-                print(f"[SCHED]   Nuevos no notificados: {len(fresh)}")
+# ===== Loop principal =====
+async def loop_checks(app):
+    global _refresh_event, _dispatcher, _sender_task
+    _refresh_event = asyncio.Event()
+    if _dispatcher is None:
+        _dispatcher = Dispatcher(app.bot)
+    await _dispatcher.start()
+    if _sender_task is None:
+        _sender_task = asyncio.create_task(_outbox_sender())
+    print(f"🔁 Scheduler arrancado (intervalo base {CHECK_INTERVAL}s, adaptativo "
+          f"{_planner.min_interval:.0f}-{_planner.max_interval:.0f}s, concurrencia {_CONCURRENCY}, "
+          f"modo {'fake' if USE_FAKE else WALLA_MODE}, scraping {SCRAPER_MODE})")
+    specs_by_id: Dict[int, SearchSpec] = {}
+    last_reload = 0.0
+    while True:
+        try:
+            # 1) Recargar búsquedas activas cada CHECK_INTERVAL o cuando lo pida el bot
+            if _refresh_event.is_set() or time.monotonic() - last_reload >= CHECK_INTERVAL:
+                _refresh_event.clear()
+                with SCHED_STAGE_SECONDS.time(stage="load"):
+                    searches, persisted = await _load_specs()
+                    match_index.sync(searches)
+                    _planner.sync(searches, persisted)
+                SCHED_ACTIVE_SEARCHES.set(len(searches))
+                specs_by_id = {sp.id: sp for sp in searches}
+                last_reload = time.monotonic()
 
-                if not fresh:
-                    continue
+            # 2) Ejecutar solo las búsquedas que ya tocan
+            due = [specs_by_id[sid] for sid in _planner.pop_due() if sid in specs_by_id]
+            if due:
+                t0 = time.monotonic()
+                await _run_cycle(app, due)
+                elapsed = time.monotonic() - t0
 
-                # 6) Enviar según umbral
+                # Outbox + notificados en una sola transacción, retención y plan
                 try:
-                    if len(fresh) > BULK_THRESHOLD:
-                        # Listado sencillo en un solo mensaje
-                        msg = _build_bulk_message(query_text, fresh)
-                        await app.bot.send_message(chat_id=ss.user_id, text=msg)
-                        # Marcar todos como notificados
-                        for it in fresh:
-                            notified.add(it.id)
-                    else:
-                        # Envío individual detallado con pequeño delay
-                        for it in fresh:
-                            text = _build_item_message(query_text, it)
-                            await app.bot.send_message(chat_id=ss.user_id, text=text)
-                            notified.add(it.id)
-                            await asyncio.sleep(SEND_DELAY_MS / 1000.0)
-                except Exception as send_err:
-                    print("Error enviando mensaje:", send_err)
-
-                # 7) Log pequeño para seguimiento
+                    with SCHED_STAGE_SECONDS.time(stage="outbox"):
+                        NOTIFY_ITEMS.inc(await _flush_outbox_batch(), result="queued")
+                except Exception as e:
+                    _outbox_batch.clear()   # no quedaron marcados: se detectan otra vez en la próxima pasada
+                    ERRORS.inc(where="outbox")
+                    print("[OUTBOX] Error guardando notificaciones:", e)
+                try:
+                    await _seen.save_sightings()
+                    pruned = await _seen.maybe_prune()
+                    if pruned:
+                        print(f"[SEEN] Retención: {pruned} entradas antiguas borradas")
+                except Exception as e:
+                    print("[SEEN] Error guardando apariciones / retención:", e)
                 try:
-                    if fresh:
-                        last = fresh[0]
-                        print(f"[{datetime.now().isoformat()}] Enviado a {ss.user_id}: {last.id} ({query_text})")
-                except Exception:
-                    pass
+                    await run(save_poll_state, _planner.take_dirty())
+                except Exception as e:
+                    print("[PLAN] Error guardando plan:", e)
+
+                SCHED_CYCLE_SECONDS.observe(elapsed)
+                SCHED_SEARCHES.inc(len(due))
+                _cycle_stats["cycles"] += 1
+                _cycle_stats["last_cycle_sec"] = round(elapsed, 3)
+                _cycle_stats["max_cycle_sec"] = max(_cycle_stats["max_cycle_sec"], round(elapsed, 3))
+                _cycle_stats["last_searches"] = len(due)
+                if elapsed > CHECK_INTERVAL:
+                    _cycle_stats["overruns"] += 1
+                plan = planner_stats()
+                SCHED_SEARCH_INTERVAL.replace({(sid,): st["interval_sec"] for sid, st in plan.items()})
+                SCHED_SEARCH_HIT_RATE.replace({(sid,): st["hit_rate"] for sid, st in plan.items()})
+                intervals = sorted(st["interval_sec"] for st in plan.values()) or [0.0]
+                print(f"[SCHED] Ciclo: {len(due)}/{len(specs_by_id)} búsquedas ({_cycle_stats['last_fetches']} descargas, "
+                      f"dedup {_cycle_stats['dedup_ratio']:.0%}) en {elapsed:.2f}s "
+                      f"(cola máx {_cycle_stats['max_queue_depth']}, desbordes {_cycle_stats['overruns']}, "
+                      f"cruzados {_cycle_stats['cross_routed']}) · "
+                      f"intervalo medio {sum(intervals) / len(intervals):.0f}s "
+                      f"(mín {intervals[0]:.0f}s, máx {intervals[-1]:.0f}s)")
+
+                ob = await run(outbox_counts)
+                for status in ("pending", "sending", "sent", "failed"):
+                    OUTBOX_ROWS.set(ob.get(status, 0), status=status)
+                print(f"[OUTBOX] pendientes {ob.get('pending', 0)} · enviando {ob.get('sending', 0)} · "
+                      f"entregadas {ob.get('sent', 0)} · fallidas {ob.get('failed', 0)}")
+                st = _dispatcher.stats()
+                print(f"[SEND] cola {st['queue_depth']} ({st['chats_pending']} chats) · enviados {st['sent']} · "
+                      f"fallidos {st['failed']} · reintentos {st['retries']} (RetryAfter {st['retry_after']}) · "
+                      f"latencia p50 {st['latency_ms_p50']:.0f} ms p95 {st['latency_ms_p95']:.0f} ms")
+
+                if not USE_FAKE and SCRAPER_MODE == "split":
+                    st = await job_client.stats()
+                    print(f"[JOBS] pendientes {st['pending']} · en curso {st['running']} · hechos {st['done']} · "
+                          f"fallidos {st['failed']} · timeouts {st['timeouts']} · reencolados {st['requeued']} · "
+                          f"p50 {st['latency_sec_p50']:.1f}s")
+                elif not USE_FAKE:
+                    st = get_pool().stats()
+                    print(f"[POOL] ocupación {st['in_use']}/{st['capacity']} · lanzamientos {st['launches']} "
+                          f"({st['warm_starts']} con estado guardado) · "
+                          f"reciclados navs={st['recycles_navs']} rss={st['recycles_rss']} crash={st['recycles_crash']}")
+                    for name, est in engine_stats().items():
+                        if est["requests"]:
+                            print(f"[ENGINE] {name}: {int(est['requests'])} peticiones · éxito {est['success_rate']:.0%} · "
+                                  f"{est['latency_ms_avg']:.0f} ms media · escaladas {int(est['escalations'])}")
+                    bst = block_stats()
+                    if bst["blocked"]:
+                        top = sorted(bst["rules"].items(), key=lambda kv: kv[1]["blocked"], reverse=True)[:4]
+                        print(f"[BLOCK] bloqueadas {bst['blocked']} (~{bst['bytes_saved_est'] / 1e6:.1f} MB) · "
+                              f"permitidas {bst['allowed']} · " + ", ".join(f"{r} {st['blocked']}" for r, st in top))
+                    hst = hot_stats()
+                    if hst["opens"]:
+                        print(f"[HOT] pestañas {hst['open']}/{hst['budget']} · comprobaciones {hst['checks']} · "
+                              f"abiertas {hst['opens']} (reabiertas {hst['reopens']}) · cerradas inactivas "
+                              f"{hst['evicted_idle']} · por presupuesto {hst['evicted_budget']} · fallos {hst['failures']}")
+                    cst = cache_stats()
+                    if cst["hits"] + cst["disk_hits"] + cst["shared"] + cst["misses"]:
+                        print(f"[CACHE] aciertos {cst['hits']} (disco {cst['disk_hits']}, compartidas {cst['shared']}) · "
+                              f"fallos {cst['misses']} · expiradas {cst['expired']} · desalojadas {cst['evictions']} · "
+                              f"{cst['keys']} claves · tasa {cst['hit_rate']:.0%}")
 
         except Exception as loop_err:
             print("scheduler loop error:", loop_err)
 
-        await asyncio.sleep(CHECK_INTERVAL)
+        # 3) Dormir hasta la próxima búsqueda pendiente, la próxima recarga o un aviso del bot
+        until_reload = max(0.0, CHECK_INTERVAL - (time.monotonic() - last_reload))
+        next_due = _planner.next_due_in()
+        timeout = until_reload if next_due is None else min(next_due, until_reload)
+        try:
+            await asyncio.wait_for(_refresh_event.wait(), timeout=max(timeout, 0.05))
+        except asyncio.TimeoutError:
+            pass
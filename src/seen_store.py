@@ -0,0 +1,106 @@
+# seen_store.py
+import os
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Set, Tuple
+
+from db import run, seen_known, seen_touch, seen_prune
+
+# ===== Config =====
+SEEN_CACHE_SIZE      = int(os.getenv("SEEN_CACHE_SIZE", "200000"))     # entradas en la caché LRU
+SEEN_RETENTION_DAYS  = int(os.getenv("SEEN_RETENTION_DAYS", "30"))
+SEEN_PRUNE_EVERY_SEC = int(os.getenv("SEEN_PRUNE_EVERY_SEC", "3600"))
+SEEN_TOUCH_EVERY_SEC = int(os.getenv("SEEN_TOUCH_EVERY_SEC", "86400"))  # cada cuánto se refresca last_seen
+
+
+class SeenStore:
+    """Deduplicación de notificaciones: tabla seen_items + caché LRU acotada.
+
+    Las consultas van primero a la caché; solo los ids desconocidos bajan a la
+    base de datos. Las altas las escribe el outbox (`outbox_enqueue`, misma
+    transacción que la notificación) y aquí solo se anotan en caché con
+    `remember()`. Los ids conocidos que vuelven a aparecer refrescan su
+    last_seen (como mucho una vez cada SEEN_TOUCH_EVERY_SEC) y se escriben en
+    bloque con `save_sightings()`. Las consultas a BD van al hilo de BD
+    (`db.run`); la caché solo se toca desde el event loop.
+    """
+
+    def __init__(self, cache_size: int = SEEN_CACHE_SIZE):
+        self.cache_size = max(1, cache_size)
+        self._lru: "OrderedDict[Tuple[int, str], int]" = OrderedDict()   # clave -> last_seen conocido
+        self._touched: Set[Tuple[int, str]] = set()
+        self._last_prune = 0.0
+        self.stats = {"cache_hits": 0, "db_lookups": 0, "db_hits": 0, "touched": 0, "pruned": 0}
+
+    def _remember(self, key: Tuple[int, str], ts: int) -> None:
+        self._lru[key] = ts
+        self._lru.move_to_end(key)
+        if len(self._lru) > self.cache_size:
+            self._lru.popitem(last=False)
+
+    def _cached(self, key: Tuple[int, str], now: int) -> bool:
+        ts = self._lru.get(key)
+        if ts is None:
+            return False
+        self._lru.move_to_end(key)
+        if now - ts >= SEEN_TOUCH_EVERY_SEC:
+            self._lru[key] = now
+            self._touched.add(key)
+        return True
+
+    async def fresh_ids(self, search_id: int, item_ids: Iterable[str]) -> List[str]:
+        """Filtra y devuelve los ids que aún no se han notificado para la búsqueda."""
+        item_ids = list(dict.fromkeys(item_ids))
+        now = int(time.time())
+        unknown = []
+        for iid in item_ids:
+            if self._cached((search_id, iid), now):
+                self.stats["cache_hits"] += 1
+            else:
+                unknown.append(iid)
+        if not unknown:
+            return []
+
+        self.stats["db_lookups"] += 1
+        known = await run(seen_known, search_id, unknown)
+        self.stats["db_hits"] += len(known)
+        for iid in known:
+            key = (search_id, iid)
+            self._remember(key, now)
+            self._touched.add(key)   # su last_seen en BD es desconocido: se refresca
+        return [iid for iid in unknown if iid not in known]
+
+    def remember(self, search_id: int, item_ids: Iterable[str]) -> None:
+        """Registra en caché ids que ya se persistieron por otra vía (outbox)."""
+        now = int(time.time())
+        for iid in item_ids:
+            self._remember((search_id, iid), now)
+
+    async def save_sightings(self) -> int:
+        """Escribe en bloque los last_seen pendientes. Devuelve cuántos."""
+        if not self._touched:
+            return 0
+        touched, self._touched = self._touched, set()
+        try:
+            await run(seen_touch, list(touched), int(time.time()))
+        except Exception:
+            self._touched |= touched   # se reintenta en el siguiente ciclo
+            raise
+        self.stats["touched"] += len(touched)
+        return len(touched)
+
+    async def maybe_prune(self) -> int:
+        """Aplica la retención como mucho una vez cada SEEN_PRUNE_EVERY_SEC."""
+        now = time.time()
+        if now - self._last_prune < SEEN_PRUNE_EVERY_SEC:
+            return 0
+        self._last_prune = now
+        removed = await run(seen_prune, int(now - SEEN_RETENTION_DAYS * 86400))
+        if removed:
+            # La caché puede contener claves borradas; se vacía para no mentir
+            self._lru.clear()
+        self.stats["pruned"] += removed
+        return removed
+
+    def __len__(self) -> int:
+        return len(self._lru)
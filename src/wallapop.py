@@ -1,8 +1,18 @@
 from dataclasses import dataclass
-from typing import List, Dict, Any, Optional
-import os, re, random, unicodedata
+from typing import List, Dict, Any, Optional, Tuple, Set, Callable, Awaitable, Hashable
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+import os, re, json, time, random, asyncio, unicodedata, weakref
 
-from playwright.async_api import async_playwright, Page, TimeoutError as PWTimeout, Route, Request, ElementHandle
+from playwright.async_api import Page, TimeoutError as PWTimeout, ElementHandle
+
+import http_engine
+import recorder
+from browser_pool import BrowserPool
+from hot_tabs import HotTabs
+from result_cache import result_cache
+from request_filter import request_filter
+from metrics import WALLA_STAGE_SECONDS, WALLA_FETCHES, WALLA_ITEMS, ERRORS
 
 @dataclass
 class WItem:
@@ -19,6 +29,7 @@ class WItem:
 # Config
 # ===========================
 WALLA_HTML_BASE = "https://es.wallapop.com"
+WALLA_API_BASE  = os.getenv("WALLA_API_BASE", "https://api.wallapop.com")
 PLAYWRIGHT_HEADLESS = os.getenv("PLAYWRIGHT_HEADLESS", "1") != "0"
 WALLA_TIMEOUT_MS = int(float(os.getenv("WALLA_TIMEOUT", "12.0")) * 1000)
 MAX_ITEMS = int(os.getenv("WALLA_MAX_ITEMS", "40"))
@@ -29,6 +40,27 @@ DEFAULT_KM  = int(os.getenv("WALLA_DEFAULT_KM", "200"))
 
 WALLA_BLOCK_RESOURCES = os.getenv("WALLA_BLOCK_RESOURCES", "1") != "0"
 
+# Motor de descarga: "http" (API JSON sin navegador, escala a "browser" si falla) o "browser"
+WALLA_ENGINE          = os.getenv("WALLA_ENGINE", "http").lower()
+WALLA_ENGINE_ESCALATE = os.getenv("WALLA_ENGINE_ESCALATE", "1") != "0"
+
+# Extracción: "api" = payload JSON de la búsqueda (con fallback a DOM), "dom" = solo DOM
+WALLA_EXTRACT     = os.getenv("WALLA_EXTRACT", "api").lower()
+WALLA_API_WAIT_MS = int(os.getenv("WALLA_API_WAIT_MS", "5000"))
+
+# Más resultados (scroll infinito, botón "Cargar más", páginas de la API) hasta MAX_ITEMS
+WALLA_IDLE_MS       = int(os.getenv("WALLA_IDLE_MS", "1500"))         # sin tarjetas nuevas en este tiempo => fin
+WALLA_FIRST_CARD_MS = int(os.getenv("WALLA_FIRST_CARD_MS", "3000"))   # espera máx. a la primera tarjeta
+WALLA_MAX_PAGES     = int(os.getenv("WALLA_MAX_PAGES", "5"))          # pasos de "cargar más" por búsqueda
+
+# Modo incremental: resultados por más recientes y parada tras K items ya conocidos seguidos
+WALLA_INCREMENTAL      = os.getenv("WALLA_INCREMENTAL", "0") == "1"
+WALLA_STOP_AFTER_KNOWN = int(os.getenv("WALLA_STOP_AFTER_KNOWN", "3"))
+
+# Cortesía por host: peticiones simultáneas y separación mínima entre arranques
+HOST_MAX_INFLIGHT = int(os.getenv("WALLA_HOST_MAX_INFLIGHT", "4"))
+HOST_MIN_GAP_MS   = int(os.getenv("WALLA_HOST_MIN_GAP_MS", "250"))
+
 UA_DEFAULT = (
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
     "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"
@@ -89,7 +121,8 @@ def _contains_omit(title: str, omit_words: List[str]) -> bool:
     """Devuelve True si el título contiene alguna palabra prohibida"""
     t = _norm(title)
     for w in omit_words:
-        if _norm(w) in t:
+        w = _norm(w)
+        if w and w in t:   # vacía tras normalizar ("!!"): no omite nada
             return True
     return False
 
@@ -103,6 +136,8 @@ def _build_search_url(query: str, filters: Optional[Dict[str, Any]] = None) -> s
         "keywords": query,
         "source": "side_bar_filters",
     }
+    if WALLA_INCREMENTAL:
+        params["order_by"] = "newest"
     if "min" in filters:
         params["min_sale_price"] = float(filters["min"])
     if "max" in filters:
@@ -115,11 +150,45 @@ def _build_search_url(query: str, filters: Optional[Dict[str, Any]] = None) -> s
         params["distance"] = int(filters["km"])
     return f"{WALLA_HTML_BASE}/search?{urlencode(params)}"
 
+def _build_api_url(query: str, filters: Optional[Dict[str, Any]] = None) -> str:
+    """URL del endpoint JSON que alimenta la página de búsqueda."""
+    from urllib.parse import urlencode
+    filters = filters or {}
+    params = {
+        "keywords": query,
+        "source": "side_bar_filters",
+        "latitude": DEFAULT_LAT,
+        "longitude": DEFAULT_LON,
+    }
+    if WALLA_INCREMENTAL:
+        params["order_by"] = "newest"
+    if "min" in filters:
+        params["min_sale_price"] = float(filters["min"])
+    if "max" in filters:
+        params["max_sale_price"] = float(filters["max"])
+    if filters.get("shipping"):
+        params["is_shippable"] = "true"
+    if "km" in filters:
+        params["distance"] = int(filters["km"]) * 1000   # la API espera metros
+    return f"{WALLA_API_BASE}/api/v3/search?{urlencode(params)}"
+
 # ===========================
 # Helpers Playwright
 # ===========================
+# Cookie que OneTrust deja al aceptar/rechazar; llega con el storage_state del pool
+_CONSENT_COOKIES = {"OptanonAlertBoxClosed"}
+_consented: "weakref.WeakSet" = weakref.WeakSet()   # contextos con el banner ya resuelto
+
 async def _dismiss_cookies(page: Page) -> None:
+    if WALLA_BLOCK_RESOURCES and request_filter.block_consent:
+        return   # OneTrust bloqueado: el banner no llega a salir
+    ctx = page.context
+    if ctx in _consented:
+        return
     try:
+        if any(c.get("name") in _CONSENT_COOKIES for c in await ctx.cookies(WALLA_HTML_BASE)):
+            _consented.add(ctx)
+            return
         for sel in [
             '#onetrust-reject-all-handler',
             '#onetrust-accept-btn-handler',
@@ -128,22 +197,27 @@ async def _dismiss_cookies(page: Page) -> None:
         ]:
             btn = await page.query_selector(sel)
             if btn:
-                await btn.click()
-                await page.wait_for_timeout(120)
+                await btn.click()   # el banner no bloquea la extracción: no hace falta esperar a que se cierre
+                _consented.add(ctx)
                 return
     except Exception:
         pass
 
-async def _block_heavy_resources(route: Route, request: Request):
-    if request.resource_type in {"image", "media", "font"}:
-        await route.abort()
-    else:
-        await route.continue_()
-
 # ---- Precio ----
 BAD_CTX = ["envio", "envío", "desde", "al mes", "mes", "finan", "cuota", "cuotas", "pagar"]
 
-async def _price_from_text(txt: str) -> float:
+PRICE_SELECTORS = (
+    '[data-qa="ad-card-price"]',
+    '[data-qa*="price"]',
+    '[data-testid*="price"]',
+    '[aria-label*="price" i]',
+    'span[class*="price"]',
+    'div[class*="price"]',
+    'p[class*="price"]',
+    'strong[class*="price"]',
+)
+
+def _price_from_text(txt: str) -> float:
     out = 0.0
     for m in re.finditer(r"(\d+(?:[.,]\d{1,2})?)\s*€", txt.replace("\xa0", " ")):
         raw = m.group(1)
@@ -170,21 +244,12 @@ async def _price_from_anchor(a_el: ElementHandle) -> float:
                 return v
         except Exception:
             pass
-    for sel in (
-        '[data-qa="ad-card-price"]',
-        '[data-qa*="price"]',
-        '[data-testid*="price"]',
-        '[aria-label*="price" i]',
-        'span[class*="price"]',
-        'div[class*="price"]',
-        'p[class*="price"]',
-        'strong[class*="price"]',
-    ):
+    for sel in PRICE_SELECTORS:
         try:
             nodes = await a_el.query_selector_all(sel)
             for n in nodes:
                 txt = (await n.inner_text() or "").strip()
-                v = await _price_from_text(txt)
+                v = _price_from_text(txt)
                 if DEBUG: _log(f"[PRICE sel={sel} '{txt}'] -> {v}")
                 if v >= 0.01:
                     return v
@@ -194,7 +259,7 @@ async def _price_from_anchor(a_el: ElementHandle) -> float:
         block = (await a_el.inner_text() or "").strip()
     except Exception:
         block = ""
-    v = await _price_from_text(block)
+    v = _price_from_text(block)
     if DEBUG: _log(f"[PRICE block='{block}'] -> {v}")
     return v or 0.0
 
@@ -211,8 +276,90 @@ async def _flags_from_anchor(a_el: ElementHandle) -> Dict[str, bool]:
         pass
     return {"shipping": shipping, "reserved": reserved}
 
-# ---- Extract items ----
+# ---- Extract items (un solo evaluate) ----
+# Recoge en el navegador todo lo necesario de cada tarjeta en un único viaje CDP;
+# el parseo de precio/flags se hace después en Python.
+_CARD_JS = """
+(a, priceSelectors) => {
+  const strong = a.querySelector("strong[aria-label*='price' i]");
+  return {
+    href: a.getAttribute('href') || '',
+    title: a.getAttribute('title'),
+    aria: a.getAttribute('aria-label'),
+    strong: strong ? (strong.innerText || '') : null,
+    groups: priceSelectors.map(sel => Array.from(a.querySelectorAll(sel), n => n.innerText || '')),
+    block: a.innerText || '',
+    badges: Array.from(a.querySelectorAll('wallapop-badge[badge-type]'), b => b.getAttribute('badge-type')),
+  };
+}
+"""
+
+_EXTRACT_JS = """
+(priceSelectors) => {
+  const card = __CARD__;
+  return Array.from(document.querySelectorAll('a[href^="/item/"]'), a => card(a, priceSelectors));
+}
+""".replace("__CARD__", _CARD_JS.strip())
+
+def _price_from_card(card: dict) -> float:
+    """Mismo orden de fallback que _price_from_anchor: strong -> selectores -> bloque."""
+    txt = card.get("strong")
+    if txt is not None:
+        v = _to_price(txt.strip())
+        if DEBUG: _log(f"[PRICE strong='{txt}'] -> {v}")
+        if v >= 0.01:
+            return v
+    for sel, texts in zip(PRICE_SELECTORS, card.get("groups") or []):
+        for txt in texts:
+            v = _price_from_text(txt.strip())
+            if DEBUG: _log(f"[PRICE sel={sel} '{txt}'] -> {v}")
+            if v >= 0.01:
+                return v
+    block = (card.get("block") or "").strip()
+    v = _price_from_text(block)
+    if DEBUG: _log(f"[PRICE block='{block}'] -> {v}")
+    return v or 0.0
+
+def _parse_cards(cards: List[dict]) -> List[dict]:
+    items: List[dict] = []
+    seen_ids = set()
+
+    for card in cards:
+        href = card.get("href") or ""
+        if not href.startswith("/item/"):
+            continue
+        m = re.search(r"/item/([^/?#]+)", href)
+        item_id = m.group(1) if m else re.sub(r"\W+", "", href)[:32]
+        if not item_id or item_id in seen_ids:
+            continue
+        seen_ids.add(item_id)
+
+        badges = card.get("badges") or []
+        title = card.get("title") or card.get("aria") or "Sin título"
+        items.append({
+            "id": item_id,
+            "title": title.strip(),
+            "price": _price_from_card(card),
+            "url": WALLA_HTML_BASE + href,
+            "seller_id": "",
+            "shipping": "shippingAvailable" in badges,
+            "reserved": "reserved" in badges,
+            "sold": False,
+        })
+
+    return items
+
+async def _extract_cards_counted(page: Page) -> Tuple[List[dict], int]:
+    """Items parseados + nº de anclas /item/ (la misma cuenta que usa _LOAD_MORE_JS)."""
+    cards = await page.evaluate(_EXTRACT_JS, list(PRICE_SELECTORS))
+    return _parse_cards(cards), len(cards)
+
 async def _extract_cards(page: Page) -> List[dict]:
+    return (await _extract_cards_counted(page))[0]
+
+# ---- Extract items (ruta antigua, un viaje CDP por consulta) ----
+# Se mantiene como referencia para bench/bench_extract.py.
+async def _extract_cards_dom(page: Page) -> List[dict]:
     anchors = await page.query_selector_all('a[href^="/item/"]')
     items: List[dict] = []
     seen_ids = set()
@@ -245,88 +392,703 @@ async def _extract_cards(page: Page) -> List[dict]:
 
     return items
 
-async def _light_scroll(page: Page):
+# ---- Payload JSON de la API de búsqueda ----
+_SEARCH_API_RE = re.compile(r"/api/v3/(?:general/)?search(?:/section)?(?:\?|$)")
+_extract_stats = {"api": 0, "dom_fallback": 0, "dom": 0, "early_stop": 0}
+
+def _is_search_api_url(url: str) -> bool:
+    return bool(_SEARCH_API_RE.search(url or ""))
+
+def _dig(obj: Any, *path: str) -> Any:
+    for key in path:
+        if not isinstance(obj, dict):
+            return None
+        obj = obj.get(key)
+    return obj
+
+def _api_price(raw: Any) -> float:
+    if isinstance(raw, dict):
+        raw = raw.get("amount")
     try:
-        for y in (600, 1200, 1800):
-            await page.evaluate(f"window.scrollTo(0, {y});")
-            await page.wait_for_timeout(180)
-        await page.evaluate("window.scrollTo(0, 0);")
-        await page.wait_for_timeout(120)
+        return round(float(raw), 2) if raw is not None else 0.0
+    except (TypeError, ValueError):
+        return _to_price(str(raw))
+
+def _api_flag(obj: dict, *paths) -> bool:
+    for path in paths:
+        val = _dig(obj, *path)
+        if isinstance(val, dict):
+            val = val.get("flag")
+        if val:
+            return True
+    return False
+
+def _api_next_page(payload: Any) -> Optional[str]:
+    """Token de la siguiente página de resultados (o None si no hay más)."""
+    token = _dig(payload, "meta", "next_page")
+    return token if isinstance(token, str) and token else None
+
+def _items_from_api_payload(payload: Any) -> Optional[List[dict]]:
+    """Convierte el JSON de búsqueda de Wallapop en items crudos.
+
+    Devuelve None si el payload no tiene una forma reconocible.
+    """
+    objs = None
+    for path in (("data", "section", "payload", "items"), ("search_objects",), ("items",)):
+        val = _dig(payload, *path)
+        if isinstance(val, list):
+            objs = val
+            break
+    if objs is None:
+        return None
+
+    items: List[dict] = []
+    seen_ids = set()
+    for obj in objs:
+        if not isinstance(obj, dict):
+            continue
+        obj = obj.get("content") if isinstance(obj.get("content"), dict) else obj
+        slug = obj.get("web_slug") or ""
+        # Mismo id que en el DOM (slug de /item/<slug>) para no romper la deduplicación
+        item_id = slug or str(obj.get("id") or "")
+        if not item_id or item_id in seen_ids:
+            continue
+        seen_ids.add(item_id)
+        items.append({
+            "id": item_id,
+            "title": (obj.get("title") or "Sin título").strip(),
+            "price": _api_price(obj.get("price")),
+            "url": f"{WALLA_HTML_BASE}/item/{slug or item_id}",
+            "seller_id": str(obj.get("user_id") or _dig(obj, "user", "id") or ""),
+            "shipping": _api_flag(obj, ("shipping", "user_allows_shipping"), ("shipping_allowed",),
+                                  ("flags", "shipping_allowed")),
+            "reserved": _api_flag(obj, ("reserved",), ("flags", "reserved")),
+            "sold": _api_flag(obj, ("sold",), ("flags", "sold")),
+        })
+    return items
+
+# ---- Parada temprana (modo incremental) ----
+# Recibe ids en orden de página y devuelve los que ya se conocen (vistos antes)
+KnownHook = Callable[[List[str]], Awaitable[Set[str]]]
+
+
+class _PartialItems(list):
+    """Lista cortada por parada temprana: no vale para otros consumidores (caché)."""
+    partial = True
+
+
+class _KnownStream:
+    """Acumula items en orden de página y se detiene tras K conocidos seguidos.
+
+    Con orden por más recientes, todo lo que viene detrás de esa racha es más
+    antiguo y ya se procesó en descargas anteriores.
+    """
+
+    def __init__(self, known: KnownHook, stop_after: int = WALLA_STOP_AFTER_KNOWN):
+        self.known = known
+        self.stop_after = max(1, stop_after)
+        self.items: List[dict] = []
+        self._ids: Set[str] = set()
+        self._streak = 0
+        self.stopped = False
+
+    async def feed(self, raw_items: List[dict]) -> bool:
+        """Añade los items aún no vistos en este stream. Devuelve True si hay que parar."""
+        if self.stopped:
+            return True
+        new = [it for it in raw_items if it["id"] not in self._ids]
+        if not new:
+            return False
+        known = await self.known([it["id"] for it in new])
+        for it in new:
+            self._ids.add(it["id"])
+            self.items.append(it)
+            self._streak = self._streak + 1 if it["id"] in known else 0
+            if self._streak >= self.stop_after:
+                self.stopped = True
+                break
+        return self.stopped
+
+
+async def trim_known(raw_items: List[dict], known: Optional[KnownHook]) -> List[dict]:
+    """Corta una descarga completa tras K conocidos seguidos (payload API, modo split)."""
+    if known is None or not raw_items:
+        return raw_items
+    stream = _KnownStream(known)
+    await stream.feed(raw_items)
+    if stream.stopped:
+        _extract_stats["early_stop"] += 1
+        WALLA_ITEMS.inc(len(raw_items) - len(stream.items), kind="skipped_known")
+    return stream.items
+
+# ---- Cargar más resultados ----
+# Pulsa "Cargar más" si está, baja al final (scroll infinito) y resuelve en cuanto
+# aparecen tarjetas nuevas (MutationObserver) o tras `idleMs` sin cambios.
+_LOAD_MORE_JS = """
+async ({prev, idleMs}) => {
+  const count = () => document.querySelectorAll('a[href^="/item/"]').length;
+  const btn = Array.from(document.querySelectorAll('button, walla-button, [role="button"]'))
+    .find(b => /cargar m[aá]s|ver m[aá]s|load more/i.test(b.innerText || b.getAttribute('text') || ''));
+  if (btn) btn.click();
+  window.scrollTo(0, document.body.scrollHeight);
+  if (count() > prev || idleMs <= 0) return count();
+  return await new Promise(resolve => {
+    let timer = null;
+    const obs = new MutationObserver(() => { if (count() > prev) done(); });
+    const done = () => { obs.disconnect(); clearTimeout(timer); resolve(count()); };
+    obs.observe(document.body, {childList: true, subtree: true});
+    timer = setTimeout(done, idleMs);
+  });
+}
+"""
+
+async def _load_more(page: Page, prev: int, idle_ms: int = WALLA_IDLE_MS) -> int:
+    """Pide más resultados y devuelve el nº de tarjetas (igual a `prev` si no llegaron)."""
+    t0 = time.perf_counter()
+    try:
+        return int(await page.evaluate(_LOAD_MORE_JS, {"prev": prev, "idleMs": idle_ms}))
     except Exception:
-        pass
+        return prev
+    finally:
+        WALLA_STAGE_SECONDS.observe(time.perf_counter() - t0, stage="load_more")
+
+async def _extract_until(page: Page, target: int, known: Optional[KnownHook] = None) -> List[dict]:
+    """Extrae tarjetas y carga más hasta `target` items o hasta que dejen de llegar.
+
+    Con `known` se para además en cuanto aparece la racha de items conocidos.
+    """
+    stream = _KnownStream(known) if known is not None else None
+    # `cards` cuenta anclas, no ids: una tarjeta puede tener varias anclas al mismo item
+    items, cards = await _extract_cards_counted(page)
+    for _ in range(WALLA_MAX_PAGES + 1):
+        if stream is not None and await stream.feed(items):
+            return _PartialItems(stream.items)   # trim_known la contabiliza
+        if len(items) >= target:
+            break
+        more = await _load_more(page, cards)
+        if more <= cards:
+            break   # sin tarjetas nuevas en WALLA_IDLE_MS: no hay más
+        items, cards = await _extract_cards_counted(page)
+    return stream.items if stream is not None else items
 
 # ===========================
-# API pública
+# Cortesía por host
 # ===========================
-async def search_items(query: str, filters: Optional[Dict[str, Any]] = None) -> List[WItem]:
-    filters = filters or {}
-    url = _build_search_url(query, filters)
-    _log(f"[WALLA] URL: {url}")
+class _HostLimiter:
+    """Limita peticiones en vuelo por host y espacia sus arranques."""
+
+    def __init__(self, max_inflight: int, min_gap_ms: int):
+        self.max_inflight = max(1, max_inflight)
+        self.min_gap = max(0, min_gap_ms) / 1000.0
+        self._sems: Dict[str, asyncio.Semaphore] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._next_at: Dict[str, float] = {}
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=PLAYWRIGHT_HEADLESS)
-        context = await browser.new_context(
-            user_agent=os.getenv("WALLA_UA", UA_DEFAULT),
-            locale="es-ES",
+    @asynccontextmanager
+    async def slot(self, url: str):
+        host = urlsplit(url).hostname or ""
+        sem = self._sems.setdefault(host, asyncio.Semaphore(self.max_inflight))
+        async with sem:
+            if self.min_gap:
+                loop = asyncio.get_running_loop()
+                async with self._locks.setdefault(host, asyncio.Lock()):
+                    wait = self._next_at.get(host, 0.0) - loop.time()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                    self._next_at[host] = loop.time() + self.min_gap
+            yield
+
+
+_host_limiter = _HostLimiter(HOST_MAX_INFLIGHT, HOST_MIN_GAP_MS)
+
+# ===========================
+# Pool de navegadores
+# ===========================
+_pool: Optional[BrowserPool] = None
+
+def get_pool() -> BrowserPool:
+    global _pool
+    if _pool is None:
+        _pool = BrowserPool(
+            context_options={"user_agent": os.getenv("WALLA_UA", UA_DEFAULT), "locale": "es-ES"},
+            route_handler=request_filter.handle if WALLA_BLOCK_RESOURCES else None,
+            headless=PLAYWRIGHT_HEADLESS,
         )
-        if WALLA_BLOCK_RESOURCES:
-            await context.route("**/*", _block_heavy_resources)
+    return _pool
+
+async def start_browser_pool() -> None:
+    await get_pool().start()
+
+async def stop_browser_pool() -> None:
+    await hot_tabs.close()
+    if _pool is not None:
+        await _pool.close()
+
+# ===========================
+# Motor navegador
+# ===========================
+async def _fetch_raw_browser(url: str, archive: Optional[recorder.Archive] = None,
+                             known: Optional[KnownHook] = None) -> List[dict]:
+    """Carga la búsqueda en una página del pool y devuelve items crudos.
+
+    En modo "api" escucha la respuesta JSON de la búsqueda y la usa en cuanto
+    llega; si no aparece a tiempo, cae al scraping del DOM de siempre.
+    Con `archive` la página se graba o se sirve desde disco (record/replay).
+    En ambos casos se piden más resultados ("Cargar más" / scroll) hasta
+    MAX_ITEMS; con `known` se deja de pedir en cuanto aparecen K items ya
+    conocidos seguidos.
+    """
+    stage = WALLA_STAGE_SECONDS
+    t_acquire = time.perf_counter()
+    async with _host_limiter.slot(url), get_pool().page() as page:
+        stage.observe(time.perf_counter() - t_acquire, stage="acquire")   # hueco por host + página libre
+        if archive is not None:
+            await archive.attach(page)
+        api_pages: Optional[asyncio.Queue] = None
+        on_response = None
+        if WALLA_EXTRACT == "api":
+            api_pages = asyncio.Queue()
 
-        page = await context.new_page()
+            async def on_response(resp):
+                if not _is_search_api_url(resp.url):
+                    return
+                try:
+                    payload = await resp.json()
+                except Exception:
+                    return
+                parsed = _items_from_api_payload(payload)
+                if parsed is not None:
+                    api_pages.put_nowait(parsed)
 
+            page.on("response", on_response)
+
+        try:
+            try:
+                with stage.time(stage="goto"):
+                    await page.goto(url, wait_until="domcontentloaded", timeout=WALLA_TIMEOUT_MS)
+            except Exception as e:
+                ERRORS.inc(where="goto")
+                _log(f"[WALLA] ERROR al cargar: {e}")
+                return []
+
+            if api_pages is not None:
+                try:
+                    with stage.time(stage="api_wait"):
+                        raw_items = await asyncio.wait_for(api_pages.get(), WALLA_API_WAIT_MS / 1000.0)
+                    _extract_stats["api"] += 1
+                    _log(f"[WALLA] Payload API capturado: {len(raw_items)} items")
+                    return await _more_api_pages(page, api_pages, raw_items, known)
+                except asyncio.TimeoutError:
+                    _extract_stats["dom_fallback"] += 1
+                    _log("[WALLA] Sin payload API, usando DOM")
+            else:
+                _extract_stats["dom"] += 1
+
+            with stage.time(stage="cookies"):
+                try:
+                    await _dismiss_cookies(page)
+                except Exception:
+                    pass
+
+            with stage.time(stage="wait_selector"):
+                try:
+                    await page.wait_for_selector('a[href^="/item/"]', timeout=WALLA_FIRST_CARD_MS)
+                except PWTimeout:
+                    pass
+
+            with stage.time(stage="extract"):
+                return await _extract_until(page, MAX_ITEMS, known)
+        finally:
+            if on_response is not None:
+                page.remove_listener("response", on_response)
+            if archive is not None:
+                await archive.detach(page)
+
+async def _more_api_pages(page: Page, api_pages: asyncio.Queue, raw_items: List[dict],
+                          known: Optional[KnownHook]) -> List[dict]:
+    """Sigue pidiendo páginas en el navegador hasta MAX_ITEMS y acumula sus payloads API."""
+    stream = _KnownStream(known) if known is not None else None
+    seen_ids = {it["id"] for it in raw_items}
+    cards = 0
+    for _ in range(WALLA_MAX_PAGES):
+        if stream is not None and await stream.feed(raw_items):
+            return _PartialItems(raw_items)
+        if len(raw_items) >= MAX_ITEMS:
+            break
+        cards = await _load_more(page, cards, idle_ms=0)   # sin esperar al DOM: manda la respuesta API
         try:
-            await page.goto(url, wait_until="domcontentloaded", timeout=WALLA_TIMEOUT_MS)
-        except Exception as e:
-            _log(f"[WALLA] ERROR al cargar: {e}")
-            await browser.close()
+            more = await asyncio.wait_for(api_pages.get(), WALLA_IDLE_MS / 1000.0)
+        except asyncio.TimeoutError:
+            break
+        fresh = [it for it in more if it["id"] not in seen_ids]
+        if not fresh:
+            break
+        seen_ids.update(it["id"] for it in fresh)
+        raw_items = raw_items + fresh
+    return raw_items
+
+# ===========================
+# Pestañas calientes (WALLA_HOT_TABS)
+# ===========================
+# Las búsquedas frecuentes del scheduler tienen una pestaña propia abierta: cada
+# comprobación repite la petición de resultados sin recargar (fetch a la API desde
+# la página) o, si no se puede, recarga; el observer inyectado devuelve solo las
+# tarjetas cuyo id no se ha confirmado aún con `hot_ack` (ids en sessionStorage:
+# sobreviven al reload). El scheduler confirma tras guardar el outbox: lo que no
+# se confirma (fallo al guardar) vuelve a salir en la siguiente comprobación.
+_HOT_JS = """
+(() => {
+  if (window.__wallaHot) return;
+  const KEY = '__wallaHotKnown', MAX_KNOWN = 2000, SEL = 'a[href^="/item/"]';
+  const priceSelectors = __PRICE_SELECTORS__;
+  const card = __CARD__;
+  const slug = href => (href.split('/item/')[1] || '').split(/[?#]/)[0];
+  const load = () => { try { return new Set(JSON.parse(sessionStorage.getItem(KEY) || '[]')); } catch (e) { return new Set(); } };
+  const save = known => { try { sessionStorage.setItem(KEY, JSON.stringify(Array.from(known).slice(-MAX_KNOWN))); } catch (e) {} };
+
+  // Tarjetas añadidas (o reutilizadas con otro href) desde la última lectura
+  const pending = new Set();
+  const collect = node => {
+    if (node.nodeType !== 1) return;
+    if (node.matches(SEL)) pending.add(node);
+    for (const a of node.querySelectorAll(SEL)) pending.add(a);
+  };
+  new MutationObserver(muts => {
+    for (const m of muts) {
+      if (m.type === 'attributes') collect(m.target);
+      else for (const n of m.addedNodes) collect(n);
+    }
+  }).observe(document, {childList: true, subtree: true, attributes: true, attributeFilter: ['href']});
+
+  window.__wallaHot = {
+    take() {
+      const known = load(), taken = new Set(), out = [];
+      for (const a of pending) {
+        const id = a.isConnected ? slug(a.getAttribute('href') || '') : '';
+        if (!id || known.has(id) || taken.has(id)) continue;
+        taken.add(id);
+        out.push(card(a, priceSelectors));
+      }
+      pending.clear();
+      return out;
+    },
+    async takeApi(apiUrl, headers) {
+      let data;
+      try {
+        const res = await fetch(apiUrl, {headers});
+        if (!res.ok) return null;
+        data = await res.json();
+      } catch (e) { return null; }
+      const objs = data?.data?.section?.payload?.items || data?.search_objects || data?.items;
+      if (!Array.isArray(objs)) return null;
+      const known = load(), items = [];
+      for (const o of objs) {
+        const c = (o && typeof o.content === 'object' && o.content) || o || {};
+        const id = c.web_slug || (c.id != null ? String(c.id) : '');
+        if (id && !known.has(id)) items.push(o);
+      }
+      return {items};
+    },
+    ack(ids) {
+      const known = load();
+      for (const id of ids) { known.delete(id); known.add(id); }   // al final: los más recientes sobreviven al recorte
+      save(known);
+    },
+  };
+})();
+""".replace("__PRICE_SELECTORS__", json.dumps(list(PRICE_SELECTORS))).replace("__CARD__", _CARD_JS.strip())
+
+hot_tabs = HotTabs(lambda: get_pool().open_page())
+
+async def _hot_fetch(url: str, api_url: str, audience: Hashable) -> Optional[List[dict]]:
+    """Comprobación en la pestaña caliente de `url`: solo items aún no confirmados en ella.
+
+    La primera vez navega y devuelve la página entera (con "cargar más" hasta
+    MAX_ITEMS). Si cambia `audience` (búsquedas del grupo y sus versiones) la
+    pestaña se abre de nuevo, sin ids confirmados: página entera otra vez.
+    None si la búsqueda aún no tiene pestaña o esta falló.
+    """
+    stage = WALLA_STAGE_SECONDS
+
+    async def check(page: Page, first: bool) -> List[dict]:
+        if first:
+            await page.add_init_script(_HOT_JS)
+            with stage.time(stage="goto"):
+                await page.goto(url, wait_until="domcontentloaded", timeout=WALLA_TIMEOUT_MS)
+            try:
+                await _dismiss_cookies(page)
+            except Exception:
+                pass
+
+        with stage.time(stage="hot_check"):
+            if WALLA_EXTRACT == "api":
+                payload = await page.evaluate("([u, h]) => window.__wallaHot.takeApi(u, h)",
+                                              [api_url, {"Accept": "application/json", "X-DeviceOS": "0"}])
+                if payload is not None:
+                    return _PartialItems(_items_from_api_payload(payload) or [])
+            if not first:
+                await page.reload(wait_until="domcontentloaded", timeout=WALLA_TIMEOUT_MS)
+            try:
+                await page.wait_for_selector('a[href^="/item/"]', timeout=WALLA_FIRST_CARD_MS)
+            except PWTimeout:
+                pass
+            if first:
+                cards = await page.evaluate("() => document.querySelectorAll('a[href^=\"/item/\"]').length")
+                for _ in range(WALLA_MAX_PAGES):
+                    if cards >= MAX_ITEMS:
+                        break
+                    more = await _load_more(page, cards)
+                    if more <= cards:
+                        break
+                    cards = more
+            # Diferencias: aunque la lista esté completa, solo viajan las tarjetas nuevas
+            return _PartialItems(_parse_cards(await page.evaluate("() => window.__wallaHot.take()")))
+
+    async with _host_limiter.slot(url):
+        return await hot_tabs.run(url, check, tag=audience)
+
+async def hot_ack(query: str, filters: Dict[str, Any], item_ids: List[str], audience: Hashable) -> None:
+    """Confirma en la pestaña caliente de la búsqueda los items ya procesados y guardados.
+
+    Solo si la pestaña sigue siendo de `audience`; si se reabrió, no hay nada que confirmar.
+    """
+    if not hot_tabs.enabled or not item_ids:
+        return
+    await hot_tabs.apply(_build_search_url(query, filters),
+                         lambda page: page.evaluate("ids => window.__wallaHot.ack(ids)", item_ids),
+                         tag=audience)
+
+# ===========================
+# Motor HTTP (sin navegador)
+# ===========================
+_BLOCK_MARKERS = ("captcha", "cf-chl", "access denied", "are you a robot")
+
+def _api_headers() -> Dict[str, str]:
+    return {
+        "User-Agent": os.getenv("WALLA_UA", UA_DEFAULT),
+        "Accept": "application/json, text/plain, */*",
+        "Accept-Language": "es-ES,es;q=0.9",
+        "Origin": WALLA_HTML_BASE,
+        "Referer": WALLA_HTML_BASE + "/",
+        "X-DeviceOS": "0",
+    }
+
+async def _http_page(url: str, archive: Optional[recorder.Archive]) -> Tuple[str, List[dict], Optional[str]]:
+    """Una página de la API: (resultado, items, token de la siguiente)."""
+    async with _host_limiter.slot(url):
+        with WALLA_STAGE_SECONDS.time(stage="http"):
+            if archive is not None and recorder.REPLAYING:
+                res = await archive.replay_http(url)
+            else:
+                res = await http_engine.get(url, headers=_api_headers())
+    if archive is not None and recorder.RECORDING:
+        archive.add_http(url, res)
+
+    if res.error:
+        _log(f"[WALLA/HTTP] ERROR: {res.error}")
+        return "error", [], None
+    if res.status in (403, 429, 503) or any(m in res.text[:2000].lower() for m in _BLOCK_MARKERS):
+        _log(f"[WALLA/HTTP] Bloqueado (status {res.status})")
+        return "blocked", [], None
+    if not res.ok:
+        return "error", [], None
+    try:
+        payload = json.loads(res.text)
+    except ValueError:
+        payload = None
+    raw_items = _items_from_api_payload(payload)
+    if raw_items is None:
+        return "blocked", [], None   # HTML u otra cosa inesperada: probablemente un muro
+    return ("ok" if raw_items else "empty"), raw_items, _api_next_page(payload)
+
+async def _fetch_raw_http(query: str, filters: Dict[str, Any], archive: Optional[recorder.Archive] = None,
+                          known: Optional[KnownHook] = None) -> Tuple[str, List[dict]]:
+    """Devuelve (resultado, items) con resultado en ok/empty/blocked/error.
+
+    Sigue el token `next_page` de la API mientras falten items para MAX_ITEMS.
+    """
+    from urllib.parse import urlencode
+    url = _build_api_url(query, filters)
+    _log(f"[WALLA/HTTP] URL: {url}")
+    outcome, raw_items, next_page = await _http_page(url, archive)
+    stream = _KnownStream(known) if known is not None else None
+    seen_ids = {it["id"] for it in raw_items}
+    for _ in range(WALLA_MAX_PAGES):
+        if not next_page or len(raw_items) >= MAX_ITEMS:
+            break
+        if stream is not None and await stream.feed(raw_items):
+            return outcome, _PartialItems(raw_items)
+        more_outcome, more, next_page = await _http_page(
+            f"{WALLA_API_BASE}/api/v3/search?{urlencode({'next_page': next_page})}", archive)
+        fresh = [it for it in more if it["id"] not in seen_ids]
+        if more_outcome != "ok" or not fresh:
+            break   # lo ya descargado sigue valiendo
+        seen_ids.update(it["id"] for it in fresh)
+        raw_items = raw_items + fresh
+    return outcome, raw_items
+
+# ===========================
+# Selección de motor + contadores
+# ===========================
+def _new_engine_counters() -> Dict[str, float]:
+    return {"requests": 0, "ok": 0, "empty": 0, "blocked": 0, "error": 0,
+            "escalations": 0, "latency_ms_total": 0.0}
+
+_engine_stats: Dict[str, Dict[str, float]] = {
+    "http": _new_engine_counters(),
+    "browser": _new_engine_counters(),
+    "hot": _new_engine_counters(),
+}
+
+def _record_engine(engine: str, outcome: str, t0: float) -> None:
+    st = _engine_stats[engine]
+    st["requests"] += 1
+    st[outcome] += 1
+    st["latency_ms_total"] += (time.perf_counter() - t0) * 1000
+    WALLA_FETCHES.inc(engine=engine, outcome=outcome)
+
+def _engine_for(filters: Dict[str, Any]) -> str:
+    """Motor de la búsqueda: "http" o "browser" (por búsqueda o global)."""
+    return "http" if str(filters.get("engine") or WALLA_ENGINE).lower() == "http" else "browser"
+
+async def _fetch_raw(query: str, filters: Dict[str, Any], known: Optional[KnownHook] = None) -> List[dict]:
+    """Descarga items crudos con el motor elegido (por búsqueda o global)."""
+    engine = _engine_for(filters)
+    url = _build_search_url(query, filters)
+
+    # record/replay: un archivo por búsqueda (clave = URL de búsqueda), compartido por ambos motores
+    archive: Optional[recorder.Archive] = None
+    if recorder.REPLAYING:
+        archive = await asyncio.to_thread(recorder.Archive.load, url)
+        if archive is None:
+            print(f"[REPLAY] Sin grabación para {url}")
             return []
+    elif recorder.RECORDING:
+        archive = recorder.Archive(url)
 
+    try:
+        if engine == "http":
+            t0 = time.perf_counter()
+            outcome, raw_items = await _fetch_raw_http(query, filters, archive, known)
+            _record_engine("http", outcome, t0)
+            if outcome == "ok" or not WALLA_ENGINE_ESCALATE:
+                return raw_items
+            _engine_stats["http"]["escalations"] += 1
+            _log(f"[WALLA] Motor HTTP -> {outcome}, escalando a navegador")
+
+        _log(f"[WALLA] URL: {url}")
+        t0 = time.perf_counter()
         try:
-            await _dismiss_cookies(page)
+            raw_items = await _fetch_raw_browser(url, archive, known)
         except Exception:
-            pass
+            _record_engine("browser", "error", t0)
+            raise
+        _record_engine("browser", "ok" if raw_items else "empty", t0)
+        return raw_items
+    finally:
+        if recorder.RECORDING and archive is not None and archive.entries:
+            await asyncio.to_thread(archive.save)
+            _log(f"[RECORD] {len(archive.entries)} respuestas -> {recorder.archive_path(url)}")
 
-        try:
-            await page.wait_for_selector('a[href^="/item/"]', timeout=3000)
-        except PWTimeout:
-            pass
+def engine_stats() -> Dict[str, Dict[str, float]]:
+    out = {}
+    for name, st in _engine_stats.items():
+        st = dict(st)
+        n = st["requests"]
+        st["success_rate"] = round(st["ok"] / n, 3) if n else 0.0
+        st["latency_ms_avg"] = round(st["latency_ms_total"] / n, 1) if n else 0.0
+        out[name] = st
+    return out
 
-        await _light_scroll(page)
-        raw_items = await _extract_cards(page)
-        await browser.close()
+# ===========================
+# Filtros locales
+# ===========================
+class CompiledSearchFilter:
+    """Filtro local de una búsqueda, precompilado una sola vez.
 
-    _log(f"[WALLA] Items crudos: {len(raw_items)}")
-    if not raw_items:
-        print(f"[WALLA/DOM] 0 items (query='{query}')")
-        return []
+    Guarda la query normalizada, sus tokens y una única regex con todas las
+    palabras a omitir. Cada título se normaliza una vez y se reutiliza para
+    coincidencia, omisión y puntuación (misma semántica que
+    _title_matches_query / _contains_omit / _score_title).
+    """
 
-    # --- Aplicar filtros ---
-    strict_mode = filters.get("strict", True)
-    raw_items = [it for it in raw_items if _title_matches_query(it["title"], query, strict=strict_mode)]
-    _log(f"[WALLA] Items tras filtro título ({'estricto' if strict_mode else 'flexible'}): {len(raw_items)}")
+    __slots__ = ("query", "qn", "tokens", "strict", "min", "max", "shipping", "omit_re")
 
-    raw_items = [it for it in raw_items if not it.get("reserved")]
-    _log(f"[WALLA] Tras excluir reservados: {len(raw_items)}")
+    def __init__(self, query: str, filters: Optional[Dict[str, Any]] = None):
+        filters = filters or {}
+        self.query = query
+        self.qn = _norm(query)
+        self.tokens = _tokenize_query(query)
+        self.strict = filters.get("strict", True)
+        self.min = float(filters["min"]) if "min" in filters else None
+        self.max = float(filters["max"]) if "max" in filters else None
+        self.shipping = bool(filters.get("shipping"))
+        # Palabras que se quedan en nada al normalizar ("!!", "-") no omiten nada
+        omit = {w for w in (_norm(w) for w in filters.get("omit") or []) if w}
+        self.omit_re = (re.compile("|".join(re.escape(w) for w in sorted(omit, key=len, reverse=True)))
+                        if omit else None)
 
-    if "min" in filters:
-        raw_items = [it for it in raw_items if it["price"] >= float(filters["min"])]
-        _log(f"[WALLA] Tras min {filters['min']}: {len(raw_items)}")
-    if "max" in filters:
-        raw_items = [it for it in raw_items if it["price"] <= float(filters["max"])]
-        _log(f"[WALLA] Tras max {filters['max']}: {len(raw_items)}")
-    if filters.get("shipping"):
-        raw_items = [it for it in raw_items if it["shipping"]]
-        _log(f"[WALLA] Tras shipping=True: {len(raw_items)}")
+    def title_matches(self, t: str) -> bool:
+        if not self.tokens:
+            return True
+        if self.strict:
+            return all(tok in t for tok in self.tokens)
+        return any(tok in t for tok in self.tokens)
 
-    if filters.get("omit"):
-        omit_words = filters["omit"]
-        raw_items = [it for it in raw_items if not _contains_omit(it["title"], omit_words)]
-        _log(f"[WALLA] Tras omitir palabras {omit_words}: {len(raw_items)}")
+    def has_omit(self, t: str) -> bool:
+        return self.omit_re is not None and self.omit_re.search(t) is not None
 
-    try:
-        raw_items.sort(key=lambda it: _score_title(it["title"], query), reverse=True)
-    except Exception:
-        pass
+    def score(self, t: str) -> int:
+        toks = self.tokens
+        score = 0
+        if toks and all(tok in t for tok in toks): score += 3
+        if self.qn in t: score += 2
+        if toks and t.startswith(toks[0]): score += 1
+        return score
+
+    def accepts(self, it: dict, t: str) -> bool:
+        if not self.title_matches(t) or it.get("reserved"):
+            return False
+        if self.min is not None and it["price"] < self.min:
+            return False
+        if self.max is not None and it["price"] > self.max:
+            return False
+        if self.shipping and not it["shipping"]:
+            return False
+        return not self.has_omit(t)
+
+
+def _title_norm(it: dict) -> str:
+    # Normalización cacheada en el propio item crudo: una vez por item y
+    # compartida entre todas las búsquedas que reparten la misma descarga
+    t = it.get("title_norm")
+    if t is None:
+        t = it["title_norm"] = _norm(it["title"])
+    return t
+
+def filter_items(
+    raw_items: List[dict],
+    query: str,
+    filters: Optional[Dict[str, Any]] = None,
+    compiled: Optional[CompiledSearchFilter] = None,
+) -> List[WItem]:
+    """Aplica los filtros locales de una búsqueda sobre items crudos."""
+    cf = compiled or CompiledSearchFilter(query, filters)
+    scored = []
+    with WALLA_STAGE_SECONDS.time(stage="filter"):
+        for it in raw_items:
+            t = _title_norm(it)
+            if cf.accepts(it, t):
+                scored.append((cf.score(t), it))
+    WALLA_ITEMS.inc(len(scored), kind="filtered")
+    _log(f"[WALLA] Items tras filtros locales ({'estricto' if cf.strict else 'flexible'}): "
+         f"{len(scored)}/{len(raw_items)}")
+    return rank_items(scored)
+
+def rank_items(scored: List[Tuple[int, dict]]) -> List[WItem]:
+    """Ordena (puntuación, item crudo) y devuelve hasta MAX_ITEMS WItem."""
+    # sort estable: a igual puntuación se conserva el orden de la página
+    scored.sort(key=lambda p: p[0], reverse=True)
 
     items = [WItem(
         id=it["id"],
@@ -337,11 +1099,64 @@ async def search_items(query: str, filters: Optional[Dict[str, Any]] = None) ->
         reserved=it.get("reserved", False),
         sold=it.get("sold", False),
         shipping=it.get("shipping", False),
-    ) for it in raw_items[:MAX_ITEMS]]
+    ) for _, it in scored[:MAX_ITEMS]]
 
     _log(f"[WALLA] Devolviendo {len(items)} items")
     return items
 
+# ===========================
+# API pública
+# ===========================
+async def search_items(query: str, filters: Optional[Dict[str, Any]] = None) -> List[WItem]:
+    filters = filters or {}
+    raw_items = await fetch_raw_items(query, filters)
+    if not raw_items:
+        return []
+    return filter_items(raw_items, query, filters)
+
+async def fetch_raw_items(query: str, filters: Optional[Dict[str, Any]] = None,
+                          known: Optional[KnownHook] = None, audience: Optional[Hashable] = None) -> List[dict]:
+    """Descarga los items crudos de una búsqueda, sin filtros locales.
+
+    Permite compartir una misma descarga entre varias búsquedas (ver scheduler).
+    Con `known` (modo incremental) se devuelven solo los items hasta la primera
+    racha de WALLA_STOP_AFTER_KNOWN ya conocidos. Con `audience` (quién recibe
+    la descarga) y motor navegador se puede usar una pestaña caliente; quien la
+    pasa se compromete a confirmar con `hot_ack` los items ya guardados.
+    """
+    filters = filters or {}
+    url = _build_search_url(query, filters)
+    with WALLA_STAGE_SECONDS.time(stage="fetch_total"):
+        raw_items = None
+        if (audience is not None and hot_tabs.enabled and _engine_for(filters) == "browser"
+                and not (recorder.RECORDING or recorder.REPLAYING)):
+            # La pestaña caliente da solo lo no confirmado en ella: no se comparte ni se cachea
+            t0 = time.perf_counter()
+            raw_items = await _hot_fetch(url, _build_api_url(query, filters), audience)
+            if raw_items is not None:
+                _record_engine("hot", "ok", t0)   # sin novedades también es una comprobación buena
+        if raw_items is None:
+            # Misma URL en pocos segundos (reinicio, búsquedas duplicadas): una sola descarga
+            raw_items = await result_cache.get_or_fetch(url, lambda: _fetch_raw(query, filters, known))
+        raw_items = await trim_known(raw_items, known)
+    WALLA_ITEMS.inc(len(raw_items), kind="raw")
+    _log(f"[WALLA] Items crudos: {len(raw_items)}")
+    if not raw_items:
+        print(f"[WALLA] 0 items (query='{query}')")
+    return raw_items
+
+def extract_stats() -> Dict[str, int]:
+    return dict(_extract_stats)
+
+def cache_stats() -> Dict[str, float]:
+    return result_cache.snapshot()
+
+def block_stats() -> Dict[str, Any]:
+    return request_filter.snapshot()
+
+def hot_stats() -> Dict[str, Any]:
+    return hot_tabs.stats()
+
 # ===========================
 # Fallback FAKE
 # ===========================
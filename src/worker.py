@@ -0,0 +1,100 @@
+# worker.py
+# Worker de scraping para el modo split (SCRAPER_MODE=split en el bot).
+# Se pueden lanzar varios, en la misma máquina o en otras que vean la misma BD:
+#
+#   python src/worker.py
+import os
+import socket
+import signal
+import asyncio
+from typing import Optional
+
+from db import init_db, run, job_claim, job_heartbeat, job_finish, job_release
+from wallapop import fetch_raw_items, start_browser_pool, stop_browser_pool
+from metrics import start_metrics_server, ERRORS
+
+# ===== Config =====
+WORKER_ID            = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+WORKER_CONCURRENCY   = int(os.getenv("WORKER_CONCURRENCY", "2"))     # trabajos a la vez por proceso
+WORKER_POLL_SEC      = float(os.getenv("WORKER_POLL_SEC", "1"))
+WORKER_HEARTBEAT_SEC = float(os.getenv("WORKER_HEARTBEAT_SEC", "10"))  # < JOB_STALE_SEC del bot
+
+
+async def _heartbeat(job_id: int, lost: asyncio.Event) -> None:
+    while True:
+        await asyncio.sleep(WORKER_HEARTBEAT_SEC)
+        try:
+            if not await run(job_heartbeat, job_id, WORKER_ID):
+                lost.set()   # reclamado por el scheduler: otro worker lo repetirá
+                return
+        except Exception as e:
+            print(f"[WORKER] Error en latido de {job_id}:", e)
+
+
+async def _run_job(job_id: int, query: str, filters: dict) -> None:
+    lost = asyncio.Event()
+    hb = asyncio.create_task(_heartbeat(job_id, lost))
+    try:
+        items = await fetch_raw_items(query, filters)
+    except asyncio.CancelledError:
+        await run(job_release, job_id, WORKER_ID)
+        raise
+    except Exception as e:
+        ERRORS.inc(where="worker_job")
+        await run(job_finish, job_id, WORKER_ID, error=str(e) or type(e).__name__)
+        print(f"[WORKER] Trabajo {job_id} '{query}' falló:", e)
+        return
+    finally:
+        hb.cancel()
+    if lost.is_set() or not await run(job_finish, job_id, WORKER_ID, result=items):
+        print(f"[WORKER] Trabajo {job_id} reclamado por otro worker; resultado descartado")
+        return
+    print(f"[WORKER] Trabajo {job_id} '{query}': {len(items)} items")
+
+
+async def _slot(stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        try:
+            job = await run(job_claim, WORKER_ID)
+        except Exception as e:
+            print("[WORKER] Error reservando trabajo:", e)
+            job = None
+        if job is None:
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=WORKER_POLL_SEC)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        await _run_job(*job)
+
+
+async def main(stop: Optional[asyncio.Event] = None) -> None:
+    stop = stop or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass   # Windows: Ctrl+C llega como KeyboardInterrupt
+
+    await run(init_db)
+    start_metrics_server(int(os.getenv("WORKER_METRICS_PORT", "0")))   # un puerto distinto por worker
+    await start_browser_pool()
+    print(f"🛠️ Worker {WORKER_ID} arrancado (concurrencia {WORKER_CONCURRENCY})")
+    slots = [asyncio.create_task(_slot(stop)) for _ in range(max(1, WORKER_CONCURRENCY))]
+    try:
+        await stop.wait()
+    finally:
+        # Los trabajos a medias vuelven a la cola (job_release) al cancelar
+        for t in slots:
+            t.cancel()
+        await asyncio.gather(*slots, return_exceptions=True)
+        await stop_browser_pool()
+        print(f"🛑 Worker {WORKER_ID} parado")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
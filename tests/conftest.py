@@ -0,0 +1,15 @@
+# conftest.py
+# Los módulos viven en src/ y se importan entre sí sin paquete (from db import ...)
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "bench", "fixtures")
+
+# BD de pruebas fuera del árbol; se fija antes de importar db
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="walla-tests-"), "bot.db"))
+os.environ.setdefault("WALLA_HOST_MIN_GAP_MS", "0")
+
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
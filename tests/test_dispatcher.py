@@ -0,0 +1,99 @@
+# test_dispatcher.py
+# Dispatcher de Telegram contra un bot falso: ritmo de los token buckets,
+# orden por chat y reintentos (RetryAfter, errores transitorios y definitivos).
+import time
+import asyncio
+
+from telegram.error import Forbidden, NetworkError, RetryAfter
+
+from dispatcher import Dispatcher
+
+
+class FakeBot:
+    """Registra (chat_id, texto, instante) y lanza los errores programados por texto."""
+
+    def __init__(self, errors=None):
+        self.sent = []
+        self.errors = {k: list(v) for k, v in (errors or {}).items()}
+
+    async def send_message(self, chat_id, text, **kwargs):
+        pending = self.errors.get(text)
+        if pending:
+            raise pending.pop(0)
+        self.sent.append((chat_id, text, time.monotonic()))
+
+
+def _run(bot, messages, **kw):
+    """Envía `messages` [(chat_id, texto)] y espera a todos. Devuelve (resultados, stats, inicio)."""
+    async def main():
+        d = Dispatcher(bot, **kw)
+        await d.start()
+        t0 = time.monotonic()
+        try:
+            futs = [d.submit(chat_id, text) for chat_id, text in messages]
+            results = await asyncio.wait_for(asyncio.gather(*futs, return_exceptions=True), 10)
+        finally:
+            await d.stop()
+        return results, d.stats(), t0
+
+    return asyncio.run(main())
+
+
+def test_chat_bucket_paces_and_keeps_order():
+    bot = FakeBot()
+    msgs = [(1, f"m{i}") for i in range(6)]
+
+    results, stats, t0 = _run(bot, msgs, workers=4, global_rate=1000, chat_rate=20, chat_burst=2)
+
+    assert results == [True] * 6
+    assert [text for _, text, _ in bot.sent] == [text for _, text in msgs]
+    times = [t - t0 for _, _, t in bot.sent]
+    assert times[1] < 0.04                      # la ráfaga sale de golpe
+    assert times[-1] >= (6 - 2) / 20 * 0.9      # el resto, a chat_rate
+    assert stats["sent"] == 6 and stats["queue_depth"] == 0
+
+
+def test_global_bucket_caps_all_chats():
+    bot = FakeBot()
+    msgs = [(chat, "hola") for chat in range(30)]
+
+    results, stats, t0 = _run(bot, msgs, workers=8, global_rate=20, chat_rate=100, chat_burst=5)
+
+    assert results == [True] * 30
+    assert len({chat for chat, _, _ in bot.sent}) == 30
+    assert max(t for _, _, t in bot.sent) - t0 >= (30 - 20) / 20 * 0.9
+
+
+def test_retry_after_pauses_only_that_chat():
+    bot = FakeBot(errors={"a1": [RetryAfter(1)]})
+    msgs = [(1, "a1"), (1, "a2"), (2, "b1"), (2, "b2")]
+
+    results, stats, t0 = _run(bot, msgs, workers=2, global_rate=1000, chat_rate=100, chat_burst=5)
+
+    assert results == [True] * 4
+    by_chat = {chat: [(text, t - t0) for c, text, t in bot.sent if c == chat] for chat in (1, 2)}
+    assert [text for text, _ in by_chat[1]] == ["a1", "a2"]    # el reintento no se adelanta al siguiente
+    assert by_chat[1][0][1] >= 0.9                            # respeta el retry_after
+    assert all(t < 0.5 for _, t in by_chat[2])                # el otro chat no espera
+    assert stats["retry_after"] == 1 and stats["retries"] == 1 and stats["sent"] == 4
+
+
+def test_transient_error_retried_then_permanent_fails():
+    bot = FakeBot(errors={"red": [NetworkError("timeout")], "bloqueado": [Forbidden("bot was blocked")]})
+    msgs = [(1, "red"), (2, "bloqueado"), (2, "sigue")]
+
+    results, stats, _ = _run(bot, msgs, workers=2, global_rate=1000, chat_rate=100, chat_burst=5)
+
+    assert results[0] is True and results[2] is True
+    assert isinstance(results[1], Forbidden)      # sin reintentos
+    assert sorted(text for _, text, _ in bot.sent) == ["red", "sigue"]
+    assert stats["retries"] == 1 and stats["failed"] == 1 and stats["sent"] == 2
+
+
+def test_max_retries_exhausted():
+    bot = FakeBot(errors={"x": [NetworkError("caído")]})
+
+    results, stats, _ = _run(bot, [(1, "x")], workers=1, max_retries=0)
+
+    assert isinstance(results[0], NetworkError)
+    assert stats["failed"] == 1 and stats["retries"] == 0 and bot.sent == []
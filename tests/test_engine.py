@@ -0,0 +1,136 @@
+# test_engine.py
+# Motor HTTP contra el stub local (bench/stub_http_engine.py) y escalado al
+# navegador cuando la respuesta viene vacía, bloqueada o con captcha.
+import os
+import json
+import asyncio
+import threading
+
+import pytest
+
+from conftest import FIXTURES
+from stub_http_engine import _make_server
+import wallapop
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    """Arranca el stub en el modo pedido y apunta el motor HTTP a él."""
+    servers = []
+
+    def start(mode):
+        with open(os.path.join(FIXTURES, "api_search.json"), "rb") as f:
+            server = _make_server(mode, f.read())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        monkeypatch.setattr(wallapop, "WALLA_API_BASE", f"http://127.0.0.1:{server.server_address[1]}")
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def browser_calls(monkeypatch):
+    """Sustituye el motor navegador; registra las URLs que le llegan."""
+    calls = []
+
+    async def fake_browser(url, archive=None, known=None):
+        calls.append(url)
+        return [{"id": "del-navegador", "title": "x", "price": 1.0}]
+
+    monkeypatch.setattr(wallapop, "_fetch_raw_browser", fake_browser)
+    monkeypatch.setattr(wallapop, "_engine_stats", {k: wallapop._new_engine_counters() for k in wallapop._engine_stats})
+    monkeypatch.setattr(wallapop, "WALLA_ENGINE_ESCALATE", True)
+    return calls
+
+
+def _fetch(filters=None):
+    return asyncio.run(wallapop._fetch_raw("iphone 13", {"engine": "http", **(filters or {})}))
+
+
+def test_http_ok_no_escalation(stub, browser_calls):
+    stub("ok")
+    with open(os.path.join(FIXTURES, "api_search.json"), encoding="utf-8") as f:
+        expected = wallapop._items_from_api_payload(json.load(f))
+
+    assert _fetch() == expected
+    assert browser_calls == []
+    st = wallapop.engine_stats()
+    assert st["http"]["ok"] == 1 and st["http"]["escalations"] == 0
+    assert st["browser"]["requests"] == 0
+
+
+@pytest.mark.parametrize("mode, outcome", [("empty", "empty"), ("blocked", "blocked"), ("captcha", "blocked")])
+def test_http_escalates_to_browser(stub, browser_calls, mode, outcome):
+    stub(mode)
+
+    items = _fetch()
+
+    assert [it["id"] for it in items] == ["del-navegador"]
+    assert browser_calls == [wallapop._build_search_url("iphone 13", {"engine": "http"})]
+    st = wallapop.engine_stats()
+    assert st["http"][outcome] == 1 and st["http"]["escalations"] == 1
+    assert st["browser"]["ok"] == 1
+
+
+def test_http_without_escalation(stub, browser_calls, monkeypatch):
+    stub("blocked")
+    monkeypatch.setattr(wallapop, "WALLA_ENGINE_ESCALATE", False)
+
+    assert _fetch() == []
+    assert browser_calls == []
+    assert wallapop.engine_stats()["http"]["escalations"] == 0
+
+
+def test_engine_per_search(stub, browser_calls):
+    stub("ok")
+
+    assert [it["id"] for it in _fetch({"engine": "browser"})] == ["del-navegador"]
+    st = wallapop.engine_stats()
+    assert st["http"]["requests"] == 0 and st["browser"]["requests"] == 1
+
+
+# ===== Pestañas calientes y caché de resultados =====
+@pytest.fixture
+def hot(monkeypatch, browser_calls):
+    """Pestañas calientes activas con un _hot_fetch falso y caché nueva."""
+    from hot_tabs import HotTabs
+    from result_cache import ResultCache
+
+    calls = []
+
+    async def fake_hot_fetch(url, api_url, audience):
+        calls.append(url)
+        return wallapop._PartialItems([{"id": "de-la-pestaña", "title": "x", "price": 1.0}])
+
+    monkeypatch.setattr(wallapop, "hot_tabs", HotTabs(lambda: None, max_tabs=1))
+    monkeypatch.setattr(wallapop, "_hot_fetch", fake_hot_fetch)
+    monkeypatch.setattr(wallapop, "result_cache", ResultCache(ttl_sec=60, disk_path=""))
+    return calls
+
+
+def _fetch_twice(filters):
+    async def main():
+        audience = frozenset({(1, 0)})
+        return [await wallapop.fetch_raw_items("iphone 13", filters, audience=audience) for _ in range(2)]
+    return asyncio.run(main())
+
+
+def test_hot_tabs_keep_cache_for_http(stub, hot):
+    stub("ok")
+
+    first, second = _fetch_twice({"engine": "http"})
+
+    assert hot == [] and first == second
+    assert wallapop.result_cache.stats["hits"] == 1 and wallapop.engine_stats()["http"]["requests"] == 1
+
+
+def test_hot_tab_bypasses_cache_for_browser(hot, browser_calls):
+    first, second = _fetch_twice({"engine": "browser"})
+
+    assert [it["id"] for it in first + second] == ["de-la-pestaña"] * 2
+    assert len(hot) == 2 and browser_calls == []
+    assert wallapop.result_cache.stats["misses"] == 0 and wallapop.engine_stats()["hot"]["ok"] == 2
@@ -0,0 +1,115 @@
+# test_extract.py
+# Extracción de items: payload JSON de la API de búsqueda (grabado en
+# bench/fixtures) y fallback por tarjetas del DOM.
+import os
+import json
+import asyncio
+
+import pytest
+
+from conftest import FIXTURES
+from wallapop import (
+    WALLA_HTML_BASE, _api_next_page, _extract_cards, _extract_cards_dom,
+    _items_from_api_payload, _parse_cards,
+)
+
+
+@pytest.fixture
+def payload():
+    with open(os.path.join(FIXTURES, "api_search.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+# ===== Payload de la API =====
+def test_api_payload_fixture(payload):
+    objs = payload["data"]["section"]["payload"]["items"]
+    items = _items_from_api_payload(payload)
+
+    assert [it["id"] for it in items] == [o["web_slug"] for o in objs]
+    first = items[0]
+    assert first == {
+        "id": "funda-usado-caja-funda-1000000000",
+        "title": "Funda usado caja funda",
+        "price": 230.0,
+        "url": f"{WALLA_HTML_BASE}/item/funda-usado-caja-funda-1000000000",
+        "seller_id": "u965eda",
+        "shipping": False,
+        "reserved": True,
+        "sold": False,
+    }
+    assert items[1]["shipping"] is True and items[1]["reserved"] is False
+    assert sum(it["reserved"] for it in items) == sum(o["reserved"]["flag"] for o in objs)
+    assert sum(it["shipping"] for it in items) == sum(o["shipping"]["user_allows_shipping"] for o in objs)
+    assert _api_next_page(payload) == "fixture-next-page-token"
+
+
+def test_api_payload_other_shapes():
+    objs = [
+        {"content": {"id": "1", "web_slug": "movil-1", "title": " Móvil ", "price": "35,50 €",
+                     "flags": {"sold": True}}},
+        {"content": {"id": "1", "web_slug": "movil-1", "title": "Repetido"}},
+        {"id": 7, "title": None, "price": {"amount": "12"}, "user": {"id": 99}},
+        "basura",
+        {"title": "Sin id"},
+    ]
+    items = _items_from_api_payload({"search_objects": objs})
+
+    assert [it["id"] for it in items] == ["movil-1", "7"]
+    assert items[0]["title"] == "Móvil" and items[0]["price"] == 35.5 and items[0]["sold"] is True
+    assert items[1]["title"] == "Sin título" and items[1]["price"] == 12.0
+    assert items[1]["seller_id"] == "99" and items[1]["url"].endswith("/item/7")
+    assert _api_next_page({"search_objects": objs}) is None
+
+
+def test_api_payload_unknown_shape():
+    assert _items_from_api_payload({"data": {"section": {}}}) is None
+    assert _items_from_api_payload([]) is None
+    assert _items_from_api_payload({"items": []}) == []
+
+
+# ===== Fallback DOM =====
+def _card(href, **kw):
+    card = {"href": href, "title": None, "aria": None, "strong": None, "groups": [], "block": "", "badges": []}
+    card.update(kw)
+    return card
+
+
+def test_parse_cards():
+    cards = [
+        _card("/item/bici-1", title="Bici ", strong="120 €", badges=["shippingAvailable"]),
+        _card("/item/bici-1?ref=x", title="Repetida", strong="1 €"),
+        _card("/search?keywords=bici", title="No es un item"),
+        _card("/item/casco-2", aria="Casco", groups=[["Envío gratis"], ["45,90 €"]], badges=["reserved"]),
+        _card("/item/guantes-3", block="Guantes talla M\n15 €"),
+    ]
+    items = _parse_cards(cards)
+
+    assert [it["id"] for it in items] == ["bici-1", "casco-2", "guantes-3"]
+    assert items[0]["title"] == "Bici" and items[0]["price"] == 120.0
+    assert items[0]["shipping"] is True and items[0]["reserved"] is False
+    assert items[0]["url"] == f"{WALLA_HTML_BASE}/item/bici-1"
+    assert items[1]["title"] == "Casco" and items[1]["price"] == 45.9 and items[1]["reserved"] is True
+    assert items[2]["title"] == "Sin título" and items[2]["price"] == 15.0
+
+
+def test_extract_cards_fixture_page():
+    """Ruta evaluate y ruta DOM dan lo mismo sobre el HTML grabado (requiere Chromium)."""
+    pw = pytest.importorskip("playwright.async_api")
+
+    async def extract():
+        async with pw.async_playwright() as p:
+            try:
+                browser = await p.chromium.launch(headless=True)
+            except Exception as e:
+                pytest.skip(f"Chromium no disponible: {e}")
+            try:
+                page = await browser.new_page()
+                with open(os.path.join(FIXTURES, "search_page.html"), encoding="utf-8") as f:
+                    await page.set_content(f.read())
+                return await _extract_cards(page), await _extract_cards_dom(page)
+            finally:
+                await browser.close()
+
+    fast, dom = asyncio.run(extract())
+    assert fast and fast == dom
+    assert len({it["id"] for it in fast}) == len(fast)
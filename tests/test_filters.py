@@ -0,0 +1,36 @@
+# test_filters.py
+# Filtro compilado frente a las funciones sueltas de referencia.
+from wallapop import CompiledSearchFilter, _contains_omit, _title_norm, filter_items
+
+ITEMS = [
+    {"id": "1", "title": "iPhone 13 azul", "price": 400.0, "shipping": True, "reserved": False},
+    {"id": "2", "title": "iPhone 13 pantalla rota", "price": 90.0, "shipping": False, "reserved": False},
+    {"id": "3", "title": "Funda iPhone 13", "price": 8.0, "shipping": True, "reserved": False},
+    {"id": "4", "title": "iPhone 13 reservado", "price": 350.0, "shipping": True, "reserved": True},
+]
+
+
+def _ids(filters):
+    raw = [dict(it, url=f"https://es.wallapop.com/item/{it['id']}") for it in ITEMS]
+    return [it.id for it in filter_items(raw, "iphone 13", filters)]
+
+
+def test_omit_and_price():
+    assert _ids({}) == ["1", "2", "3"]
+    assert _ids({"omit": ["ROTA", "fúnda"]}) == ["1"]
+    assert _ids({"min": 50, "shipping": True}) == ["1"]
+
+
+def test_omit_words_empty_after_norm_are_ignored():
+    # Antes "" in título era siempre cierto y la búsqueda no devolvía nada
+    assert _ids({"omit": ["!!", "-"]}) == ["1", "2", "3"]
+    assert _ids({"omit": ["!!", "rota"]}) == ["1", "3"]
+    assert not _contains_omit("iPhone 13 azul", ["!!"])
+
+
+def test_compiled_matches_reference_omit():
+    cases = [["rota"], ["!!"], ["13 az", "-"], ["funda", "pantalla"], []]
+    for omit in cases:
+        cf = CompiledSearchFilter("iphone 13", {"omit": omit})
+        for it in ITEMS:
+            assert cf.has_omit(_title_norm(dict(it))) == _contains_omit(it["title"], omit), (omit, it["title"])
@@ -0,0 +1,63 @@
+# test_planner.py
+# Plan de ejecución: las búsquedas reactivadas o editadas tocan ya, no cuando
+# las dejó el backoff guardado.
+from types import SimpleNamespace
+
+import db
+from planner import DuePlanner
+
+
+def _planner():
+    return DuePlanner(base=10, min_interval=10, max_interval=600)
+
+
+def test_restart_keeps_persisted_plan():
+    p = _planner()
+    p.sync([SimpleNamespace(id=1, version=1)], {1: (600.0, 1500.0)}, now=1000)
+
+    assert p.pop_due(now=1000) == []
+    assert p.pop_due(now=1500) == [1]
+
+
+def test_reset_plan_runs_now_even_if_in_memory():
+    p = _planner()
+    specs = [SimpleNamespace(id=1, version=1)]
+    p.sync(specs, {1: (600.0, 1500.0)}, now=1000)
+
+    p.sync(specs, {1: (None, None)}, now=1001)   # reactivada entre dos recargas
+
+    assert p.pop_due(now=1001) == [1]
+    assert p.stats(now=1001)[1]["interval_sec"] == 10
+
+
+def test_unsaved_plan_is_not_reset():
+    p = _planner()
+    specs = [SimpleNamespace(id=1, version=1)]
+    p.sync(specs, {}, now=0)
+    p.pop_due(now=0)
+    p.record(1, 0, now=0)                    # aún sin persistir (dirty)
+
+    p.sync(specs, {1: (None, None)}, now=1)
+
+    assert p.pop_due(now=1) == []
+
+
+def test_toggle_and_edit_reset_persisted_plan():
+    db.init_db()
+    ss = db.save_search(77, "ana", "bici", {})
+    plan = lambda: {r[0]: (r[5], r[6]) for r in db.active_search_rows()}.get(ss.id)
+
+    db.save_poll_state([(ss.id, 600.0, 9e9)])
+    assert plan() == (600.0, 9e9)
+    db.toggle_search(ss.id, 77)
+    db.toggle_search(ss.id, 77)
+    assert plan() == (None, None)
+
+    db.save_poll_state([(ss.id, 600.0, 9e9)])
+    db.set_user_active(77, "ana", False)
+    db.set_user_active(77, "ana", True)
+    assert plan() == (None, None)
+
+    db.save_poll_state([(ss.id, 600.0, 9e9)])
+    db.save_search(77, "ana", "bici roja", {}, search_id=ss.id)
+    assert plan() == (None, None)
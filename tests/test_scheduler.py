@@ -0,0 +1,53 @@
+# test_scheduler.py
+# Cierre de ciclo: las descargas se recuerdan (incremental) y se confirman en
+# la pestaña caliente solo si el outbox llegó a guardarse.
+import asyncio
+
+import pytest
+
+import scheduler
+
+
+@pytest.fixture
+def cycle(monkeypatch):
+    acked = []
+
+    async def fake_ack(query, filters, item_ids, audience):
+        acked.append(item_ids)
+
+    monkeypatch.setattr(scheduler, "hot_ack", fake_ack)
+    monkeypatch.setattr(scheduler, "_download_ids", type(scheduler._download_ids)())
+    for name in ("_outbox_batch", "_hot_acks", "_downloads"):
+        monkeypatch.setattr(scheduler, name, [])
+
+    spec = scheduler.SearchSpec(id=1, user_id=10, version=0, query="bici", filters={}, compiled=None)
+    raw_items = [{"id": "b2"}, {"id": "b1"}]
+    scheduler._outbox_batch.append({"search_id": 1, "item_id": "b2"})
+    scheduler._downloads.append((("k",), [spec], raw_items))
+    scheduler._hot_acks.append(("bici", {}, ["b2", "b1"], frozenset({(1, 0)})))
+    return acked
+
+
+def test_flush_failure_forgets_nothing(cycle, monkeypatch):
+    async def boom(*args, **kwargs):
+        raise RuntimeError("bd caída")
+
+    monkeypatch.setattr(scheduler, "run", boom)
+    with pytest.raises(RuntimeError):
+        asyncio.run(scheduler._flush_outbox_batch())
+
+    assert cycle == []
+    assert ("k",) not in scheduler._download_ids   # la próxima descarga incremental no corta en ellos
+    assert scheduler._downloads == [] and scheduler._hot_acks == []
+
+
+def test_flush_success_remembers_and_acks(cycle, monkeypatch):
+    async def fake_run(fn, *args, **kwargs):
+        return None
+
+    monkeypatch.setattr(scheduler, "run", fake_run)
+    assert asyncio.run(scheduler._flush_outbox_batch()) == 1
+
+    assert cycle == [["b2", "b1"]]
+    members, ids = scheduler._download_ids[("k",)]
+    assert members == {1} and list(ids) == ["b1", "b2"]